@@ -6,11 +6,10 @@ import streamlit as st
 from dotenv import load_dotenv
 load_dotenv()
 
-from src.config import FAISS_INDEX_PATH, CHUNKS_PATH, TOP_K, EMBED_MODEL_NAME, GROQ_MODEL
-from src.vector_store import load_vector_db
-from src.embedder import get_embedder
-from src.groq_llm import get_groq_client
-from src.rag_chain import rag_query
+from src.startup import BackgroundLoader
+from src.config import TOP_K, GROQ_MODEL
+from src.tracing import stage_percentiles
+from src.llm_policy import default_policy
 
 # Page config
 st.set_page_config(page_title="IBA Chatbot", layout="centered")
@@ -18,17 +17,32 @@ st.set_page_config(page_title="IBA Chatbot", layout="centered")
 st.title("University AI Chatbot")
 st.caption("Ask questions about IBA, extracted largely from the Admissions Policy and Schedule.")
 
-# Load resources once (cached)
+# Start loading resources once per process (cached), in the background, so the page shows up right away.
+# The index, embedder, Groq client, query cache and persisted answer cache are shared by every session.
+# When build_index.py publishes a new index version, the loader swaps it in without a restart.
 @st.cache_resource
-def load_rag_components():
-    index, bm25, chunks = load_vector_db(FAISS_INDEX_PATH, CHUNKS_PATH)
-    embedder = get_embedder(EMBED_MODEL_NAME)
-    groq_client = get_groq_client()
-    return index, bm25, chunks, embedder, groq_client
+def get_loader():
+    return BackgroundLoader()
 
-# Load components
-with st.spinner("Loading AI system..."):
-    index, bm25, chunks, embedder, groq_client = load_rag_components()
+def retry_loading():
+    """Forgets a failed loader, so the next run starts loading again (e.g. after running build_index.py)."""
+    get_loader.clear()
+
+loader = get_loader()
+
+# Optional scope: only search some collections / documents (applied inside the FAISS and BM25 searches)
+filters = {}
+collections = []
+if loader.ready and loader.error is None:
+    metadata = loader.components["metadata"]
+    with st.sidebar.expander("Search only in"):
+        if len(loader.components["shards"]) > 1:
+            collections = st.multiselect("Collections", list(loader.components["shards"]))
+        for field, label in (("doc_type", "Document types"), ("doc_name", "Documents"), ("tags", "Tags")):
+            if metadata.values(field):
+                chosen = st.multiselect(label, metadata.values(field))
+                if chosen:
+                    filters[field] = chosen
 
 # Chat interface
 if "messages" not in st.session_state:
@@ -46,27 +60,79 @@ if prompt := st.chat_input("Ask about admissions, deadlines, or fees..."):
     with st.chat_message("user"):
         st.write(prompt)
     
-    # Generate response
+    # Generate response (streamed, so the answer appears as it is generated)
     with st.chat_message("assistant"):
-        with st.spinner("Thinking..."):
-            answer, sources = rag_query(
+        # Questions asked during warm-up wait for it instead of failing
+        with st.spinner("Loading AI system..."):
+            try:
+                components = loader.wait()
+            except Exception as e:
+                retry_loading() # the next question tries again
+                st.error(f"Could not load the index: {e}. Did you run build_index.py?")
+                st.stop()
+        # Imported here, not at the top: it pulls in the retriever, embedder and FAISS,
+        # which would delay showing the page
+        from src.rag_chain import rag_query_stream
+        with st.spinner("Searching documents..."):
+            tokens, sources, timings = rag_query_stream(
                 question=prompt,
-                embedder=embedder,
-                index=index,
-                chunks=chunks,
+                embedder=components["embedder"],
+                index=components["index"],
+                chunks=components["chunks"],
                 top_k=TOP_K,
-                groq_client=groq_client,
+                groq_client=components["groq_client"],
                 groq_model=GROQ_MODEL,
-                bm25=bm25
+                bm25=components["bm25"],
+                query_cache=components["query_cache"],
+                answer_cache=components["answer_cache"],
+                filters=filters,
+                metadata=components["metadata"],
+                shards=components["shards"],
+                collections=collections
             )
-            st.write(answer)
-            
-            with st.expander("View Sources"):
-                for chunk in sources:
-                    source = chunk.get("source", chunk["doc_name"])
-                    st.markdown(f"- **{source}**")
-                    st.caption(chunk["text"][:200] + "...")
-                    st.divider()
+        answer = st.write_stream(tokens)
+        st.caption(f"First token after {timings.get('first_token_s', 0):.2f}s, "
+                   f"done after {timings.get('total_s', 0):.2f}s")
+
+        with st.expander("View Sources"):
+            for chunk in sources:
+                source = chunk.get("source", chunk["doc_name"])
+                page = f", page {chunk['page']}" if "page" in chunk else ""
+                st.markdown(f"- **{source}**{page}")
+                if chunk.get("also_in"):
+                    st.caption("Also in: " + ", ".join(copy.get("source", copy["doc_name"]) for copy in chunk["also_in"]))
+                st.caption(chunk["text"][:200] + "...")
+                st.divider()
+
+        trace = timings.get("trace")
+        if trace is not None:
+            with st.expander("Debug: time per stage"):
+                st.table([{"stage": s["name"], "ms": s["duration_ms"]} for s in trace.spans])
+                if trace.tokens:
+                    st.caption(f"Tokens: {trace.tokens.get('prompt_tokens', '?')} prompt, "
+                               f"{trace.tokens.get('completion_tokens', '?')} completion")
+                st.caption(f"Trace {trace.trace_id}, total {trace.total_ms} ms")
     
     # Add assistant message to history
     st.session_state.messages.append({"role": "assistant", "content": answer})
+
+if loader.ready and loader.error is None:
+    cache_stats = loader.components["query_cache"].stats()
+    st.sidebar.caption(f"Query cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses")
+    st.sidebar.caption(f"Index version: {loader.components['index_version'] or 'unversioned'}")
+elif loader.error is not None:
+    st.sidebar.error(f"Loading failed: {loader.error}. Did you run build_index.py?")
+    st.sidebar.button("Retry loading", on_click=retry_loading)
+else:
+    st.sidebar.caption("Loading the index and models in the background...")
+with st.sidebar.expander("Startup timings"):
+    st.code(loader.report())
+stages = stage_percentiles()
+if stages:
+    st.sidebar.caption("Latency per stage (ms, recent questions)")
+    st.sidebar.table([{"stage": name, "p50": round(s["p50_ms"], 1), "p95": round(s["p95_ms"], 1)}
+                      for name, s in stages.items()])
+llm_calls = default_policy().stats.snapshot()
+if llm_calls:
+    with st.sidebar.expander("Groq calls"):
+        st.table([{"outcome": name, "count": count} for name, count in llm_calls.items()])
@@ -0,0 +1,194 @@
+"""
+Answers a file of questions in bulk (e.g. the FAQ list before admission season).
+
+    python batch_answer.py questions.jsonl answers.jsonl
+    python batch_answer.py questions.csv answers.jsonl --rpm 30 --tpm 6000 --concurrency 8
+
+Input: JSONL with {"question": ..., "id": ...} per line, or CSV with a "question" column
+(and optionally "id"). Without ids, questions are numbered by their position in the file.
+
+Questions are embedded and searched in FAISS in large blocks, BM25 runs per question, and the
+Groq calls run concurrently under a requests-per-minute and tokens-per-minute limit.
+Each answer is appended to the output JSONL as soon as it arrives (in completion order), so an
+interrupted run can simply be started again: questions already answered in the output are skipped.
+"""
+
+import argparse
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.config import (
+    TOP_K, GROQ_MODEL, EMBED_BATCH_SIZE, FAISS_FETCH_MULTIPLIER, BATCH_RPM, BATCH_TPM, BATCH_CONCURRENCY,
+    BATCH_BLOCK_SIZE, BATCH_EXPECTED_COMPLETION_TOKENS
+)
+from src.startup import load_components
+from src.embedder import embed_texts
+from src.vector_store import prepare_query
+from src.retriever import retrieve_top_k
+from src.rag_chain import build_context, NO_RESULTS_ANSWER
+from src.context_packer import estimate_tokens
+from src.groq_llm import groq_answer, build_messages
+from src.rate_limiter import RateLimiter
+from src.tracing import start_trace, activate, finish_trace
+from src.llm_policy import default_policy
+
+
+def read_questions(path: str) -> list:
+    """Returns [{"id", "question"}] from a .jsonl or .csv file."""
+    if path.lower().endswith(".csv"):
+        with open(path, newline="", encoding="utf-8") as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, encoding="utf-8") as f:
+            rows = [json.loads(line) for line in f if line.strip()]
+
+    questions = []
+    for n, row in enumerate(rows, start=1):
+        question = (row.get("question") or "").strip()
+        if question:
+            questions.append({"id": str(row["id"] if row.get("id") is not None else n), "question": question})
+    return questions
+
+
+def read_done_ids(output_path: str) -> set:
+    """
+    Ids already answered in an output file from an earlier run (errors are retried).
+    A line cut off by a crash is ignored, and a newline is added so new lines start clean.
+    """
+    done = set()
+    if not os.path.exists(output_path):
+        return done
+    with open(output_path, "rb") as f:
+        data = f.read()
+    for line in data.decode("utf-8", errors="replace").splitlines():
+        try:
+            record = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if "answer" in record:
+            done.add(str(record["id"]))
+    if data and not data.endswith(b"\n"):
+        with open(output_path, "ab") as f:
+            f.write(b"\n")
+    return done
+
+
+def retrieve_block(block: list, components: dict, top_k: int) -> list:
+    """
+    Embeds a block of questions in one go, runs one batched FAISS search, then BM25 per question.
+    With several collections, each question is searched across all of them instead.
+    """
+    embedder, index, chunks = components["embedder"], components["index"], components["chunks"]
+    vectors = embed_texts(embedder, [q["question"] for q in block], batch_size=EMBED_BATCH_SIZE)
+    vectors = vectors.astype("float32")
+    if len(components["shards"]) > 1:
+        return [
+            retrieve_top_k(q["question"], embedder, index, chunks, top_k, q_emb=vectors[i:i + 1],
+                           shards=components["shards"])
+            for i, q in enumerate(block)
+        ]
+    _, faiss_ids = index.search(prepare_query(index, vectors), top_k * FAISS_FETCH_MULTIPLIER)
+    return [
+        retrieve_top_k(q["question"], embedder, index, chunks, top_k, bm25=components["bm25"],
+                       q_emb=vectors[i:i + 1], faiss_ids=faiss_ids[i])
+        for i, q in enumerate(block)
+    ]
+
+
+def answer_one(item: dict, relevant_chunks: list, components: dict, limiter: RateLimiter, model: str) -> dict:
+    """Generates one answer (waiting for the rate limiter) and returns its output record."""
+    record = {"id": item["id"], "question": item["question"]}
+    start = time.perf_counter()
+    trace = start_trace("batch_answer", question_id=item["id"])
+    try:
+        with activate(trace):
+            if relevant_chunks:
+                context_texts = build_context(relevant_chunks)
+                estimate = sum(estimate_tokens(m["content"]) for m in build_messages(item["question"], context_texts))
+                estimate += BATCH_EXPECTED_COMPLETION_TOKENS
+                limiter.acquire(estimate)
+                usage = {}
+                record["answer"] = groq_answer(components["groq_client"], model, item["question"], context_texts,
+                                               usage=usage)
+                if "total_tokens" in usage:
+                    limiter.adjust(usage["total_tokens"] - estimate)
+                    record["usage"] = usage
+            else:
+                record["answer"] = NO_RESULTS_ANSWER
+    except Exception as e:
+        record.pop("answer", None)
+        record["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        finish_trace(trace)
+    record["sources"] = [
+        {"doc_name": c["doc_name"], "source": c.get("source", c["doc_name"]), "chunk_id": c["chunk_id"],
+         **{key: c[key] for key in ("page", "also_in") if key in c}}
+        for c in relevant_chunks
+    ]
+    record["latency_s"] = round(time.perf_counter() - start, 3)
+    return record
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL/CSV file of questions in bulk.")
+    parser.add_argument("input", help="Questions (.jsonl or .csv)")
+    parser.add_argument("output", help="Answers (.jsonl), appended to and resumed from")
+    parser.add_argument("--top-k", type=int, default=TOP_K)
+    parser.add_argument("--rpm", type=float, default=BATCH_RPM, help="Groq requests per minute (0 = no limit).")
+    parser.add_argument("--tpm", type=float, default=BATCH_TPM, help="Groq tokens per minute (0 = no limit).")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Groq calls in flight.")
+    parser.add_argument("--block-size", type=int, default=BATCH_BLOCK_SIZE,
+                        help="Questions embedded and searched together.")
+    parser.add_argument("--model", default=GROQ_MODEL)
+    args = parser.parse_args()
+
+    questions = read_questions(args.input)
+    done = read_done_ids(args.output)
+    todo = [q for q in questions if q["id"] not in done]
+    print(f"{len(questions)} questions, {len(questions) - len(todo)} already answered, {len(todo)} to go.")
+    if not todo:
+        return
+
+    timings = {}
+    components = load_components(timings)
+    print(f"Index and models loaded in {sum(timings.values()):.1f}s")
+
+    limiter = RateLimiter(args.rpm, args.tpm)
+    start = time.perf_counter()
+    answered = failed = 0
+    with open(args.output, "a", encoding="utf-8") as out, \
+            ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for block_start in range(0, len(todo), args.block_size):
+            block = todo[block_start:block_start + args.block_size]
+            retrieved = retrieve_block(block, components, args.top_k)
+            futures = [
+                pool.submit(answer_one, item, chunks, components, limiter, args.model)
+                for item, chunks in zip(block, retrieved)
+            ]
+            # Write each answer as soon as it's ready, so a crash loses at most the calls in flight
+            for future in as_completed(futures):
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                if "error" in record:
+                    failed += 1
+                    print(f"[{record['id']}] {record['error']}")
+                else:
+                    answered += 1
+                finished = answered + failed
+                if finished % 50 == 0 or finished == len(todo):
+                    elapsed = time.perf_counter() - start
+                    print(f"{finished}/{len(todo)} done ({finished / elapsed * 60:.0f}/min, "
+                          f"rate limit waits {limiter.waited_s:.0f}s)")
+
+    print(f"Answered {answered}, failed {failed} (run again to retry failures). Output: {args.output}")
+    print("Groq calls:", ", ".join(f"{name} {count}" for name, count in default_policy().stats.snapshot().items()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Benchmarks for the indexing and query pipeline, on a synthetic corpus of configurable size.
+
+    python -m benchmarks.run_benchmarks --chunks 10000 --out bench.json
+    python -m benchmarks.run_benchmarks --chunks 1000000 --embedder hash --rag-queries 0
+
+Stages measured: load, chunk, embed, FAISS build, BM25 build, save, load_vector_db (startup),
+retrieve_top_k latency (p50/p95/p99) for several TOP_K values, and end-to-end rag_query
+against a local fake Groq client with configurable latency.
+Results are written as JSON so runs can be compared.
+
+--embedder hash uses a fast hashing stand-in for the sentence-transformers model,
+so index and search stages can be measured at sizes where real embedding would take hours.
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+import numpy as np
+
+from src.config import (
+    CHUNK_SIZE, CHUNK_OVERLAP, EMBED_MODEL_NAME, EMBED_BATCH_SIZE, FAISS_INDEX_TYPE, FAISS_INDEX_PARAMS,
+    LOAD_WORKERS, GROQ_MODEL, CHUNK_STORE_DIR
+)
+from src.pdf_loader import load_all_pdfs_from_folder
+from src.html_loader import load_all_html_from_folder
+from src.indexer import chunk_documents
+from src.embedder import embed_texts
+from src.vector_store import build_faiss_index, build_bm25_index, save_vector_db, load_vector_db
+from src.retriever import retrieve_top_k
+from src.rag_chain import rag_query
+from src.fake_groq import FakeGroqClient
+from benchmarks.synthetic import write_corpus, make_queries, HashEmbedder
+
+
+def latency_summary(samples_s: list) -> dict:
+    """Percentiles of a list of durations (seconds), in milliseconds."""
+    ms = np.array(samples_s) * 1000
+    return {
+        "n": len(ms),
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+class Stages:
+    """Times pipeline stages and records throughput."""
+
+    def __init__(self):
+        self.results = {}
+
+    def run(self, name: str, func, items=None):
+        print(f"[{name}] ...", end="", flush=True)
+        start = time.perf_counter()
+        value = func()
+        seconds = time.perf_counter() - start
+        count = items(value) if callable(items) else items
+        self.results[name] = {"seconds": seconds}
+        if count:
+            self.results[name].update({"items": count, "items_per_s": count / seconds if seconds else None})
+        print(f" {seconds:.2f}s" + (f" ({count} items, {count / seconds:,.0f}/s)" if count and seconds else ""))
+        return value
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark indexing and retrieval.")
+    parser.add_argument("--chunks", type=int, default=10_000, help="Approximate corpus size in chunks (1k to 1M).")
+    parser.add_argument("--data-dir", help="Benchmark an existing data folder instead of a synthetic corpus.")
+    parser.add_argument("--embedder", choices=["model", "hash"], default="model",
+                        help="'model' = EMBED_MODEL_NAME, 'hash' = fast stand-in for large corpora.")
+    parser.add_argument("--workers", type=int, default=LOAD_WORKERS)
+    parser.add_argument("--index-type", default=FAISS_INDEX_TYPE)
+    parser.add_argument("--top-k", default="1,4,8,16", help="Comma separated TOP_K values for retrieval latency.")
+    parser.add_argument("--queries", type=int, default=300, help="Queries per TOP_K value.")
+    parser.add_argument("--rag-queries", type=int, default=50, help="End-to-end rag_query calls (0 = skip).")
+    parser.add_argument("--llm-latency", type=float, default=0.3, help="Fake Groq time to first token (s).")
+    parser.add_argument("--llm-token-delay", type=float, default=0.0, help="Fake Groq delay per streamed piece (s).")
+    parser.add_argument("--out", default="bench_results.json")
+    parser.add_argument("--keep", action="store_true", help="Keep the temporary corpus and index.")
+    args = parser.parse_args()
+
+    work_dir = tempfile.mkdtemp(prefix="rag_bench_")
+    stages = Stages()
+    try:
+        data_dir = args.data_dir
+        if data_dir is None:
+            data_dir = os.path.join(work_dir, "data")
+            n_pdfs, n_html = stages.run(
+                "generate_corpus", lambda: write_corpus(data_dir, args.chunks, CHUNK_SIZE)
+            )
+            print(f"Synthetic corpus: {n_pdfs} PDFs, {n_html} HTML pages")
+        html_dir = os.path.join(data_dir, "html files")
+
+        docs = stages.run(
+            "load",
+            lambda: load_all_pdfs_from_folder(data_dir, args.workers) + load_all_html_from_folder(html_dir, args.workers),
+            items=len,
+        )
+        chunks = stages.run(
+            "chunk",
+            lambda: chunk_documents(docs, CHUNK_SIZE, CHUNK_OVERLAP, args.workers),
+            items=len,
+        )
+        del docs
+
+        if args.embedder == "hash":
+            embedder = HashEmbedder()
+        else:
+            from src.embedder import get_embedder
+            embedder = stages.run("load_model", lambda: get_embedder(EMBED_MODEL_NAME))
+        embeddings = stages.run(
+            "embed",
+            lambda: embed_texts(embedder, [c["text"] for c in chunks], batch_size=EMBED_BATCH_SIZE),
+            items=len(chunks),
+        )
+        index = stages.run(
+            "faiss_build",
+            lambda: build_faiss_index(embeddings, args.index_type, FAISS_INDEX_PARAMS.get(args.index_type, {})),
+            items=len(chunks),
+        )
+        bm25 = stages.run("bm25_build", lambda: build_bm25_index(chunks), items=len(chunks))
+
+        db_dir = os.path.join(work_dir, "vectordb")
+        faiss_path = os.path.join(db_dir, "index.faiss")
+        chunks_path = os.path.join(db_dir, CHUNK_STORE_DIR)
+        stages.run("save", lambda: save_vector_db(index, bm25, chunks, db_dir, faiss_path, chunks_path, embeddings=embeddings))
+        del index, bm25, chunks, embeddings
+        index, bm25, chunks = stages.run("load_vector_db", lambda: load_vector_db(faiss_path, chunks_path))
+
+        # Retrieval latency per TOP_K (no query cache, so every query pays for embedding)
+        queries = make_queries(args.queries)
+        retrieval = {}
+        for top_k in [int(k) for k in args.top_k.split(",")]:
+            samples = []
+            for query in queries:
+                start = time.perf_counter()
+                retrieve_top_k(query, embedder, index, chunks, top_k, bm25=bm25)
+                samples.append(time.perf_counter() - start)
+            retrieval[str(top_k)] = latency_summary(samples)
+            print(f"[retrieve_top_k top_k={top_k}] p50 {retrieval[str(top_k)]['p50_ms']:.2f} ms, "
+                  f"p95 {retrieval[str(top_k)]['p95_ms']:.2f} ms, p99 {retrieval[str(top_k)]['p99_ms']:.2f} ms")
+
+        # End-to-end rag_query against the fake Groq client
+        rag = None
+        if args.rag_queries:
+            client = FakeGroqClient(first_token_delay=args.llm_latency, token_delay=args.llm_token_delay)
+            samples = []
+            for query in make_queries(args.rag_queries, seed=2):
+                start = time.perf_counter()
+                rag_query(query, embedder, index, chunks, 4, client, GROQ_MODEL, bm25=bm25)
+                samples.append(time.perf_counter() - start)
+            rag = latency_summary(samples)
+            print(f"[rag_query] p50 {rag['p50_ms']:.1f} ms, p95 {rag['p95_ms']:.1f} ms (fake LLM {args.llm_latency}s)")
+
+        results = {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git_commit": git_commit(),
+            "environment": {"python": platform.python_version(), "platform": platform.platform(),
+                            "cpus": os.cpu_count()},
+            "config": {**vars(args), "chunk_size": CHUNK_SIZE, "chunk_overlap": CHUNK_OVERLAP,
+                       "corpus_chunks": len(chunks)},
+            "stages": stages.results,
+            "retrieve_top_k": retrieval,
+            "rag_query": rag,
+        }
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.out}")
+    finally:
+        if args.keep:
+            print(f"Kept working files in {work_dir}")
+        else:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Synthetic corpora and stand-in models for the benchmarks.
+
+- write_corpus: writes PDF and HTML files that look roughly like our crawled data
+- HashEmbedder: a fast, deterministic stand-in for SentenceTransformer, so indexing
+  and search can be benchmarked at sizes where running the real model is impractical
+"""
+
+import os
+import zlib
+import numpy as np
+
+TOPIC_WORDS = (
+    "admission admissions fee fees structure deadline merit scholarship schedule semester program "
+    "undergraduate graduate bba bscs mba economics mathematics computer science test interview "
+    "eligibility policy refund hostel transport library campus karachi city main faculty dean "
+    "registrar exam result transcript credit course grade gpa probation attendance withdrawal"
+).split()
+FILLER_WORDS = "the of and to in for is on that by with as are be at from this or an will all".split()
+
+
+def make_vocabulary(size: int = 20_000, seed: int = 0) -> list:
+    """Topic words + filler words + random made-up words, used with a Zipf distribution."""
+    rng = np.random.default_rng(seed)
+    letters = np.array(list("abcdefghijklmnopqrstuvwxyz"))
+    made_up = ["".join(rng.choice(letters, size=rng.integers(4, 11))) for _ in range(size)]
+    return FILLER_WORDS + TOPIC_WORDS + made_up
+
+
+def random_sentences(rng, vocab: list, n_words: int) -> str:
+    """Text with a Zipf-like word distribution and sentence/paragraph breaks."""
+    ranks = np.minimum(rng.zipf(1.3, size=n_words), len(vocab)) - 1
+    words = [vocab[r] for r in ranks]
+    out = []
+    for i, word in enumerate(words):
+        out.append(word)
+        if i % 14 == 13:
+            out[-1] += "."
+            if i % 98 == 97:
+                out.append("\n\n")
+    return " ".join(out).replace(" \n\n ", "\n\n")
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def write_pdf(path: str, pages: list):
+    """Writes a minimal, valid PDF with one text page per entry of pages (a list of lines each)."""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_ids = []
+    for lines in pages:
+        ops = ["BT /F1 9 Tf 11 TL 40 800 Td"] + [f"({_pdf_escape(line)}) Tj T*" for line in lines] + ["ET"]
+        stream = zlib.compress("\n".join(ops).encode("latin-1", "replace"))
+        objects.append(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(stream) + stream + b"\nendstream")
+        content_id = len(objects)
+        objects.append(
+            b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_id
+        )
+        page_ids.append(len(objects))
+    kids = " ".join(f"{i} 0 R" for i in page_ids).encode()
+    objects[1] = b"<< /Type /Pages /Kids [" + kids + b"] /Count %d >>" % len(page_ids)
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref_at = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    out += b"".join(b"%010d 00000 n \n" % off for off in offsets)
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_at)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_html(path: str, title: str, text: str):
+    """Writes a page shaped like the crawled site: nav + <div id="main"> + footer."""
+    paragraphs = "".join(f"<p>{p}</p>\n" for p in text.split("\n\n"))
+    html = (
+        f"<html><head><title>{title}</title></head><body>\n"
+        f"<nav><a href='/'>Home</a> | <a href='/admissions'>Admissions</a> | <a href='/programs'>Programs</a></nav>\n"
+        f"<div id=\"main\"><h1>{title}</h1>\n{paragraphs}</div>\n"
+        f"<footer>Institute of Business Administration, Karachi</footer>\n</body></html>\n"
+    )
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(html)
+
+
+def write_corpus(data_dir: str, n_chunks: int, chunk_size: int, pdf_share: float = 0.3,
+                 chunks_per_doc: int = 20, seed: int = 0):
+    """
+    Writes roughly n_chunks chunks worth of documents into data_dir (PDFs) and
+    data_dir/html files (HTML). Returns (n_pdfs, n_html).
+    """
+    rng = np.random.default_rng(seed)
+    vocab = make_vocabulary(seed=seed)
+    html_dir = os.path.join(data_dir, "html files")
+    os.makedirs(html_dir, exist_ok=True)
+
+    words_per_doc = int(chunks_per_doc * chunk_size / 6.5) # ~6.5 characters per word incl. space
+    n_docs = max(1, round(n_chunks / chunks_per_doc))
+    n_pdfs = int(n_docs * pdf_share)
+    for i in range(n_docs):
+        text = random_sentences(rng, vocab, words_per_doc)
+        if i < n_pdfs:
+            words = text.replace("\n\n", " ").split()
+            lines = [" ".join(words[j:j + 12]) for j in range(0, len(words), 12)]
+            write_pdf(os.path.join(data_dir, f"doc_{i:07d}.pdf"), [lines[j:j + 60] for j in range(0, len(lines), 60)])
+        else:
+            write_html(os.path.join(html_dir, f"page_{i:07d}.html"), f"Page {i}", text)
+    return n_pdfs, n_docs - n_pdfs
+
+
+def make_queries(n: int, seed: int = 1) -> list:
+    """Short student-style questions over the synthetic vocabulary."""
+    rng = np.random.default_rng(seed)
+    vocab = make_vocabulary(seed=0)
+    queries = []
+    for _ in range(n):
+        words = list(rng.choice(TOPIC_WORDS, size=rng.integers(1, 4)))
+        words += [vocab[r] for r in np.minimum(rng.zipf(1.3, size=rng.integers(1, 4)), len(vocab)) - 1]
+        queries.append(" ".join(words))
+    return queries
+
+
+class HashEmbedder:
+    """
+    Stand-in for SentenceTransformer: feature-hashes words into a dim-sized vector.
+    Texts sharing words get similar vectors, so search behaves sensibly, at a tiny fraction of the cost.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def encode(self, texts, convert_to_numpy: bool = True, show_progress_bar: bool = False, batch_size: int = 32):
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                h = zlib.crc32(word.encode("utf-8"))
+                out[row, h % self.dim] += 1.0 if (h >> 16) & 1 else -1.0
+        return out
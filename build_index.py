@@ -1,95 +1,105 @@
 """
-Run this script ONCE to process all PDFs and build your vector database.
-Run it again whenever you add new PDFs to the data folder.
+Run this script to process all PDFs and HTML files and build your vector database.
+Run it again whenever you add or change files in the data folder:
+only new and changed files are re-embedded, and chunks of deleted files are dropped.
+
+Use --full to ignore the previous build and rebuild everything from scratch.
+
+Each build is saved to a new folder under vectordb/versions/ and only published once complete,
+so apps that are running (or starting) never read a half-written index.
+
+If a build is interrupted (Ctrl+C, crash, reboot), run it again: it resumes from its last checkpoint
+instead of embedding everything again (see BUILD_CHECKPOINT_CHUNKS in src/config.py).
+
+Boilerplate lines repeated across HTML pages and near-duplicate chunks are left out of the index
+(see BOILERPLATE_MIN_PAGES and DEDUP_NEAR_DUPLICATES in src/config.py); the build reports what that saved.
+
+With COLLECTIONS set in src/config.py, every collection is built and stored as a shard of its own;
+use --collection NAME (repeatable) to rebuild only some of them.
 """
 
+import argparse
 from dotenv import load_dotenv
 load_dotenv()
 
 from src.config import (
-    DATA_DIR, VECTOR_DB_DIR, FAISS_INDEX_PATH, CHUNKS_PATH,
-    CHUNK_SIZE, CHUNK_OVERLAP, EMBED_MODEL_NAME
-)
-
-import os
-import uuid
-from src.config import (
-    DATA_DIR, VECTOR_DB_DIR, FAISS_INDEX_PATH, CHUNKS_PATH,
-    CHUNK_SIZE, CHUNK_OVERLAP, EMBED_MODEL_NAME
+    DATA_DIR, HTML_DIR, VECTOR_DB_DIR, INDEX_KEEP_VERSIONS,
+    CHUNK_SIZE, CHUNK_OVERLAP, EMBED_MODEL_NAME, LOAD_WORKERS,
+    EMBED_BATCH_SIZE, EMBED_CACHE_DIR, EMBED_CACHE_MAX_ENTRIES,
+    FAISS_INDEX_TYPE, FAISS_INDEX_PARAMS, DOC_TAGS, COLLECTIONS, DEFAULT_COLLECTION,
+    BOILERPLATE_MIN_PAGES, BOILERPLATE_MIN_LINES, BOILERPLATE_MIN_CHARS, DEDUP_NEAR_DUPLICATES, DEDUP_JACCARD,
+    BUILD_MEMORY_BUDGET_MB, BUILD_CHECKPOINT_CHUNKS
 )
-
-from src.pdf_loader import load_all_pdfs_from_folder
-from src.html_loader import load_all_html_from_folder
-from src.chunker import chunk_text
-from src.embedder import get_embedder, embed_texts
-from src.vector_store import build_faiss_index, build_bm25_index, save_vector_db
+from src.indexer import build_and_save_index_from_folder
+from src.shards import collection_names, collection_of, collection_dir
 
 
 def main():
     """
     Reads all PDFs and HTML files from the data folder, chunks them,
-    creates embeddings, and saves the FAISS index to disk.
+    creates embeddings, and saves the FAISS + BM25 indexes to disk.
     """
-    print("Building local vector DB from ALL files (PDF + HTML) in folder...")
-    print(f"Data folder: {DATA_DIR}")
-
-    # 1. Load PDFs from the root 'data' folder
-    print(f"Scanning for PDFs in {DATA_DIR}...")
-    pdf_docs = load_all_pdfs_from_folder(DATA_DIR)
-    print(f"Found {len(pdf_docs)} PDFs.")
+    parser = argparse.ArgumentParser(description="Build the hybrid (FAISS + BM25) index.")
+    parser.add_argument("--full", action="store_true", help="Rebuild everything instead of only changed files.")
+    parser.add_argument("--no-cache", action="store_true", help="Don't use the on-disk embedding cache.")
+    parser.add_argument("--workers", type=int, default=LOAD_WORKERS, help="Processes used to parse files (1 = no multiprocessing).")
+    parser.add_argument("--memory-budget-mb", type=int, default=BUILD_MEMORY_BUDGET_MB,
+                        help="Most memory used at once for embedding rows copied or added to FAISS.")
+    parser.add_argument("--collection", action="append", default=[], metavar="NAME",
+                        help="Only build this collection (see COLLECTIONS in src/config.py). Repeat for several.")
+    args = parser.parse_args()
 
-    # 2. Load HTMLs from 'data/html files'
-    html_dir = os.path.join(DATA_DIR, "html files")
-    print(f"Scanning for HTML files in {html_dir}...")
-    html_docs = load_all_html_from_folder(html_dir)
-    print(f"Found {len(html_docs)} HTML files.")
+    names = collection_names(COLLECTIONS, DEFAULT_COLLECTION)
+    for name in args.collection:
+        if name not in names:
+            parser.error(f"Unknown collection {name} (expected one of {', '.join(names)})")
 
-    # Combine docs
-    docs = pdf_docs + html_docs
-    
-    if not docs:
-        print("No documents found! Check your data directory.")
-        return
-    
-    # Chunk all documents
-    all_chunks = []
-    for doc in docs:
-        doc_name = doc["doc_name"]
-        text = doc["text"]
-        chunks = chunk_text(text, CHUNK_SIZE, CHUNK_OVERLAP)
-        doc_source = doc.get("source", doc_name) # Fallback to doc_name if source missing
-        for i, ch in enumerate(chunks):
-            all_chunks.append({
-                "id": str(uuid.uuid4()),
-                "doc_name": doc_name,
-                "source": doc_source,
-                "chunk_id": i,
-                "text": ch
-            })
-
-    # Create Embeddings
-    print("Creating embeddings (this may take a while)...")
-    embedder = get_embedder(EMBED_MODEL_NAME)
-    chunk_texts = [c["text"] for c in all_chunks]
-    embeddings = embed_texts(embedder, chunk_texts)
-
-    # Build FAISS Index
-    print("Building FAISS index...")
-    faiss_index = build_faiss_index(embeddings)
+    print("Building local vector DB from ALL files (PDF + HTML) in folder...")
+    print(f"Data folder: {DATA_DIR}")
+    print(f"HTML folder: {HTML_DIR}")
 
-    # Build BM25 Index
-    print("Building BM25 index...")
-    bm25_index = build_bm25_index(all_chunks)
+    for name in args.collection or names:
+        if len(names) > 1:
+            print(f"\n=== Collection: {name} ===")
+        stats = build_and_save_index_from_folder(
+            data_dir=DATA_DIR,
+            html_dir=HTML_DIR,
+            chunk_size=CHUNK_SIZE,
+            chunk_overlap=CHUNK_OVERLAP,
+            embed_model_name=EMBED_MODEL_NAME,
+            vector_db_dir=collection_dir(VECTOR_DB_DIR, name, DEFAULT_COLLECTION),
+            full_rebuild=args.full,
+            workers=args.workers,
+            embed_batch_size=EMBED_BATCH_SIZE,
+            embed_cache_dir=None if args.no_cache else EMBED_CACHE_DIR,
+            embed_cache_max_entries=EMBED_CACHE_MAX_ENTRIES,
+            faiss_index_type=FAISS_INDEX_TYPE,
+            faiss_params=FAISS_INDEX_PARAMS.get(FAISS_INDEX_TYPE, {}),
+            doc_tags=DOC_TAGS,
+            keep_versions=INDEX_KEEP_VERSIONS,
+            file_filter=lambda rel_path, name=name: collection_of(rel_path, COLLECTIONS, DEFAULT_COLLECTION) == name,
+            boilerplate_min_pages=BOILERPLATE_MIN_PAGES,
+            boilerplate_min_lines=BOILERPLATE_MIN_LINES,
+            boilerplate_min_chars=BOILERPLATE_MIN_CHARS,
+            dedup_jaccard=DEDUP_JACCARD if DEDUP_NEAR_DUPLICATES else None,
+            memory_budget_mb=args.memory_budget_mb,
+            checkpoint_chunks=BUILD_CHECKPOINT_CHUNKS,
+        )
 
-    # Save Vector DB
-    print(f"Saving combined index to {VECTOR_DB_DIR}...")
-    save_vector_db(faiss_index, bm25_index, all_chunks, VECTOR_DB_DIR, FAISS_INDEX_PATH, CHUNKS_PATH)
-    
-    print("\nDone! Hybrid Index created successfully.")
-    print(f"Files indexed: {len(docs)}")
-    print(f"Total chunks: {len(all_chunks)}")
-    print(f"Saved FAISS index: {FAISS_INDEX_PATH}")
-    print(f"Saved chunks JSON: {CHUNKS_PATH}")
+        print("\nDone! Hybrid Index is up to date.")
+        print(f"Files indexed: {stats['files']}")
+        print(f"Chunks embedded this run: {stats['embedded']}")
+        if stats.get("resumed"):
+            print(f"Chunks embedded before the interruption: {stats['resumed']}")
+        print(f"Total chunks: {stats['chunks']}")
+        if "dedup" in stats:
+            print(f"Chunks saved by de-duplication: {stats['dedup']['saved_chunks']} "
+                  f"(about {stats['dedup']['saved_bytes'] / 1024:,.0f} KB)")
+        if stats.get("unpublished"):
+            print(f"Unpublished index version {stats['unpublished']}: no documents left to index")
+        if "version" in stats:
+            print(f"Saved index version {stats['version']} to {stats['path']}")
+            print("Running apps switch to it on their own (see INDEX_RELOAD_INTERVAL_S).")
 
 
 if __name__ == "__main__":
@@ -1,40 +1,46 @@
 """
 Interactive RAG chatbot.
 Loads the pre-built vector database and lets you ask questions about the University Website.
+
+    python chat.py [--startup-report] [--filter doc_type=pdf --filter tags=admissions ...] [--collection NAME ...]
 """
 
+import argparse
 from dotenv import load_dotenv
 load_dotenv()
 
-from src.config import FAISS_INDEX_PATH, CHUNKS_PATH, TOP_K, EMBED_MODEL_NAME, GROQ_MODEL
-from src.vector_store import load_vector_db
-from src.embedder import get_embedder
-from src.groq_llm import get_groq_client
-from src.rag_chain import rag_query
+from src.startup import BackgroundLoader
+from src.config import TOP_K, GROQ_MODEL
+from src.rag_chain import rag_query_stream
+from src.llm_policy import default_policy
+from src.metadata_filter import FILTER_FIELDS
 
 
 def main():
     """
     Starts the RAG chatbot:
-    1. Loads the FAISS index and chunk metadata
-    2. Loads the embedding model
-    3. Connects to Groq API
-    4. Runs an interactive Q&A loop
+    1. Starts loading the FAISS index, chunks, embedding model and Groq client in the background
+    2. Runs an interactive Q&A loop right away (the first question waits for loading if needed)
     """
-    # Load RAG components
-    print("Loading local vector DB...")
-    try:
-        index, bm25, chunks = load_vector_db(FAISS_INDEX_PATH, CHUNKS_PATH)
-    except Exception as e:
-        print(f"Error loading database: {e}")
-        print("Did you run build_index.py?")
-        return
+    parser = argparse.ArgumentParser(description="Ask questions about the university documents.")
+    parser.add_argument("--startup-report", action="store_true", help="Print where the start-up time went.")
+    parser.add_argument("--filter", action="append", default=[], metavar="FIELD=VALUE",
+                        help="Only search matching chunks (doc_name, source, doc_type or tags). Repeat to add values.")
+    parser.add_argument("--collection", action="append", default=[], metavar="NAME",
+                        help="Only search this collection (see COLLECTIONS in src/config.py). Repeat for several.")
+    args = parser.parse_args()
+
+    filters = {}
+    for item in args.filter:
+        field, _, value = item.partition("=")
+        if field.strip() not in FILTER_FIELDS:
+            parser.error(f"--filter field must be one of {', '.join(FILTER_FIELDS)}")
+        filters.setdefault(field.strip(), []).append(value.strip())
 
-    print("Loading embedder...")
-    embedder = get_embedder(EMBED_MODEL_NAME)
-    
-    # Initialize Groq client
-    groq_client = get_groq_client()
+    # Load RAG components in the background while the prompt is already shown
+    # (and pick up newly built index versions while the chat is running)
+    loader = BackgroundLoader()
+    components = None
 
     print("\n" + "="*50)
     print("🎓 University Chatbot Initialized")
@@ -45,29 +51,64 @@ def main():
     while True:
         user_input = input("You: ")
         if user_input.lower() in ["exit", "quit"]:
+            if components is not None:
+                stats = components["query_cache"].stats()
+                print(f"Query cache: {stats['hits']} hits, {stats['misses']} misses")
+                print("Groq calls:", default_policy().stats.snapshot())
             print("Goodbye!")
             break
+
+        if components is None:
+            if not loader.ready:
+                print("Loading the index and models...")
+            try:
+                loader.wait()
+            except Exception as e:
+                print(f"Error loading database: {e}")
+                print("Did you run build_index.py?")
+                return
+            if args.startup_report:
+                print(loader.report())
+            unknown = [name for name in args.collection if name not in loader.components["shards"]]
+            if unknown:
+                print(f"Unknown collection: {', '.join(unknown)} (built: {', '.join(loader.components['shards'])})")
+                return
+        # The latest components: a rebuilt index is swapped in between questions
+        components = loader.wait()
         
-        # Run RAG pipeline
+        # Run RAG pipeline, printing the answer as it streams in
         print("Thinking...")
-        answer, sources = rag_query(
+        tokens, sources, timings = rag_query_stream(
             question=user_input, 
-            embedder=embedder, 
-            index=index, 
-            chunks=chunks, 
+            embedder=components["embedder"], 
+            index=components["index"], 
+            chunks=components["chunks"], 
             top_k=TOP_K,
-            groq_client=groq_client,
+            groq_client=components["groq_client"],
             groq_model=GROQ_MODEL,
-            bm25=bm25
+            bm25=components["bm25"],
+            query_cache=components["query_cache"],
+            answer_cache=components["answer_cache"],
+            filters=filters,
+            metadata=components["metadata"],
+            shards=components["shards"],
+            collections=args.collection
         )
         
-        print(f"Bot: {answer}")
+        print("Bot: ", end="", flush=True)
+        for token in tokens:
+            print(token, end="", flush=True)
+        print()
+        print(f"(first token {timings.get('first_token_s', 0):.2f}s, total {timings.get('total_s', 0):.2f}s)")
         
         # Optional: Print sources in CLI
         print("\n[Sources referenced:]")
         for chunk in sources:
             src = chunk.get("source", chunk["doc_name"])
-            print(f"- {src}")
+            page = f", page {chunk['page']}" if "page" in chunk else ""
+            print(f"- {src}{page}")
+            if chunk.get("also_in"):
+                print("  also in: " + ", ".join(copy.get("source", copy["doc_name"]) for copy in chunk["also_in"]))
         print("-" * 30 + "\n")
 
 
@@ -0,0 +1,76 @@
+"""
+Checks that the BM25 engine (src/bm25.py) ranks like rank_bm25.BM25Okapi, on random corpora.
+
+Small vocabularies give many tied scores, and tiny corpora give negative epsilon idfs, which are the
+cases where a ranking is easiest to get wrong. For every query it checks that:
+- get_scores is exactly BM25Okapi.get_scores
+- top_n returns the same scores in the same order as np.argsort(scores)[::-1], and breaks ties by
+  higher position first (a stable argsort in reverse; BM25Okapi's own tie order is not stable)
+- with a mask, top_n ranks the allowed chunks the same way
+
+    python check_bm25.py                # needs rank_bm25 (pip install rank-bm25)
+    python check_bm25.py --corpora 200 --seed 1
+"""
+
+import argparse
+import sys
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+from src.bm25 import SparseBM25
+
+
+def expected_top(scores: np.ndarray, n: int, allowed: np.ndarray = None) -> np.ndarray:
+    """The positions of the n best scores, ties broken by higher position first."""
+    positions = np.arange(len(scores)) if allowed is None else allowed
+    order = np.argsort(scores[positions], kind="stable")[::-1]
+    return positions[order][:n]
+
+
+def check_corpus(rng, n_docs: int, vocab_size: int, queries: int) -> list:
+    """Compares both engines on one random corpus. Returns the problems found."""
+    vocab = [f"w{i}" for i in range(vocab_size)]
+    corpus = [[str(word) for word in rng.choice(vocab, size=rng.integers(1, 12))] for _ in range(n_docs)]
+    reference = BM25Okapi(corpus)
+    sparse = SparseBM25.from_corpus(corpus)
+    problems = []
+    for _ in range(queries):
+        query = [str(word) for word in rng.choice(vocab + ["unknown"], size=rng.integers(1, 4))]
+        scores = reference.get_scores(query)
+        if not np.array_equal(sparse.get_scores(query), scores):
+            problems.append(f"{n_docs} docs, query {query}: get_scores differs")
+        n = int(rng.integers(1, n_docs + 2))
+        positions, top_scores = sparse.top_n(query, n)
+        argsort_top = np.argsort(scores)[::-1][:n]
+        if not np.array_equal(scores[positions], scores[argsort_top]) or not np.array_equal(top_scores, scores[positions]):
+            problems.append(f"{n_docs} docs, query {query}, n={n}: ranked scores differ from BM25Okapi")
+        elif not np.array_equal(positions, expected_top(scores, n)):
+            problems.append(f"{n_docs} docs, query {query}, n={n}: ties not broken by higher position first")
+        mask = rng.random(n_docs) < 0.5
+        positions, _ = sparse.top_n(query, n, mask)
+        if not np.array_equal(positions, expected_top(scores, n, np.flatnonzero(mask))):
+            problems.append(f"{n_docs} docs, query {query}, n={n}: masked ranking differs")
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the sparse BM25 engine with rank_bm25 on random corpora.")
+    parser.add_argument("--corpora", type=int, default=100, help="Random corpora to check.")
+    parser.add_argument("--queries", type=int, default=20, help="Queries per corpus.")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    problems = []
+    for _ in range(args.corpora):
+        n_docs = int(rng.choice([1, 2, 3, 5, 20, 200, 1000]))
+        problems += check_corpus(rng, n_docs, int(rng.integers(3, 60)), args.queries)
+    for problem in problems[:20]:
+        print(problem)
+    print(f"{args.corpora} corpora x {args.queries} queries: {len(problems)} problems")
+    if problems:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
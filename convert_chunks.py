@@ -0,0 +1,93 @@
+"""
+Converts indexes built before the chunk store: the published chunks.json of every collection
+becomes a memory-mapped chunk store folder (see src/chunk_store.py), with checksums of the
+FAISS, BM25 and chunk files in artifacts.json.
+
+The conversion is published as a new index version (the other files are hard-linked, not copied),
+so running apps switch to it on their own and the next build stays incremental.
+
+    python convert_chunks.py            # convert every collection that still has chunks.json
+    python convert_chunks.py --verify   # only check the published versions against their checksums
+"""
+
+import argparse
+import os
+import sys
+import shutil
+
+from src.config import VECTOR_DB_DIR, INDEX_KEEP_VERSIONS, CHUNK_STORE_DIR, CHUNKS_FILE, COLLECTIONS, DEFAULT_COLLECTION
+from src.chunk_store import write_chunk_store, open_chunks, ChunkStore
+from src.index_versions import (
+    current_dir, new_version, publish_version, prune_versions, write_artifacts, verify_artifacts,
+    CURRENT_FILE, ARTIFACTS_FILE
+)
+from src.indexer import artifact_names
+from src.shards import built_collections, collection_dir
+
+
+def link_or_copy(src: str, dst: str):
+    """Hard-links a file (instant, no extra space), or copies it where links aren't possible."""
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def convert(vector_db_dir: str, keep_versions: int) -> bool:
+    """
+    Publishes a copy of the current version with its chunks.json turned into a chunk store.
+    Returns False if there was nothing to convert.
+    """
+    version, build_dir = current_dir(vector_db_dir)
+    json_path = os.path.join(build_dir, CHUNKS_FILE)
+    if os.path.isdir(os.path.join(build_dir, CHUNK_STORE_DIR)) or not os.path.exists(json_path):
+        return False
+
+    chunks = open_chunks(json_path)
+    new, new_dir = new_version(vector_db_dir)
+    # Regular files only: the old flat layout keeps versions/ and collections/ in the same folder
+    for name in os.listdir(build_dir):
+        path = os.path.join(build_dir, name)
+        if os.path.isfile(path) and name not in (CHUNKS_FILE, CURRENT_FILE, CURRENT_FILE + ".tmp", ARTIFACTS_FILE):
+            link_or_copy(path, os.path.join(new_dir, name))
+    write_chunk_store(chunks, os.path.join(new_dir, CHUNK_STORE_DIR))
+    if list(ChunkStore(os.path.join(new_dir, CHUNK_STORE_DIR))) != chunks:
+        shutil.rmtree(new_dir)
+        raise ValueError(f"The chunk store written for {build_dir} doesn't read back the same chunks")
+    write_artifacts(new_dir, artifact_names())
+    publish_version(vector_db_dir, new)
+    print(f"  {len(chunks)} chunks converted, published as version {new} (was {version or 'unversioned'})")
+    for old in prune_versions(vector_db_dir, keep_versions):
+        print(f"  Deleted old index version {old}")
+    return True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert chunks.json indexes to the memory-mapped chunk store.")
+    parser.add_argument("--verify", action="store_true",
+                        help="Only check the published versions against the SHA-256 checksums in their artifacts.json.")
+    args = parser.parse_args()
+
+    damaged = False
+    for name in built_collections(VECTOR_DB_DIR, COLLECTIONS, DEFAULT_COLLECTION):
+        vector_db_dir = collection_dir(VECTOR_DB_DIR, name, DEFAULT_COLLECTION)
+        print(f"Collection {name} ({vector_db_dir}):")
+        if args.verify:
+            version, build_dir = current_dir(vector_db_dir)
+            if not os.path.exists(os.path.join(build_dir, ARTIFACTS_FILE)):
+                print("  no checksums (built before artifacts.json), run this script without --verify to add them")
+                continue
+            try:
+                verify_artifacts(build_dir, checksums=True)
+                print(f"  version {version}: every file matches its checksum")
+            except ValueError as e:
+                print(f"  {e}")
+                damaged = True
+        elif not convert(vector_db_dir, INDEX_KEEP_VERSIONS):
+            print("  already a chunk store, nothing to do")
+    if damaged:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
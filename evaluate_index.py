@@ -0,0 +1,150 @@
+"""
+Measures how well the approximate FAISS index types work on YOUR corpus.
+
+Uses the embeddings saved by build_index.py, holds out a sample of chunks as queries,
+and reports recall@k of every HNSW / IVF / compressed setting against exact float32 cosine search,
+with build time, search latency and index size (on disk and in RAM),
+so FAISS_INDEX_TYPE can be picked with real numbers.
+
+    python evaluate_index.py --k 8 --queries 500
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import numpy as np
+import faiss
+
+from src.config import VECTOR_DB_DIR
+from src.vector_store import load_embeddings, build_faiss_index, set_search_params, RerankIndex
+from src.index_versions import current_dir
+
+# Settings to compare: (index type, build params, list of search params to sweep)
+SWEEPS = [
+    ("hnsw", {"M": 16, "efConstruction": 200}, [{"efSearch": ef} for ef in (16, 32, 64, 128)]),
+    ("hnsw", {"M": 32, "efConstruction": 200}, [{"efSearch": ef} for ef in (16, 32, 64, 128)]),
+    ("ivf_flat", {"nlist": 256}, [{"nprobe": p} for p in (1, 4, 16, 64)]),
+    ("flat_f16", {}, [{}]),
+    # rerank_factor 1 = the compressed index alone (re-ranking k candidates doesn't change which are found)
+    ("sq8", {"rerank": True}, [{"rerank_factor": f} for f in (1, 2, 4)]),
+    ("pq", {"M": 48, "nbits": 8, "rerank": True}, [{"rerank_factor": f} for f in (1, 4, 8, 16)]),
+]
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    """Fraction of the true top-k neighbours that the approximate search returned."""
+    hits = sum(len(np.intersect1d(f[f >= 0], t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+
+# Run in a fresh process: how much resident memory faiss.read_index adds (Linux /proc, else prints -1)
+RSS_PROBE = """
+import os, sys, faiss
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+try:
+    before = rss()
+    index = faiss.read_index(sys.argv[1])
+    print(rss() - before)
+except OSError:
+    print(-1)
+"""
+
+
+def index_size_mb(index) -> tuple:
+    """
+    (MB on disk, MB of RAM) of a FAISS index: the file written by faiss.write_index, and how much
+    the resident memory of a new process grows when it loads that file (what each app worker pays).
+    The float32 vectors used for re-ranking are not counted: they stay in the memory-mapped
+    embeddings.npy, read a few rows at a time and shared by all workers through the page cache.
+    """
+    index = index.index if isinstance(index, RerankIndex) else index
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "index.faiss")
+        faiss.write_index(index, path)
+        disk = os.path.getsize(path)
+        probe = subprocess.run([sys.executable, "-c", RSS_PROBE, path], capture_output=True, text=True)
+        try:
+            ram = int(probe.stdout.strip())
+        except ValueError:
+            ram = -1
+    return disk / 2**20, (ram / 2**20 if ram >= 0 else None)
+
+
+def format_size(disk_mb: float, ram_mb: float) -> str:
+    ram = f"{ram_mb:7.1f} MB" if ram_mb is not None else "      ?"
+    return f"disk {disk_mb:7.1f} MB  RAM {ram}"
+
+
+def timed_search(index, queries: np.ndarray, k: int):
+    """Searches one query at a time (like the chatbot does) and returns (ids, ms per query)."""
+    start = time.perf_counter()
+    ids = np.vstack([index.search(q[None, :], k)[1] for q in queries])
+    return ids, (time.perf_counter() - start) * 1000 / len(queries)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recall@k of approximate FAISS indexes against exact search.")
+    parser.add_argument("--k", type=int, default=8, help="Neighbours per query (retrieval fetches 2 * TOP_K).")
+    parser.add_argument("--queries", type=int, default=500, help="Number of chunks held out as queries.")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", help="Also write the results to this JSON file.")
+    args = parser.parse_args()
+
+    _, build_dir = current_dir(VECTOR_DB_DIR)
+    if build_dir is None:
+        print("No index version is published (the last build found no documents).")
+        return
+    embeddings = load_embeddings(build_dir)
+    if embeddings is None:
+        print(f"No embeddings.npy in {build_dir}. Run build_index.py first.")
+        return
+
+    rng = np.random.default_rng(args.seed)
+    query_rows = rng.choice(len(embeddings), size=min(args.queries, len(embeddings)), replace=False)
+    queries = np.array(embeddings[query_rows], dtype="float32")
+    faiss.normalize_L2(queries)
+    print(f"Corpus: {len(embeddings)} vectors, {len(queries)} queries, k={args.k}")
+
+    exact = build_faiss_index(embeddings, "flat_ip")
+    truth, exact_ms = timed_search(exact, queries, args.k)
+    disk_mb, ram_mb = index_size_mb(exact)
+    print(f"{'flat_ip (exact)':<36} recall=1.000  {exact_ms:7.3f} ms/query  {format_size(disk_mb, ram_mb)}")
+
+    results = [{"type": "flat_ip", "params": {}, "recall": 1.0, "ms_per_query": exact_ms, "build_s": None,
+                "disk_mb": disk_mb, "ram_mb": ram_mb}]
+    for index_type, build_params, search_sweep in SWEEPS:
+        start = time.perf_counter()
+        index = build_faiss_index(embeddings, index_type, build_params)
+        build_s = time.perf_counter() - start
+        disk_mb, ram_mb = index_size_mb(index)
+        for search_params in search_sweep:
+            set_search_params(index, search_params)
+            found, ms = timed_search(index, queries, args.k)
+            recall = recall_at_k(found, truth)
+            label = f"{index_type} {build_params} {search_params}"
+            print(f"{label:<36} recall={recall:.3f}  {ms:7.3f} ms/query  {format_size(disk_mb, ram_mb)}  "
+                  f"(build {build_s:.1f}s)")
+            results.append({
+                "type": index_type,
+                "params": {**build_params, **search_params},
+                "recall": recall,
+                "ms_per_query": ms,
+                "build_s": build_s,
+                "disk_mb": disk_mb,
+                "ram_mb": ram_mb,
+            })
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"k": args.k, "corpus_size": len(embeddings), "results": results}, f, indent=2)
+        print(f"Saved results to {args.json}")
+
+
+if __name__ == "__main__":
+    main()
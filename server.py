@@ -0,0 +1,70 @@
+"""
+HTTP query service for the RAG chatbot (for the portal, WhatsApp integration, etc.).
+
+    python server.py --port 8000
+
+Endpoints:
+- POST /query   {"question": "...", "top_k": 4, "filters": {"doc_type": "pdf"}, "collections": ["library"]}
+                ->  {"answer", "sources", "cached", "timings"}
+                filters (optional) on doc_name, source, doc_type ("pdf"/"html") and tags: a value or a list
+                collections (optional): the collections to search, all by default
+- GET  /healthz  the process is up
+- GET  /readyz   200 once the index has finished loading, 503 before (also reports the index version
+                 and the chunks and version of every collection)
+- GET  /stats    micro-batching (queue depth, batch sizes, wait time), cache statistics
+                 and p50/p95/p99 latency of every pipeline stage (and of every collection's search)
+"""
+
+import argparse
+import asyncio
+from dotenv import load_dotenv
+load_dotenv()
+
+from src.config import (
+    TOP_K, GROQ_MODEL, SERVICE_HOST, SERVICE_PORT, SERVICE_RETRIEVAL_WORKERS, SERVICE_MAX_INFLIGHT_LLM,
+    SERVICE_MICRO_BATCHING, EMBED_BATCH_MAX_SIZE, EMBED_BATCH_MAX_WAIT_MS, INDEX_RELOAD_INTERVAL_S
+)
+from src.service import RagService
+from src.startup import load_components as load_rag_components, reload_index, Components
+
+
+def load_components():
+    """Loads everything the service shares between requests, and prints where the time went."""
+    timings = {}
+    components = load_rag_components(timings)
+    batcher = None
+    if SERVICE_MICRO_BATCHING:
+        # No fixed index: each request searches the index version it started with
+        from src.embedder import EmbeddingBatcher
+        batcher = EmbeddingBatcher(components["embedder"], EMBED_BATCH_MAX_SIZE, EMBED_BATCH_MAX_WAIT_MS,
+                                   query_cache=components["query_cache"])
+    for name, seconds in timings.items():
+        print(f"  {name:<30} {seconds:6.2f}s")
+    return Components(components, batcher=batcher)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve the RAG chatbot over HTTP.")
+    parser.add_argument("--host", default=SERVICE_HOST)
+    parser.add_argument("--port", type=int, default=SERVICE_PORT)
+    parser.add_argument("--retrieval-workers", type=int, default=SERVICE_RETRIEVAL_WORKERS)
+    parser.add_argument("--max-inflight-llm", type=int, default=SERVICE_MAX_INFLIGHT_LLM)
+    args = parser.parse_args()
+
+    service = RagService(
+        load_components,
+        top_k=TOP_K,
+        groq_model=GROQ_MODEL,
+        retrieval_workers=args.retrieval_workers,
+        max_inflight_llm=args.max_inflight_llm,
+        reload_components=reload_index,
+        reload_interval_s=INDEX_RELOAD_INTERVAL_S,
+    )
+    try:
+        asyncio.run(service.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        print("Stopped.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+import os
+import json
+import time
+import atexit
+import hashlib
+import weakref
+import threading
+from collections import OrderedDict
+import numpy as np
+
+_open_caches = weakref.WeakSet() # caches with a path, flushed when the process exits
+
+def index_version(chunks: list) -> str:
+    """
+    Short fingerprint of an index, taken from its chunk ids (chunks can be chunk dicts or just their ids).
+    Chunk ids are derived from chunk content, so any rebuild that changes the chunks changes it.
+    """
+    h = hashlib.sha1()
+    for chunk in chunks:
+        h.update((chunk if isinstance(chunk, str) else chunk["id"]).encode("utf-8"))
+        h.update(b"\n")
+    return h.hexdigest()[:16]
+
+def _normalize(vector) -> np.ndarray:
+    vector = np.asarray(vector, dtype="float32").reshape(-1)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm > 0 else vector
+
+class AnswerCache:
+    """
+    Semantic cache of generated answers.
+
+    A new question reuses a stored answer when the cosine similarity of the two
+    query embeddings is at least `threshold`, so "application deadline?" can be
+    answered from "when is the last date to apply" without calling Groq again.
+
+    Entries expire after ttl_seconds, the least recently used are evicted past
+    max_entries, and entries made for another index version are never returned.
+
+    If path is set, the cache is loaded from and saved to that .npz file. New answers are
+    saved together, at most once every save_interval_s seconds (and at exit), and the file
+    keeps only the ids of their source chunks: resolve(ids) turns them back into chunk dicts
+    when a loaded answer is used.
+    """
+
+    def __init__(self, index_version: str, threshold: float = 0.92, max_entries: int = 1000,
+                 ttl_seconds: float = 24 * 3600, path: str = None, resolve=None, save_interval_s: float = 30.0):
+        self.index_version = index_version
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self.resolve = resolve
+        self.save_interval_s = save_interval_s
+        self.hits = 0
+        self.misses = 0
+        # question -> {"vector", "answer", "source_ids", "sources", "created", "index_version"}
+        # ("sources" is None for answers loaded from the file, until resolved)
+        self._entries = OrderedDict()
+        self._matrix = None # stacked vectors of _entries, rebuilt lazily after inserts/deletes
+        self._matrix_keys = []
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._save_timer = None
+        if path:
+            _open_caches.add(self)
+            if os.path.exists(path):
+                self._load()
+
+    def lookup(self, query_vector):
+        """Returns (answer, sources) of a similar enough cached question, or None."""
+        q = _normalize(query_vector)
+        with self._lock:
+            self._drop_stale()
+            if not self._entries:
+                self.misses += 1
+                return None
+            if self._matrix is None:
+                self._matrix_keys = list(self._entries)
+                self._matrix = np.vstack([self._entries[key]["vector"] for key in self._matrix_keys])
+            similarities = self._matrix @ q
+            best = int(np.argmax(similarities))
+            if similarities[best] < self.threshold:
+                self.misses += 1
+                return None
+            key = self._matrix_keys[best]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            entry = self._entries[key]
+            if entry["sources"] is None:
+                entry["sources"] = self.resolve(entry["source_ids"]) if self.resolve else []
+            return entry["answer"], entry["sources"]
+
+    def store(self, question: str, query_vector, answer: str, sources: list):
+        """Adds an answer, evicting the least recently used entries when full."""
+        with self._lock:
+            self._entries[question] = {
+                "vector": _normalize(query_vector),
+                "answer": answer,
+                "source_ids": [chunk["id"] for chunk in sources],
+                "sources": sources,
+                "created": time.time(),
+                "index_version": self.index_version,
+            }
+            self._entries.move_to_end(question)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+            if self.path:
+                self._dirty = True
+                if self._save_timer is None:
+                    # Answers stored until then are written with this one, in a single save
+                    self._save_timer = threading.Timer(self.save_interval_s, self.flush)
+                    self._save_timer.daemon = True
+                    self._save_timer.start()
+
+    def flush(self):
+        """Saves answers stored since the last save, if any."""
+        with self._lock:
+            self._save_timer = None
+            if self._dirty:
+                self._save()
+                self._dirty = False
+
+    def _drop_stale(self):
+        """Removes expired entries and entries made for another index version."""
+        cutoff = time.time() - self.ttl_seconds
+        stale = [
+            key for key, entry in self._entries.items()
+            if entry["created"] < cutoff or entry["index_version"] != self.index_version
+        ]
+        for key in stale:
+            del self._entries[key]
+        if stale:
+            self._matrix = None
+
+    def _save(self):
+        """Writes the cache to self.path (through a temp file, so a crash can't corrupt it)."""
+        questions = list(self._entries)
+        meta = {
+            "entries": [
+                {"question": q, "answer": e["answer"], "source_ids": e["source_ids"],
+                 "created": e["created"], "index_version": e["index_version"]}
+                for q, e in self._entries.items()
+            ],
+        }
+        vectors = np.vstack([self._entries[q]["vector"] for q in questions]) if questions else np.zeros((0, 0), "float32")
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp.npz"
+        np.savez(tmp_path, vectors=vectors, meta=np.array(json.dumps(meta, ensure_ascii=False)))
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        """Loads entries saved by a previous process, dropping those of another index version."""
+        with np.load(self.path, allow_pickle=False) as data:
+            meta = json.loads(str(data["meta"]))
+            vectors = data["vectors"]
+        for entry, vector in zip(meta["entries"], vectors):
+            self._entries[entry["question"]] = {
+                "vector": vector,
+                "answer": entry["answer"],
+                # Files saved before source ids were used hold the whole chunks
+                "source_ids": entry["source_ids"] if "source_ids" in entry else [s["id"] for s in entry["sources"]],
+                "sources": None,
+                "created": entry["created"],
+                "index_version": entry["index_version"],
+            }
+        self._drop_stale()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+def _flush_all():
+    for cache in list(_open_caches):
+        cache.flush()
+
+atexit.register(_flush_all)
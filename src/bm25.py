@@ -0,0 +1,172 @@
+import math
+import numpy as np
+
+def tokenize(text: str) -> list:
+    """The tokenizer used for both the BM25 corpus and queries."""
+    return text.lower().split()
+
+class SparseBM25:
+    """
+    BM25 (Okapi) keyword index stored as an inverted index in flat NumPy arrays.
+
+    For term t, postings_docs[indptr[t]:indptr[t + 1]] are the chunk positions that
+    contain t and postings_weights[...] their precomputed BM25 term scores
+    (idf * tf * (k1 + 1) / (tf + k1 * (1 - b + b * doc_len / avgdl))).
+    A query only touches the postings of its own terms, instead of looping over every chunk.
+
+    Scores are computed with exactly the same formula and order of operations as
+    rank_bm25.BM25Okapi, so the scores are the same, and so are the rankings except for the order
+    of tied chunks (see top_n). check_bm25.py compares both on random corpora.
+    """
+
+    def __init__(self, vocab: list, indptr, postings_docs, postings_weights, doc_len,
+                 k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        self.vocab = vocab
+        self.term_ids = {term: i for i, term in enumerate(vocab)}
+        self.indptr = indptr
+        self.postings_docs = postings_docs
+        self.postings_weights = postings_weights
+        self.doc_len = doc_len
+        self.corpus_size = len(doc_len)
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+
+    @classmethod
+    def from_corpus(cls, tokenized_corpus: list, k1: float = 1.5, b: float = 0.75, epsilon: float = 0.25):
+        """Builds the index from a list of token lists (one per chunk)."""
+        postings = {} # term -> ([doc positions], [term frequencies]), in order of first appearance
+        doc_len = []
+        for pos, tokens in enumerate(tokenized_corpus):
+            doc_len.append(len(tokens))
+            frequencies = {}
+            for token in tokens:
+                frequencies[token] = frequencies.get(token, 0) + 1
+            for token, freq in frequencies.items():
+                entry = postings.get(token)
+                if entry is None:
+                    entry = postings[token] = ([], [])
+                entry[0].append(pos)
+                entry[1].append(freq)
+
+        corpus_size = len(doc_len)
+        avgdl = sum(doc_len) / corpus_size
+
+        # Same idf as BM25Okapi: negative idfs are replaced by epsilon * average idf
+        idf = []
+        for docs, _ in postings.values():
+            n = len(docs)
+            idf.append(math.log(corpus_size - n + 0.5) - math.log(n + 0.5))
+        average_idf = sum(idf) / len(idf) if idf else 0.0
+        eps = epsilon * average_idf
+        idf = np.array([eps if value < 0 else value for value in idf], dtype="float64")
+
+        vocab = list(postings)
+        lengths = np.array([len(docs) for docs, _ in postings.values()], dtype="int64")
+        indptr = np.zeros(len(vocab) + 1, dtype="int64")
+        np.cumsum(lengths, out=indptr[1:])
+        postings_docs = np.fromiter((d for docs, _ in postings.values() for d in docs), dtype="int32", count=int(indptr[-1]))
+        tf = np.fromiter((f for _, freqs in postings.values() for f in freqs), dtype="float64", count=int(indptr[-1]))
+
+        doc_len = np.array(doc_len, dtype="int64")
+        term_idf = np.repeat(idf, lengths)
+        dl = doc_len[postings_docs]
+        postings_weights = term_idf * (tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avgdl)))
+        return cls(vocab, indptr, postings_docs, postings_weights, doc_len, k1, b, epsilon)
+
+    def _score_candidates(self, query_tokens: list, mask: np.ndarray = None):
+        """
+        Returns (positions, scores) of every chunk that contains at least one query term.
+        With a boolean mask over the chunks, only the chunks it allows are scored.
+        """
+        doc_parts = []
+        weight_parts = []
+        for token in query_tokens: # Repeated query terms count again, like BM25Okapi
+            term = self.term_ids.get(token)
+            if term is None:
+                continue
+            start, end = self.indptr[term], self.indptr[term + 1]
+            doc_parts.append(self.postings_docs[start:end])
+            weight_parts.append(self.postings_weights[start:end])
+        if not doc_parts:
+            return np.zeros(0, dtype="int64"), np.zeros(0, dtype="float64")
+
+        docs = np.concatenate(doc_parts)
+        weights = np.concatenate(weight_parts)
+        if mask is not None:
+            allowed = mask[docs]
+            docs, weights = docs[allowed], weights[allowed]
+        positions, inverse = np.unique(docs, return_inverse=True)
+        scores = np.zeros(len(positions), dtype="float64")
+        np.add.at(scores, inverse, weights) # Adds in query-term order
+        return positions.astype("int64"), scores
+
+    def get_scores(self, query_tokens: list) -> np.ndarray:
+        """BM25 score of every chunk (dense), same as BM25Okapi.get_scores."""
+        scores = np.zeros(self.corpus_size, dtype="float64")
+        positions, candidate_scores = self._score_candidates(query_tokens)
+        scores[positions] = candidate_scores
+        return scores
+
+    def top_n(self, query_tokens: list, n: int, mask: np.ndarray = None):
+        """
+        Returns (positions, scores) of the n best chunks, best first.
+        Like BM25Okapi.get_top_n, chunks without any query term take part with a score of 0: they rank
+        below positive scores and above negative ones (small corpora, where epsilon idfs can be negative).
+        With a boolean mask over the chunks, only the chunks it allows are scored and returned.
+
+        Ties are broken by higher position first, which is what a stable argsort in reverse gives.
+        BM25Okapi's np.argsort is not stable, so with ties its order may differ from this one.
+        """
+        n = min(n, self.corpus_size if mask is None else int(np.count_nonzero(mask)))
+        if n <= 0:
+            return np.zeros(0, dtype="int64"), np.zeros(0, dtype="float64")
+        positions, scores = self._score_candidates(query_tokens, mask)
+
+        # The n highest-position chunks without a query term are enough zero-score contenders
+        wanted = n + len(positions)
+        if mask is None:
+            pool = np.arange(self.corpus_size - 1, max(self.corpus_size - 1 - wanted, -1), -1)
+        else:
+            pool = np.flatnonzero(mask)[::-1][:wanted]
+        zeros = pool[~np.isin(pool, positions)][:n]
+        positions = np.concatenate([positions, zeros])
+        scores = np.concatenate([scores, np.zeros(len(zeros))])
+
+        if len(positions) > n:
+            # Partial sort: only the n best candidates get fully sorted
+            keep = np.argpartition(-scores, n - 1)[:n]
+            # Keep every candidate tied with the n-th score, so tie-breaking stays exact
+            threshold = scores[keep].min()
+            keep = np.flatnonzero(scores >= threshold)
+            positions, scores = positions[keep], scores[keep]
+        order = np.lexsort((-positions, -scores))[:n]
+        return positions[order], scores[order]
+
+    def get_top_n(self, query_tokens: list, documents: list, n: int = 5):
+        """Drop-in replacement for BM25Okapi.get_top_n: returns the n best documents."""
+        positions, _ = self.top_n(query_tokens, n)
+        return [documents[i] for i in positions]
+
+    def save(self, path: str):
+        """Saves the index as plain arrays (.npz, no pickle)."""
+        vocab_blob = np.frombuffer("\n".join(self.vocab).encode("utf-8"), dtype="uint8")
+        np.savez(
+            path,
+            vocab=vocab_blob,
+            indptr=self.indptr,
+            postings_docs=self.postings_docs,
+            postings_weights=self.postings_weights,
+            doc_len=self.doc_len,
+            params=np.array([self.k1, self.b, self.epsilon], dtype="float64"),
+        )
+
+    @classmethod
+    def load(cls, path: str):
+        """Loads an index written by save()."""
+        with np.load(path, allow_pickle=False) as data:
+            vocab_text = data["vocab"].tobytes().decode("utf-8")
+            vocab = vocab_text.split("\n") if vocab_text else []
+            k1, b, epsilon = data["params"].tolist()
+            return cls(vocab, data["indptr"], data["postings_docs"], data["postings_weights"],
+                       data["doc_len"], k1, b, epsilon)
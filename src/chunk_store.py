@@ -0,0 +1,181 @@
+import os
+import json
+import copy
+import mmap
+import operator
+from collections.abc import Sequence
+import numpy as np
+
+from src.metadata_filter import FILTER_FIELDS, doc_type, chunk_field_values
+
+STORE_FORMAT = 1
+TEXT_FILE = "text.bin" # every chunk's text, UTF-8, one after the other
+ROWS_FILE = "rows.npy" # one fixed-size row per chunk (see ROW_FIELDS)
+TABLES_FILE = "tables.json" # document names, sources and tag sets the rows point to, plus rare extra fields
+STORE_FILES = (TEXT_FILE, ROWS_FILE, TABLES_FILE)
+
+# -1 means "not set" for the optional fields
+ROW_FIELDS = [
+    ("text_start", "int64"), ("text_end", "int64"), # byte range of the text in text.bin
+    ("doc", "int32"), ("source", "int32"), ("chunk_id", "int32"),
+    ("start", "int64"), ("end", "int64"), ("page", "int32"), ("tags", "int32"),
+]
+_COLUMNS = ("id", "doc_name", "source", "chunk_id", "text", "start", "end", "page", "tags")
+
+def _is_sha1(chunk_id) -> bool:
+    return isinstance(chunk_id, str) and len(chunk_id) == 40 and all(c in "0123456789abcdef" for c in chunk_id)
+
+def write_chunk_store(chunks: list, path: str):
+    """
+    Saves chunk dicts as a chunk store folder: the texts in one UTF-8 blob, the rest in a NumPy array
+    of fixed-size rows (ids as 20 raw bytes, names and tags as numbers into small tables).
+    Fields other than the usual ones (e.g. "also_in") are kept in tables.json for the few chunks having them.
+    """
+    os.makedirs(path, exist_ok=True)
+    sha1_ids = all(_is_sha1(chunk["id"]) for chunk in chunks)
+    if sha1_ids:
+        # As raw uint8, since NumPy's fixed-size bytes ("S20") would drop trailing zero bytes
+        ids = np.frombuffer(b"".join(bytes.fromhex(chunk["id"]) for chunk in chunks), dtype="uint8").reshape(-1, 20)
+        id_type = ("id", "uint8", (20,))
+    else:
+        ids = np.array([chunk["id"].encode("utf-8") for chunk in chunks])
+        id_type = ("id", ids.dtype)
+    rows = np.zeros(len(chunks), dtype=[id_type] + ROW_FIELDS)
+    rows["id"] = ids
+
+    docs, sources, tag_sets, extras = {}, {}, {}, {}
+    offset = 0
+    with open(os.path.join(path, TEXT_FILE), "wb") as f:
+        for i, chunk in enumerate(chunks):
+            text = chunk["text"].encode("utf-8")
+            f.write(text)
+            row = rows[i]
+            row["text_start"], row["text_end"] = offset, offset + len(text)
+            offset += len(text)
+            row["doc"] = docs.setdefault(chunk["doc_name"], len(docs))
+            row["source"] = sources.setdefault(chunk.get("source", chunk["doc_name"]), len(sources))
+            row["chunk_id"] = chunk["chunk_id"]
+            for key in ("start", "end", "page"):
+                row[key] = chunk[key] if isinstance(chunk.get(key), int) else -1
+            row["tags"] = tag_sets.setdefault(tuple(chunk["tags"]), len(tag_sets)) if chunk.get("tags") else -1
+            extra = {key: value for key, value in chunk.items()
+                     if key not in _COLUMNS or (key in ("start", "end", "page") and not isinstance(value, int))}
+            if extra:
+                extras[str(i)] = extra
+
+    np.save(os.path.join(path, ROWS_FILE), rows)
+    with open(os.path.join(path, TABLES_FILE), "w", encoding="utf-8") as f:
+        json.dump({
+            "format": STORE_FORMAT,
+            "count": len(chunks),
+            "id_format": "sha1" if sha1_ids else "text",
+            "docs": list(docs),
+            "sources": list(sources),
+            "tag_sets": [list(tags) for tags in tag_sets],
+            "extras": extras,
+        }, f, ensure_ascii=False)
+
+class ChunkStore(Sequence):
+    """
+    Read-only list of chunk dicts backed by a chunk store folder (see write_chunk_store).
+    Opening it only maps the files: store[i] reads and decodes chunk i when asked, so a process that
+    answers questions touches the few chunks it returns, and the OS shares the pages between processes.
+    Each store[i] is a new dict, so callers may change it freely.
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, TABLES_FILE), "r", encoding="utf-8") as f:
+            tables = json.load(f)
+        if tables.get("format") != STORE_FORMAT:
+            raise ValueError(f"Unsupported chunk store format {tables.get('format')} in {path}")
+        self.path = path
+        self.rows = np.load(os.path.join(path, ROWS_FILE), mmap_mode="r")
+        if len(self.rows) != tables["count"]:
+            raise ValueError(f"Chunk store {path} has {len(self.rows)} rows, expected {tables['count']}")
+        self.docs = tables["docs"]
+        self.sources = tables["sources"]
+        self.tag_sets = tables["tag_sets"]
+        self.extras = {int(pos): extra for pos, extra in tables["extras"].items()}
+        self._sha1_ids = tables["id_format"] == "sha1"
+        with open(os.path.join(path, TEXT_FILE), "rb") as f:
+            # An empty file can't be mapped (a store of empty texts)
+            self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if os.fstat(f.fileno()).st_size else b""
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, pos):
+        if isinstance(pos, slice):
+            return [self[i] for i in range(*pos.indices(len(self)))]
+        pos = operator.index(pos)
+        if pos < 0:
+            pos += len(self)
+        if not 0 <= pos < len(self):
+            raise IndexError("chunk position out of range")
+        row = self.rows[pos]
+        chunk = {
+            "id": row["id"].tobytes().hex() if self._sha1_ids else row["id"].decode("utf-8"),
+            "doc_name": self.docs[row["doc"]],
+            "source": self.sources[row["source"]],
+            "chunk_id": int(row["chunk_id"]),
+            "text": self._text[row["text_start"]:row["text_end"]].decode("utf-8"),
+        }
+        for key in ("start", "end", "page"):
+            if row[key] >= 0:
+                chunk[key] = int(row[key])
+        if row["tags"] >= 0:
+            chunk["tags"] = list(self.tag_sets[row["tags"]])
+        if pos in self.extras:
+            chunk.update(copy.deepcopy(self.extras[pos]))
+        return chunk
+
+    def ids(self) -> list:
+        """Every chunk id, in order, without decoding the texts."""
+        if self._sha1_ids:
+            blob = np.ascontiguousarray(self.rows["id"]).tobytes()
+            return [blob[i:i + 20].hex() for i in range(0, len(blob), 20)]
+        return [chunk_id.decode("utf-8") for chunk_id in self.rows["id"].tolist()]
+
+    def postings(self) -> dict:
+        """
+        {field: {value: sorted positions}} for the metadata filter fields (see src/metadata_filter.py),
+        built from the row columns instead of one dict per chunk.
+        """
+        def group(column: np.ndarray, names: list) -> dict:
+            order = np.argsort(column, kind="stable")
+            keys, starts = np.unique(column[order], return_index=True)
+            return {names[key]: part for key, part in zip(keys.tolist(), np.split(order, starts[1:])) if key >= 0}
+
+        parts = {field: {} for field in FILTER_FIELDS}
+
+        def add(field, value, positions):
+            parts[field].setdefault(value, []).append(positions)
+
+        for doc_name, positions in group(np.asarray(self.rows["doc"]), self.docs).items():
+            add("doc_name", doc_name, positions)
+            add("doc_type", doc_type(doc_name), positions)
+        for source, positions in group(np.asarray(self.rows["source"]), self.sources).items():
+            add("source", source, positions)
+        for tags, positions in group(np.asarray(self.rows["tags"]), [tuple(t) for t in self.tag_sets]).items():
+            for tag in tags:
+                add("tags", tag, positions)
+        # Chunks with extra fields (e.g. "also_in") may match more values
+        for pos in self.extras:
+            for field, values in chunk_field_values(self[pos]).items():
+                for value in values:
+                    add(field, value, np.array([pos], dtype="int64"))
+        return {
+            field: {value: np.unique(np.concatenate(p)).astype("int64") for value, p in values.items()}
+            for field, values in parts.items()
+        }
+
+def chunk_ids(chunks) -> list:
+    """The ids of a ChunkStore or of a list of chunk dicts."""
+    return chunks.ids() if isinstance(chunks, ChunkStore) else [chunk["id"] for chunk in chunks]
+
+def open_chunks(path: str):
+    """The chunks at path: a ChunkStore for a chunk store folder, else the list in a chunks.json file."""
+    if os.path.isdir(path):
+        return ChunkStore(path)
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
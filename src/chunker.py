@@ -1,15 +1,93 @@
-from langchain_text_splitters import RecursiveCharacterTextSplitter
+from bisect import bisect_left, bisect_right
+
+SEPARATORS = ["\n\n", "\n", ".", " ", ""]
+
+def _cut(text: str, start: int, end: int, separator: str) -> list:
+    """
+    Boundaries of the pieces of text[start:end] when it is cut before every separator
+    (so each piece after the first starts with its separator): piece k is bounds[k]:bounds[k + 1].
+    """
+    if not separator:
+        return list(range(start, end + 1))
+    bounds = [start]
+    # Like str.split, look for the next separator after the end of the last one found
+    found = text.find(separator, start, end)
+    while found != -1:
+        bounds.append(found)
+        found = text.find(separator, found + len(separator), end)
+    bounds.append(end)
+    return bounds
+
+def _emit(text: str, start: int, end: int, out: list):
+    """Adds text[start:end] without surrounding whitespace (like str.strip()) to out, unless it's empty."""
+    while start < end and text[start].isspace():
+        start += 1
+    while end > start and text[end - 1].isspace():
+        end -= 1
+    if end > start:
+        out.append((start, end))
+
+def _merge(text: str, bounds: list, chunk_size: int, overlap: int, out: list):
+    """
+    Packs consecutive pieces (each shorter than chunk_size) into chunks of at most chunk_size characters,
+    starting each new chunk with the last pieces of the previous one, up to overlap characters.
+    The pieces are contiguous, so a run of them is measured by its boundaries instead of adding up lengths.
+    """
+    n = len(bounds) - 1
+    lo = 0
+    while True:
+        # Take pieces lo..hi-1: all that fit in chunk_size
+        hi = min(bisect_right(bounds, bounds[lo] + chunk_size, lo + 1) - 1, n)
+        _emit(text, bounds[lo], bounds[hi], out)
+        if hi == n:
+            return
+        # Drop pieces from the front until what's left fits in overlap and leaves room for piece hi
+        lo = bisect_left(bounds, max(bounds[hi] - overlap, bounds[hi + 1] - chunk_size), lo, hi)
+
+def _split(text: str, start: int, end: int, separators: list, chunk_size: int, overlap: int, out: list):
+    # Use the first separator that occurs in this part of the text
+    separator, finer = separators[-1], []
+    for i, candidate in enumerate(separators):
+        if not candidate:
+            separator = candidate
+            break
+        if text.find(candidate, start, end) != -1:
+            separator, finer = candidate, separators[i + 1:]
+            break
+
+    # Merge runs of small pieces, split the big ones further with the next separators
+    bounds = _cut(text, start, end, separator)
+    big = [i for i in range(len(bounds) - 1) if bounds[i + 1] - bounds[i] >= chunk_size]
+    first = 0
+    for i in big:
+        if i > first:
+            _merge(text, bounds[first:i + 1], chunk_size, overlap, out)
+        if finer:
+            _split(text, bounds[i], bounds[i + 1], finer, chunk_size, overlap, out)
+        else:
+            out.append((bounds[i], bounds[i + 1]))
+        first = i + 1
+    if first < len(bounds) - 1:
+        _merge(text, bounds[first:], chunk_size, overlap, out)
+
+def chunk_spans(text: str, chunk_size: int, overlap: int, separators: list = SEPARATORS) -> list:
+    """
+    Splits text into overlapping chunks and returns their (start, end) character offsets,
+    so chunk i is text[start:end].
+
+    Same rules (and same chunks) as LangChain's RecursiveCharacterTextSplitter with these separators:
+    split on the first separator found (keeping it at the start of the next piece), merge pieces up to
+    chunk_size with up to overlap characters repeated, split pieces that are too big with the next
+    separator, and strip whitespace around each chunk. It works on offsets, so no chunk text is
+    copied until the chunks are cut out.
+    """
+    out = []
+    _split(text, 0, len(text), separators, chunk_size, overlap, out)
+    return out
 
 def chunk_text(text: str, chunk_size: int, overlap: int):
     """
-    Splits a long text into smaller overlapping pieces using RecursiveCharacterTextSplitter.
+    Splits a long text into smaller overlapping pieces.
     This respects paragraph and sentence boundaries better than simple splitting.
     """
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=overlap,
-        separators=["\n\n", "\n", ".", " ", ""],
-        length_function=len,
-    )
-    
-    return splitter.split_text(text)
+    return [text[start:end] for start, end in chunk_spans(text, chunk_size, overlap)]
@@ -2,21 +2,130 @@ import os
 
 # Path of folder containing data
 DATA_DIR = "data"
+HTML_DIR = os.path.join(DATA_DIR, "html files")
 
-# Local Vector DB paths
+# Local Vector DB: every build is saved to its own folder vectordb/versions/<version>/ holding these
+# files, then published by rewriting vectordb/CURRENT (see src/index_versions.py)
 VECTOR_DB_DIR = "vectordb"
-FAISS_INDEX_PATH = os.path.join(VECTOR_DB_DIR, "index.faiss")
-CHUNKS_PATH = os.path.join(VECTOR_DB_DIR, "chunks.json")
+FAISS_INDEX_FILE = "index.faiss"
+CHUNK_STORE_DIR = "chunks" # Chunk texts and metadata, memory-mapped by the apps (see src/chunk_store.py)
+CHUNKS_FILE = "chunks.json" # The same as JSON, as written by builds before the chunk store
+MANIFEST_FILE = "manifest.json" # File hashes of the build
+DUPLICATES_FILE = "duplicates.json" # Chunks left out as near-duplicates of an indexed one
+LINES_FILE = "lines.npz" # Line hashes of each HTML page, to find boilerplate without re-reading unchanged pages
+CHECKPOINT_FILE = "checkpoint.json" # How far the embedding of an unfinished build got, to resume it
+INDEX_KEEP_VERSIONS = 2 # builds kept on disk: the current one and the one before (for processes still using it)
+INDEX_RELOAD_INTERVAL_S = 10 # how often running apps check for a newly published build, 0 = never
+INDEX_VERIFY_CHECKSUMS = False # check every file's SHA-256 when loading a build (sizes are always checked)
+
+# Collections: named shards of the corpus, each built, stored (vectordb/collections/<name>/) and reloaded
+# on its own, and searched in parallel. {name: [glob patterns on the path under DATA_DIR]}, e.g.
+# {"library": ["library/*"], "departments": ["html files/dept-*"]}; the first match wins.
+# Files matching no pattern belong to DEFAULT_COLLECTION, which is stored in VECTOR_DB_DIR itself.
+COLLECTIONS = {}
+DEFAULT_COLLECTION = "main"
+SHARD_SEARCH_WORKERS = 8 # threads searching shards in parallel
+
+# Loading (number of worker processes used to parse PDF/HTML files, 1 = no multiprocessing)
+# (the cores this process may run on, which can be fewer than the machine's in a container)
+LOAD_WORKERS = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else (os.cpu_count() or 1)
 
 # Chunking
 CHUNK_SIZE = 900 #characters per chunk about 150 to 200 words
 CHUNK_OVERLAP = 150 #characters overlap between chunks
 
+# De-duplication at build time (src/dedup.py)
+# Boilerplate found on at least BOILERPLATE_MIN_PAGES HTML pages is kept on the first only (0 = off). Only
+# runs of BOILERPLATE_MIN_LINES consecutive lines (menus, footers) and lines of BOILERPLATE_MIN_CHARS characters
+# or more count, and only at the top and bottom of a page: short lines that merely repeat ("Yes", "2024",
+# "Eligibility" in tables) and anything in the body of a page are never removed
+BOILERPLATE_MIN_PAGES = 5
+BOILERPLATE_MIN_LINES = 3
+BOILERPLATE_MIN_CHARS = 40
+DEDUP_NEAR_DUPLICATES = True # index one chunk per group of near-identical chunks (others are listed in its "also_in")
+DEDUP_JACCARD = 0.9 # chunks sharing at least this share of their word 3-grams are near-duplicates
+
+# Streaming build (embeddings are written straight to disk, see build_and_save_index_from_folder)
+BUILD_MEMORY_BUDGET_MB = 1024 # most memory used at once for embedding rows copied or added to FAISS
+BUILD_CHECKPOINT_CHUNKS = 2048 # chunks embedded between checkpoints: an interrupted build resumes from the last one
+
+# FAISS index: "flat_ip" (exact cosine), "flat_l2" (exact L2), "hnsw" or "ivf_flat" (approximate, cosine),
+# "flat_f16", "sq8" or "pq" (compressed vectors: 2x, 4x and ~32x smaller than float32)
+# Run evaluate_index.py to measure recall and size of each type on your corpus.
+FAISS_INDEX_TYPE = "flat_ip"
+FAISS_MMAP = True # memory-map the index when the apps load it (instant open, pages shared between processes)
+FAISS_INDEX_PARAMS = {
+    "hnsw": {"M": 32, "efConstruction": 200, "efSearch": 64},
+    "ivf_flat": {"nlist": 256, "nprobe": 16},
+    "flat_f16": {},
+    # rerank: re-score rerank_factor x more candidates with the float32 vectors (memory-mapped embeddings.npy)
+    "sq8": {"rerank": True, "rerank_factor": 4},
+    "pq": {"M": 48, "nbits": 8, "rerank": True, "rerank_factor": 16},
+}
+
 # Retrieval
 TOP_K = 4
+FAISS_FETCH_MULTIPLIER = 2 # FAISS candidates per query = TOP_K * this
+BM25_FETCH_MULTIPLIER = 2 # BM25 candidates per query = TOP_K * this
+RRF_K = 60 # Reciprocal Rank Fusion constant: score = 1 / (RRF_K + rank)
+QUERY_CACHE_SIZE = 2048 # query embeddings kept in memory (shared by all sessions of a process)
+FILTER_EXACT_MAX = 4096 # filters matching at most this many chunks score them all directly instead of searching FAISS
+
+# Tags for filtering, assigned to files at build time: {glob pattern on the path under DATA_DIR: [tags]},
+# e.g. {"*Admission*": ["admissions"], "html files/*program*": ["programs"]}
+DOC_TAGS = {}
+
+# Prompt context: retrieved chunks are merged (neighbours of the same document), de-duplicated
+# and packed best first into this many (estimated) tokens
+CONTEXT_TOKEN_BUDGET = 2000
+CONTEXT_DEDUP_THRESHOLD = 0.8 # drop a passage when this share of its word 3-grams is already in the prompt
+
+# Answer cache: reuse answers of questions whose embeddings are at least this similar (cosine)
+ANSWER_CACHE_ENABLED = True
+ANSWER_CACHE_THRESHOLD = 0.92
+ANSWER_CACHE_SIZE = 1000 # answers kept, least recently used are evicted
+ANSWER_CACHE_TTL = 24 * 3600 # seconds
+ANSWER_CACHE_PATH = os.path.join(".cache", "answers.npz") # None = keep in memory only
+ANSWER_CACHE_SAVE_INTERVAL_S = 30 # new answers are written to ANSWER_CACHE_PATH together, at most this often
 
 # Embeddings
 EMBED_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+EMBED_BATCH_SIZE = 64 # chunks per encode() call
+
+# Embedding cache (reused across builds, cleared automatically when EMBED_MODEL_NAME changes)
+EMBED_CACHE_DIR = os.path.join(".cache", "embeddings")
+EMBED_CACHE_MAX_ENTRIES = 200_000 # rows kept on disk, least recently used are evicted (changing it keeps the newest)
 
 # Groq model
 GROQ_MODEL = "llama-3.3-70b-versatile"
+
+# Groq call policy (timeouts, retries, hedging, fallback), see src/llm_policy.py
+GROQ_FALLBACK_MODEL = "llama-3.1-8b-instant" # used while GROQ_MODEL is rate limited or timing out, None = off
+GROQ_TIMEOUT_S = 20 # per attempt
+GROQ_DEADLINE_S = 45 # per question, retries included
+GROQ_MAX_RETRIES = 3
+GROQ_BACKOFF_BASE_S = 0.5 # retry waits are random in [0, base * 2^attempt], at least the server's Retry-After
+GROQ_BACKOFF_MAX_S = 8
+GROQ_HEDGE_AFTER_S = None # e.g. 5: send a duplicate request if the first hasn't answered by then, None = off
+
+# Batch question answering (batch_answer.py); the defaults match Groq's free tier limits
+BATCH_RPM = 30 # Groq requests per minute
+BATCH_TPM = 6000 # Groq tokens per minute (prompt + completion)
+BATCH_CONCURRENCY = 8 # Groq calls in flight
+BATCH_BLOCK_SIZE = 256 # questions embedded and searched in FAISS together
+BATCH_EXPECTED_COMPLETION_TOKENS = 300 # reserved per call until the real usage is known
+
+# Tracing (time spent in each stage of every question)
+TRACING_ENABLED = True
+TRACE_LOG_PATH = os.path.join("logs", "traces.jsonl") # one JSON line per question, None = print them
+TRACE_WINDOW = 1000 # recent questions used for the p50/p95/p99 of each stage
+TRACE_QUEUE_SIZE = 10000 # trace lines waiting for the background writer before new ones are dropped
+
+# HTTP service (server.py)
+SERVICE_HOST = "0.0.0.0"
+SERVICE_PORT = 8000
+SERVICE_RETRIEVAL_WORKERS = 4 # threads for embedding + FAISS/BM25 search
+SERVICE_MAX_INFLIGHT_LLM = 8 # Groq calls running at the same time
+SERVICE_MICRO_BATCHING = True # embed + FAISS-search concurrent questions together
+EMBED_BATCH_MAX_SIZE = 32 # most queries per micro-batch
+EMBED_BATCH_MAX_WAIT_MS = 5 # how long the first query waits for others to join
@@ -0,0 +1,106 @@
+import re
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for English text (~4 characters per token), good enough for budgeting."""
+    return (len(text) + 3) // 4
+
+def merge_overlap(left: str, right: str, max_overlap: int, min_overlap: int = 10) -> str:
+    """
+    Joins two consecutive chunks of a document.
+    The splitter starts each chunk with the last CHUNK_OVERLAP characters (or so) of the previous one,
+    so the longest end of `left` that `right` starts with is sent only once.
+    """
+    for size in range(min(len(left), len(right), max_overlap), min_overlap - 1, -1):
+        if left.endswith(right[:size]):
+            return left + right[size:]
+    return left + "\n" + right
+
+def join_neighbours(text: str, left: dict, right: dict, max_overlap: int) -> str:
+    """
+    Appends chunk `right` to `text`, which ends with chunk `left`, the chunk before it in the same document.
+    Chunks that carry their character offsets ("start", "end") overlap by exactly left end - right start;
+    for indexes built without offsets, the overlap is searched for with merge_overlap.
+    """
+    if "end" in left and "start" in right:
+        overlap = left["end"] - right["start"]
+        return text + right["text"][overlap:] if overlap > 0 else text + "\n" + right["text"]
+    return merge_overlap(text, right["text"], max_overlap)
+
+def _shingles(text: str, size: int = 3) -> set:
+    words = re.findall(r"\w+", text.lower())
+    if len(words) < size:
+        return {tuple(words)}
+    return {tuple(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+def _is_near_duplicate(shingles: set, kept: list, threshold: float) -> bool:
+    """True if most of the shorter text's word 3-grams also appear in a kept text."""
+    for other in kept:
+        smaller = min(len(shingles), len(other))
+        if smaller and len(shingles & other) / smaller >= threshold:
+            return True
+    return False
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cuts text to about max_tokens, at a word boundary."""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[:cut if cut > 0 else max_chars]
+
+def pack_context(chunks: list, token_budget: int, max_overlap: int, dedup_threshold: float = 0.8) -> list:
+    """
+    Turns retrieved chunks (best first) into the context passages sent to the LLM:
+    1. Chunks with consecutive chunk_ids from the same document become one passage,
+       with the overlap between them removed.
+    2. Passages that mostly repeat a better-ranked one (same page crawled twice, etc.) are dropped.
+    3. Passages are added best first while they fit in token_budget (the first one is cut to fit if needed).
+
+    A passage ranks as well as its best chunk. Returns a list of
+    {"doc_name", "source", "chunk_ids", "text", "tokens"} in relevance order.
+    """
+    # 1. Group into runs of consecutive chunk ids per document
+    by_doc = {}
+    for rank, chunk in enumerate(chunks):
+        members = by_doc.setdefault(chunk["doc_name"], {})
+        if chunk["chunk_id"] not in members:
+            members[chunk["chunk_id"]] = (rank, chunk)
+
+    passages = []
+    for doc_name, members in by_doc.items():
+        run = []
+        for chunk_id in sorted(members) + [None]:
+            if run and (chunk_id is None or chunk_id != run[-1] + 1):
+                text = members[run[0]][1]["text"]
+                for prev_id, next_id in zip(run, run[1:]):
+                    text = join_neighbours(text, members[prev_id][1], members[next_id][1], max_overlap)
+                passages.append({
+                    "rank": min(members[i][0] for i in run),
+                    "doc_name": doc_name,
+                    "source": members[run[0]][1].get("source", doc_name),
+                    "chunk_ids": list(run),
+                    "text": text,
+                })
+                run = []
+            if chunk_id is not None:
+                run.append(chunk_id)
+    passages.sort(key=lambda p: p["rank"])
+
+    # 2 + 3. Drop near duplicates, fill the budget in relevance order
+    packed, kept_shingles, used = [], [], 0
+    for passage in passages:
+        shingles = _shingles(passage["text"])
+        if _is_near_duplicate(shingles, kept_shingles, dedup_threshold):
+            continue
+        tokens = estimate_tokens(passage["text"])
+        if used + tokens > token_budget:
+            if packed:
+                continue # a later, shorter passage may still fit
+            passage["text"] = _truncate(passage["text"], token_budget)
+            tokens = estimate_tokens(passage["text"])
+        del passage["rank"]
+        passage["tokens"] = tokens
+        packed.append(passage)
+        kept_shingles.append(shingles)
+        used += tokens
+    return packed
@@ -0,0 +1,188 @@
+import hashlib
+import numpy as np
+
+from src.bm25 import tokenize
+
+# --- Boilerplate lines (menus, footers, banners repeated on many HTML pages) ---
+# A short line found on many pages is not boilerplate by itself: table cells and headings like "Yes",
+# "2024" or "Eligibility" repeat across program pages too. So the pieces compared between pages are
+# runs of min_lines consecutive lines (a menu or footer repeats as a whole) and single long lines
+# (a copyright or address line), and they are only removed from the top and bottom of a page, where
+# menus, headers and footers are: shared lines in the body of a page (a fee table) are kept.
+
+def line_hash(line: str) -> int:
+    """64-bit hash of one line of text."""
+    return int.from_bytes(hashlib.blake2b(line.encode("utf-8"), digest_size=8).digest(), "little")
+
+def _blocks(lines: list, min_lines: int, min_chars: int) -> list:
+    """
+    The pieces of a page that can be boilerplate, as (hash, line numbers): every run of min_lines consecutive
+    non-blank lines, and every line of at least min_chars characters on its own (blank lines are skipped).
+    """
+    content = [(i, line.strip()) for i, line in enumerate(lines) if line.strip()]
+    blocks = []
+    for j, (i, line) in enumerate(content):
+        if len(line) >= min_chars:
+            blocks.append((line_hash(line), [i]))
+        if j + min_lines <= len(content):
+            run = content[j:j + min_lines]
+            blocks.append((line_hash("\n".join(text for _, text in run)), [k for k, _ in run]))
+    return blocks
+
+def block_hashes(text: str, min_lines: int = 3, min_chars: int = 40) -> np.ndarray:
+    """The distinct boilerplate candidates of a text (see _blocks), as sorted uint64 hashes."""
+    hashes = {h for h, _ in _blocks(text.splitlines(), min_lines, min_chars)}
+    return np.array(sorted(hashes), dtype="uint64")
+
+def find_boilerplate(page_lines: dict, min_pages: int):
+    """
+    Finds the blocks (runs of lines or long lines) that appear on at least min_pages pages.
+    page_lines is {page: block_hashes(text)}. Returns (boilerplate, strip) where boilerplate holds the
+    hashes of those blocks and strip is {page: hashes to remove from that page}: every page but the
+    first one (in sorted order) that has a block loses it, so its text is still indexed once.
+    """
+    pages = sorted(page_lines)
+    if not pages or min_pages <= 0:
+        return np.zeros(0, dtype="uint64"), {}
+    hashes = np.concatenate([page_lines[p] for p in pages])
+    page_ids = np.repeat(np.arange(len(pages)), [len(page_lines[p]) for p in pages])
+    unique, first, counts = np.unique(hashes, return_index=True, return_counts=True)
+    boilerplate = unique[counts >= min_pages]
+
+    # page_ids are sorted, so the first occurrence of a hash is its owner
+    is_common = np.isin(hashes, boilerplate)
+    owner = np.zeros(len(hashes), dtype=bool)
+    owner[first] = True
+    remove = is_common & ~owner
+    strip = {}
+    for i in np.unique(page_ids[remove]).tolist():
+        strip[pages[i]] = hashes[remove & (page_ids == i)]
+    return boilerplate, strip
+
+def strip_signature(hashes) -> str:
+    """Short fingerprint of the set of lines removed from a page ("" for none), to tell when it changes."""
+    if hashes is None or len(hashes) == 0:
+        return ""
+    return hashlib.sha1(np.sort(hashes).astype("uint64").tobytes()).hexdigest()[:16]
+
+def strip_lines(text: str, hashes, min_lines: int = 3, min_chars: int = 40) -> tuple:
+    """
+    Removes the blocks whose hash is in hashes (see _blocks, with the same min_lines and min_chars as
+    block_hashes) from the top and the bottom of a text: the lines before the first line and after the last
+    line that isn't in one of them. Returns (text, number of lines removed).
+    """
+    if hashes is None or len(hashes) == 0:
+        return text, 0
+    remove = set(int(h) for h in hashes)
+    lines = text.splitlines()
+    covered = set()
+    for h, line_numbers in _blocks(lines, min_lines, min_chars):
+        if h in remove:
+            covered.update(line_numbers)
+    content = [i for i, line in enumerate(lines) if line.strip()]
+    removed = set()
+    for edge in (content, content[::-1]):
+        for i in edge:
+            if i not in covered:
+                break
+            removed.add(i)
+    kept = [line for i, line in enumerate(lines) if i not in removed]
+    return "\n".join(kept), len(lines) - len(kept)
+
+# --- Near-duplicate chunks (MinHash signatures + LSH, checked with Jaccard) ---
+
+SHINGLE_SIZE = 3 # words per shingle
+MINHASH_BANDS = 8 # LSH bands...
+MINHASH_ROWS = 8 # ...of this many MinHash values each (64 in all)
+
+def _rotl(x: np.ndarray, r: int) -> np.ndarray:
+    return (x << np.uint64(r)) | (x >> np.uint64(64 - r))
+
+def shingles(tokens: np.ndarray) -> np.ndarray:
+    """Distinct hashes of the word 3-grams of a chunk, given its token hashes (a short chunk is one shingle)."""
+    if len(tokens) < SHINGLE_SIZE:
+        return np.array([np.bitwise_xor.reduce(tokens)] if len(tokens) else [0], dtype="uint64")
+    return np.unique(tokens[:-2] ^ _rotl(tokens[1:-1], 21) ^ _rotl(tokens[2:], 42))
+
+def _token_hashes(text: str) -> np.ndarray:
+    """The tokens of a text (as in BM25) as uint64 hashes. Python's hash() is fast but differs between
+    processes, which is fine: signatures are only compared within one build."""
+    return np.array([hash(token) for token in tokenize(text)], dtype="int64").view("uint64")
+
+def minhash(shingle_sets: list, n_hashes: int = MINHASH_BANDS * MINHASH_ROWS, block: int = 50_000) -> np.ndarray:
+    """
+    MinHash signatures, one row of n_hashes values per chunk: value k is the smallest of the chunk's shingles
+    under the k-th hash function. Two chunks have the same value k with probability equal to the Jaccard
+    similarity of their shingle sets. Computed for blocks of about `block` shingles at a time.
+    """
+    rng = np.random.default_rng(0)
+    a = rng.integers(1, 2**63, (n_hashes, 1), dtype="uint64") | np.uint64(1)
+    b = rng.integers(0, 2**63, (n_hashes, 1), dtype="uint64")
+    signatures = np.zeros((n_hashes, len(shingle_sets)), dtype="uint64")
+    start = 0
+    while start < len(shingle_sets):
+        end, size = start, 0
+        while end < len(shingle_sets) and (size == 0 or size + len(shingle_sets[end]) <= block):
+            size += len(shingle_sets[end])
+            end += 1
+        parts = shingle_sets[start:end]
+        values = np.concatenate(parts)[None, :] * a + b # multiply-add modulo 2^64
+        offsets = np.cumsum([0] + [len(p) for p in parts[:-1]])
+        signatures[:, start:end] = np.minimum.reduceat(values, offsets, axis=1)
+        start = end
+    return signatures.T
+
+def _jaccard(a: np.ndarray, b: np.ndarray) -> float:
+    inter = len(np.intersect1d(a, b, assume_unique=True))
+    return inter / (len(a) + len(b) - inter)
+
+def find_near_duplicates(texts: list, min_jaccard: float = 0.9) -> np.ndarray:
+    """
+    Groups near-identical texts. Returns rep where rep[i] is the text that i duplicates (the first of its
+    group, in list order: put preferred representatives first), or i itself.
+
+    Comparing every pair would be quadratic, so the MinHash signatures are cut into bands and only texts with
+    an identical band are compared (locality-sensitive hashing): pairs with Jaccard 0.9 share a band ~99% of the
+    time, pairs with Jaccard 0.5 only ~3%. Candidates are then confirmed by their exact Jaccard similarity.
+    """
+    n = len(texts)
+    if n < 2:
+        return np.arange(n)
+    # Identical texts are grouped right away; only one of each is fingerprinted
+    first_of = {}
+    same_as = np.array([first_of.setdefault(text, i) for i, text in enumerate(texts)])
+    distinct = np.flatnonzero(same_as == np.arange(n))
+    shingle_sets = [shingles(_token_hashes(texts[i])) for i in distinct.tolist()]
+    signatures = minhash(shingle_sets)
+
+    parent = list(range(len(distinct)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    checked = set()
+    for band in range(MINHASH_BANDS):
+        rows = signatures[:, band * MINHASH_ROWS:(band + 1) * MINHASH_ROWS]
+        _, keys = np.unique(rows, axis=0, return_inverse=True)
+        keys = keys.ravel()
+        shared = np.flatnonzero(np.bincount(keys) > 1)
+        if len(shared) == 0:
+            continue
+        members = np.flatnonzero(np.isin(keys, shared))
+        order = members[np.argsort(keys[members], kind="stable")]
+        bounds = np.flatnonzero(np.diff(keys[order])) + 1
+        for group in np.split(order, bounds):
+            # Every member against the group's first: enough to join the group, without comparing all pairs
+            for j in group[1:].tolist():
+                i = int(group[0])
+                if (i, j) in checked or find(i) == find(j):
+                    continue
+                checked.add((i, j))
+                if _jaccard(shingle_sets[i], shingle_sets[j]) >= min_jaccard:
+                    ri, rj = find(i), find(j)
+                    parent[max(ri, rj)] = min(ri, rj) # the earliest text stays the representative
+
+    return distinct[[find(k) for k in range(len(distinct))]][np.searchsorted(distinct, same_as)]
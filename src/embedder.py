@@ -1,15 +1,215 @@
-from sentence_transformers import SentenceTransformer
+import time
+import queue
+import threading
+from concurrent.futures import Future
+import numpy as np
+from src.embedding_cache import text_key
+from src.vector_store import prepare_query
 
 def get_embedder(model_name: str):
     """
     The model converts text into numerical vectors (embeddings).
     Similar texts will have similar vectors.
     """
+    # Imported here: sentence-transformers pulls in torch, which takes seconds to import
+    from sentence_transformers import SentenceTransformer
     return SentenceTransformer(model_name)
 
-def embed_texts(embedder, texts):
+def embed_texts(embedder, texts, cache=None, batch_size: int = 32, progress: bool = True):
     """
     Takes a list of text strings and converts them into vectors.
     Returns a numpy array where each row is an embedding for one text.
+
+    If an EmbeddingCache is given, only texts that are not cached yet
+    are sent to the model (in batches of batch_size), and their vectors are added to the cache.
+    progress=False hides the progress bar and cache counts (for callers reporting progress themselves).
+    """
+    if cache is None:
+        return embedder.encode(texts, convert_to_numpy=True, show_progress_bar=progress, batch_size=batch_size)
+
+    keys = [text_key(t) for t in texts]
+    vectors, missing = cache.lookup(keys)
+    if progress:
+        print(f"Embedding cache: {len(texts) - len(missing)} hits, {len(missing)} misses")
+
+    # Embed each distinct missing text once
+    first_pos = {}
+    for i in missing:
+        first_pos.setdefault(keys[i], i)
+    if first_pos:
+        miss_keys = list(first_pos)
+        miss_texts = [texts[first_pos[k]] for k in miss_keys]
+        new_vectors = embedder.encode(miss_texts, convert_to_numpy=True, show_progress_bar=progress, batch_size=batch_size)
+        new_vectors = new_vectors.astype("float32")
+        cache.store(miss_keys, new_vectors)
+        by_key = dict(zip(miss_keys, new_vectors))
+        for i in missing:
+            vectors[i] = by_key[keys[i]]
+    cache.flush()
+
+    if not vectors:
+        return np.zeros((0, 0), dtype="float32")
+    return np.vstack(vectors).astype("float32")
+
+def embed_query(embedder, query: str, cache=None):
+    """
+    Embeds a single search query, returning a (1, dim) float32 array.
+    If a QueryEmbeddingCache is given, repeated questions skip the model entirely.
+    """
+    if cache is not None:
+        vector = cache.get(query)
+        if vector is not None:
+            return vector
+    vector = embedder.encode([query], convert_to_numpy=True).astype("float32")
+    if cache is not None:
+        cache.put(query, vector)
+    return vector
+
+class EmbeddingBatcher:
+    """
+    Dynamic micro-batching of query embeddings across concurrent users.
+
+    Callers (from any thread) submit one query each. A background thread waits up to
+    max_wait_ms after the first query for more to arrive (up to max_batch_size), embeds
+    them all with one encode() call and, if an index is set, runs one batched index.search
+    for the whole batch. Each caller's Future then gets its own (vector, faiss_ids) back.
+    A query can name the index to search (e.g. the version its request started with); queries
+    for different indexes in one batch get one search per index.
+
+    On CPU a batch of 32 short queries costs little more than one, so under load this
+    multiplies throughput. With a QueryEmbeddingCache, cached queries skip encode()
+    but still join the batched search.
     """
-    return embedder.encode(texts, convert_to_numpy=True, show_progress_bar=True)
+
+    def __init__(self, embedder, max_batch_size: int = 32, max_wait_ms: float = 5.0, index=None,
+                 query_cache=None):
+        self.embedder = embedder
+        self.max_batch_size = max_batch_size
+        self.max_wait_s = max_wait_ms / 1000
+        self.index = index
+        self.query_cache = query_cache
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._queries = 0
+        self._max_batch = 0
+        self._batch_sizes = {} # batch size -> number of batches
+        self._wait_total_s = 0.0
+        self._wait_max_s = 0.0
+        self._encode_total_s = 0.0
+        self._thread = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._thread.start()
+
+    def submit(self, query: str, search_k: int = 0, index=None) -> Future:
+        """
+        Queues a query. The Future resolves to (vector, faiss_ids), where vector has shape (1, dim)
+        and faiss_ids are the ids of the search_k nearest chunks in index (default: self.index),
+        or None if search_k is 0 or there is no index.
+        """
+        future = Future()
+        self._queue.put((query, search_k, index, time.perf_counter(), future))
+        return future
+
+    def embed(self, query: str, search_k: int = 0, index=None):
+        """Blocking version of submit()."""
+        return self.submit(query, search_k, index).result()
+
+    def _collect(self):
+        """Waits for a first query, then gathers more until the batch is full or the window closes."""
+        first = self._queue.get()
+        if first is None: # close()
+            return None
+        batch = [first]
+        deadline = time.perf_counter() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None) # Stop after this batch
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            if batch is None:
+                return
+            # Skip queries whose caller gave up (e.g. a cancelled asyncio task); the others can't be cancelled now
+            batch = [item for item in batch if item[-1].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            started = time.perf_counter()
+            try:
+                results = self._process(batch)
+                for (*_, future), result in zip(batch, results):
+                    future.set_result(result)
+                self._record(batch, started)
+            except Exception as e:
+                # One bad batch fails its own queries, never the thread every later query waits on
+                for *_, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+
+    def _process(self, batch):
+        queries = [query for query, *_ in batch]
+        vectors = [self.query_cache.get(q) if self.query_cache is not None else None for q in queries]
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        if missing:
+            encode_start = time.perf_counter()
+            encoded = self.embedder.encode([queries[i] for i in missing], convert_to_numpy=True).astype("float32")
+            with self._stats_lock:
+                self._encode_total_s += time.perf_counter() - encode_start
+            for i, vector in zip(missing, encoded):
+                vectors[i] = vector[None, :]
+                if self.query_cache is not None:
+                    self.query_cache.put(queries[i], vectors[i])
+        matrix = np.vstack(vectors)
+
+        results = [(matrix[i:i + 1], None) for i in range(len(batch))]
+        groups = {} # id(index) -> (index, rows searching it)
+        for i, (_, search_k, index, _, _) in enumerate(batch):
+            index = self.index if index is None else index
+            if index is not None and search_k > 0:
+                groups.setdefault(id(index), (index, []))[1].append(i)
+        for index, rows in groups.values():
+            k = max(batch[i][1] for i in rows)
+            _, ids = index.search(prepare_query(index, matrix[rows]), k)
+            for row, i in enumerate(rows):
+                results[i] = (matrix[i:i + 1], ids[row, :batch[i][1]])
+        return results
+
+    def _record(self, batch, started: float):
+        waits = [started - submitted for *_, submitted, _ in batch]
+        with self._stats_lock:
+            self._batches += 1
+            self._queries += len(batch)
+            self._max_batch = max(self._max_batch, len(batch))
+            self._batch_sizes[len(batch)] = self._batch_sizes.get(len(batch), 0) + 1
+            self._wait_total_s += sum(waits)
+            self._wait_max_s = max(self._wait_max_s, max(waits))
+
+    def stats(self) -> dict:
+        """Queue depth, batch sizes and time spent waiting for a batch to form."""
+        with self._stats_lock:
+            return {
+                "queue_depth": self._queue.qsize(),
+                "batches": self._batches,
+                "queries": self._queries,
+                "mean_batch_size": self._queries / self._batches if self._batches else 0.0,
+                "max_batch_size": self._max_batch,
+                "batch_sizes": dict(sorted(self._batch_sizes.items())),
+                "mean_wait_ms": 1000 * self._wait_total_s / self._queries if self._queries else 0.0,
+                "max_wait_ms": 1000 * self._wait_max_s,
+                "encode_total_s": self._encode_total_s,
+            }
+
+    def close(self):
+        """Stops the background thread once queued queries are done."""
+        self._queue.put(None)
+        self._thread.join()
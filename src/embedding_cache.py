@@ -0,0 +1,185 @@
+import os
+import re
+import json
+import shutil
+import hashlib
+import unicodedata
+import numpy as np
+
+CACHE_VERSION = 1
+
+def normalize_text(text: str) -> str:
+    """Folds unicode forms and runs of whitespace, which don't change the embedding."""
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+def text_key(text: str) -> bytes:
+    """Cache key of a text: sha1 of its normalized form."""
+    return hashlib.sha1(normalize_text(text).encode("utf-8")).hexdigest().encode("ascii")
+
+class EmbeddingCache:
+    """
+    Persistent on-disk cache of embeddings for one embedding model.
+
+    Files in cache_dir:
+    - meta.json:   model name, vector size, capacity and the LRU clock
+    - vectors.npy: float32 matrix of shape (capacity, dim), opened memory-mapped
+    - keys.npy:    text key stored in each row (b"" = free row)
+    - ticks.npy:   when each row was last used, for LRU eviction
+
+    The cache is wiped automatically if it was made with a different model. If only max_entries changed,
+    the most recently used entries that fit are kept.
+    """
+
+    def __init__(self, cache_dir: str, model_name: str, max_entries: int):
+        self.cache_dir = cache_dir
+        self.model_name = model_name
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.clock = 0
+        self.vectors = None
+        self.keys = None
+        self.ticks = None
+        self.slots = {}
+        self._open()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.cache_dir, name)
+
+    def _open(self):
+        """Opens the existing cache (resized if max_entries changed), or starts over if it belongs to another model."""
+        meta_path = self._path("meta.json")
+        if not os.path.exists(meta_path):
+            return
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        vectors = None
+        if meta.get("version") == CACHE_VERSION and meta.get("model_name") == self.model_name:
+            vectors = np.load(self._path("vectors.npy"), mmap_mode="r+")
+        if vectors is None or vectors.shape != (meta["capacity"], meta["dim"]):
+            del vectors
+            print(f"Embedding cache was built for a different model, clearing {self.cache_dir}")
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            return
+
+        self.clock = meta["clock"]
+        self.vectors = vectors
+        self.keys = np.load(self._path("keys.npy"))
+        self.ticks = np.load(self._path("ticks.npy"))
+        if meta["capacity"] != self.max_entries:
+            self._resize()
+        self.slots = {bytes(key): slot for slot, key in enumerate(self.keys) if key}
+
+    def _resize(self):
+        """Moves the most recently used entries that fit in max_entries rows into new cache files."""
+        old_size = len(self.keys)
+        used = np.flatnonzero(self.keys != b"")
+        keep = used[np.argsort(-self.ticks[used], kind="stable")[:self.max_entries]]
+        print(f"Resizing the embedding cache from {old_size} to {self.max_entries} entries, keeping {len(keep)}")
+        # Without meta.json the cache counts as empty, so a crash before the end can't mix old and new rows
+        os.remove(self._path("meta.json"))
+        tmp_path = self._path("vectors.npy.tmp.npy")
+        vectors = np.lib.format.open_memmap(tmp_path, mode="w+", dtype="float32",
+                                            shape=(self.max_entries, self.vectors.shape[1]))
+        step = 8192
+        for start in range(0, len(keep), step):
+            rows = keep[start:start + step]
+            vectors[start:start + len(rows)] = self.vectors[rows]
+        vectors.flush()
+        del vectors
+        self.vectors = None # close the old file before replacing it
+        os.replace(tmp_path, self._path("vectors.npy"))
+        self.vectors = np.load(self._path("vectors.npy"), mmap_mode="r+")
+
+        keys = np.zeros(self.max_entries, dtype="S40")
+        ticks = np.zeros(self.max_entries, dtype="int64")
+        keys[:len(keep)] = self.keys[keep]
+        ticks[:len(keep)] = self.ticks[keep]
+        self.keys, self.ticks = keys, ticks
+        self._save_index()
+
+    def _create(self, dim: int):
+        """Creates empty cache files once we know the vector size."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self.vectors = np.lib.format.open_memmap(
+            self._path("vectors.npy"), mode="w+", dtype="float32", shape=(self.max_entries, dim)
+        )
+        self.keys = np.zeros(self.max_entries, dtype="S40")
+        self.ticks = np.zeros(self.max_entries, dtype="int64")
+        self.slots = {}
+
+    def _save_index(self):
+        """Writes keys, ticks and meta (vectors are written through the memory map)."""
+        np.save(self._path("keys.npy.tmp.npy"), self.keys)
+        os.replace(self._path("keys.npy.tmp.npy"), self._path("keys.npy"))
+        np.save(self._path("ticks.npy.tmp.npy"), self.ticks)
+        os.replace(self._path("ticks.npy.tmp.npy"), self._path("ticks.npy"))
+        meta = {
+            "version": CACHE_VERSION,
+            "model_name": self.model_name,
+            "dim": int(self.vectors.shape[1]),
+            "capacity": self.max_entries,
+            "clock": self.clock,
+        }
+        with open(self._path("meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    def lookup(self, keys: list):
+        """
+        Returns (vectors, missing) where vectors[i] is the cached embedding of keys[i]
+        (or None) and missing is the list of positions that were not in the cache.
+        """
+        vectors = [None] * len(keys)
+        missing = []
+        for i, key in enumerate(keys):
+            slot = self.slots.get(key)
+            if slot is None:
+                missing.append(i)
+                continue
+            self.clock += 1
+            self.ticks[slot] = self.clock
+            vectors[i] = np.array(self.vectors[slot])
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        return vectors, missing
+
+    def store(self, keys: list, vectors: np.ndarray):
+        """Adds new embeddings, evicting the least recently used rows when full."""
+        if not keys:
+            return
+        if self.vectors is None:
+            self._create(vectors.shape[1])
+        # Only the most recent max_entries can fit
+        keys = keys[-self.max_entries:]
+        vectors = vectors[-self.max_entries:]
+
+        free = np.flatnonzero(self.keys == b"")
+        if len(free) < len(keys):
+            used = np.flatnonzero(self.keys != b"")
+            n_evict = len(keys) - len(free)
+            evict = used[np.argpartition(self.ticks[used], n_evict - 1)[:n_evict]]
+            for slot in evict:
+                del self.slots[bytes(self.keys[slot])]
+            # Free the rows on disk before overwriting them, so a crash can't pair an old key with a new vector
+            self.keys[evict] = b""
+            self._save_index()
+            free = np.concatenate([free, evict])
+
+        slots = free[:len(keys)]
+        self.vectors[slots] = vectors.astype("float32")
+        self.vectors.flush()
+        for slot, key in zip(slots, keys):
+            self.clock += 1
+            self.keys[slot] = key
+            self.ticks[slot] = self.clock
+            self.slots[key] = int(slot)
+        self._save_index()
+
+    def flush(self):
+        """Persists the LRU clock after lookups."""
+        if self.vectors is not None:
+            self._save_index()
+
+    def stats(self) -> dict:
+        return {"entries": len(self.slots), "capacity": self.max_entries, "hits": self.hits, "misses": self.misses}
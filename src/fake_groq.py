@@ -0,0 +1,124 @@
+import time
+import random
+import threading
+from types import SimpleNamespace
+
+class FakeAPIError(Exception):
+    """Looks like a groq APIStatusError: has status_code and response.headers (with retry-after on 429)."""
+
+    def __init__(self, status_code: int, retry_after: float = None):
+        super().__init__(f"Error code: {status_code}")
+        self.status_code = status_code
+        headers = {} if retry_after is None else {"retry-after": str(retry_after)}
+        self.response = SimpleNamespace(status_code=status_code, headers=headers)
+
+class FakeTimeoutError(TimeoutError):
+    """Raised like groq's APITimeoutError when a call takes longer than its timeout."""
+
+class FakeGroqClient:
+    """
+    Local stand-in for the Groq client, for tests, benchmarks and offline development.
+
+    Supports client.chat.completions.create(model=..., messages=..., stream=..., timeout=...) with the
+    same response shape as Groq. The answer is sent back in pieces of chunk_chars characters;
+    first_token_delay and token_delay (seconds) simulate generation latency, model_delays adds
+    extra latency per model name.
+
+    Failures can be injected, either scripted or at random:
+    - script: outcomes of the next calls, in order: "ok", "rate_limit" (429 with Retry-After retry_after),
+      "server_error" (503), "timeout" (hangs until the call's timeout) or a number (extra seconds of latency).
+    - error_rate / rate_limit_rate / slow_rate: chance of a 503, a 429, or slow_delay extra seconds
+      for calls past the script.
+    A call slower than its timeout waits the timeout and raises FakeTimeoutError.
+    """
+
+    def __init__(self, answer: str = None, chunk_chars: int = 8, first_token_delay: float = 0.0,
+                 token_delay: float = 0.0, model_delays: dict = None, script: list = None,
+                 error_rate: float = 0.0, rate_limit_rate: float = 0.0, slow_rate: float = 0.0,
+                 slow_delay: float = 0.0, retry_after: float = 1.0, seed: int = None):
+        self.answer = answer
+        self.chunk_chars = chunk_chars
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.model_delays = model_delays or {}
+        self.script = list(script or [])
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.calls = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self._create))
+
+    def _next_outcome(self):
+        with self._lock:
+            if self.script:
+                return self.script.pop(0)
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return "rate_limit"
+        if roll < self.rate_limit_rate + self.error_rate:
+            return "server_error"
+        if roll < self.rate_limit_rate + self.error_rate + self.slow_rate:
+            return self.slow_delay
+        return "ok"
+
+    def _answer_for(self, messages: list) -> str:
+        if self.answer is not None:
+            return self.answer
+        question = messages[-1]["content"].split("Question:")[-1].split("Answer clearly:")[0].strip()
+        return f"(fake answer) You asked: {question}"
+
+    @staticmethod
+    def _usage(messages: list, answer: str):
+        # Rough token counts: ~4 characters per token
+        prompt_tokens = sum(len(m["content"]) for m in messages) // 4
+        completion_tokens = len(answer) // 4
+        return SimpleNamespace(prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                               total_tokens=prompt_tokens + completion_tokens)
+
+    def _create(self, model: str, messages: list, stream: bool = False, timeout: float = None, **kwargs):
+        outcome = self._next_outcome()
+        with self._lock:
+            self.calls.append({"model": model, "messages": messages, "stream": stream, "timeout": timeout,
+                               "outcome": outcome, **kwargs})
+        if outcome == "rate_limit":
+            raise FakeAPIError(429, self.retry_after)
+        if outcome == "server_error":
+            raise FakeAPIError(503)
+
+        answer = self._answer_for(messages)
+        extra = self.model_delays.get(model, 0.0) + (outcome if isinstance(outcome, (int, float)) else 0.0)
+        delay = extra + self.first_token_delay
+        if not stream:
+            delay += self.token_delay * len(answer) / self.chunk_chars
+        if outcome == "timeout" or (timeout is not None and delay > timeout):
+            if timeout is None:
+                raise FakeTimeoutError("Request timed out.") # a real hang would never return
+            time.sleep(timeout)
+            raise FakeTimeoutError("Request timed out.")
+        if stream:
+            time.sleep(extra) # Groq answers a stream request once the model has started
+            return self._stream(model, messages, answer)
+
+        time.sleep(delay)
+        message = SimpleNamespace(role="assistant", content=answer)
+        return SimpleNamespace(
+            model=model,
+            choices=[SimpleNamespace(index=0, message=message, finish_reason="stop")],
+            usage=self._usage(messages, answer),
+        )
+
+    def _stream(self, model: str, messages: list, answer: str):
+        time.sleep(self.first_token_delay)
+        for start in range(0, len(answer), self.chunk_chars):
+            if start:
+                time.sleep(self.token_delay)
+            delta = SimpleNamespace(role="assistant", content=answer[start:start + self.chunk_chars])
+            yield SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, delta=delta, finish_reason=None)])
+        # Groq ends a stream with an empty delta carrying the finish reason and the token usage
+        yield SimpleNamespace(model=model, choices=[SimpleNamespace(index=0, delta=SimpleNamespace(content=None),
+                                                                    finish_reason="stop")],
+                              x_groq=SimpleNamespace(usage=self._usage(messages, answer)))
@@ -1,29 +1,35 @@
 import os
-from groq import Groq
+import time
+from src.tracing import span, record_usage, usage_counts, current_trace
+from src.llm_policy import default_policy
+
+SYSTEM_PROMPT = (
+    "You are a helpful assistant answering questions from a research paper.\n"
+    "Use ONLY the provided context. If the answer is not in the context, say:\n"
+    "'I could not find this in the provided paper context.'"
+)
 
 def get_groq_client():
     """
     Creates a Groq API client using the API key from .env file.
     Call this once at startup and reuse the client.
+    Set GROQ_FAKE=1 to get a local fake client instead (no API key or network needed).
+    Retries are left to the call policy (src/llm_policy.py), so the SDK's own are turned off.
     """
+    if os.getenv("GROQ_FAKE"):
+        from src.fake_groq import FakeGroqClient
+        return FakeGroqClient()
+
+    from groq import Groq
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         raise ValueError("Missing GROQ_API_KEY in .env")
-    return Groq(api_key=api_key)
+    return Groq(api_key=api_key, max_retries=0)
 
-def groq_answer(client, model: str, question: str, context_chunks: list[str]):
-    """
-    Sends retrieved context + user question to Groq's LLM.
-    Returns the generated answer as a string.
-    """
+def build_messages(question: str, context_chunks: list[str]):
+    """Builds the chat messages (system + user prompt with the retrieved context)."""
     context_text = "\n\n---\n\n".join(context_chunks)
 
-    system_prompt = (
-        "You are a helpful assistant answering questions from a research paper.\n"
-        "Use ONLY the provided context. If the answer is not in the context, say:\n"
-        "'I could not find this in the provided paper context.'"
-    )
-
     user_prompt = f"""
 Context from paper:
 {context_text}
@@ -34,13 +40,84 @@ Question:
 Answer clearly:
 """
 
-    completion = client.chat.completions.create(
-        model=model,  # "llama-3.3-70b-versatile"
-        messages=[
-            {"role": "system", "content": system_prompt},
-            {"role": "user", "content": user_prompt},
-        ],
-        temperature=0.2,  # Low = more factual, less creative
-    )
+    return [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {"role": "user", "content": user_prompt},
+    ]
+
+def groq_answer(client, model: str, question: str, context_chunks: list[str], policy=None, usage: dict = None):
+    """
+    Sends retrieved context + user question to Groq's LLM.
+    Returns the generated answer as a string.
+    The call runs under policy (default: the GROQ_* settings in config), which handles timeouts,
+    retries, hedging and falling back to a smaller model.
+    If a usage dict is given, it gets the token counts of the completion ("total_tokens"...),
+    whether or not tracing is enabled.
+    """
+    policy = policy or default_policy()
+    with span("prompt"):
+        messages = build_messages(question, context_chunks)
+    with span("llm"):
+        completion = policy.call(
+            client.chat.completions.create,
+            model,  # "llama-3.3-70b-versatile"
+            messages=messages,
+            temperature=0.2,  # Low = more factual, less creative
+        )
+    record_usage(getattr(completion, "usage", None))
+    if usage is not None and getattr(completion, "usage", None) is not None:
+        usage.update(usage_counts(completion.usage))
+    trace = current_trace()
+    if trace is not None:
+        trace.set(llm_model=getattr(completion, "model", model))
 
     return completion.choices[0].message.content
+
+def groq_answer_stream(client, model: str, question: str, context_chunks: list[str], timings: dict = None,
+                       trace=None, policy=None):
+    """
+    Same as groq_answer, but yields the answer piece by piece as Groq generates it.
+    If a timings dict is given, it gets "first_token_s" (time to first token)
+    and "total_s" (time until the last token), measured from the request.
+    A generator can't see the caller's current trace, so pass it as trace to record spans and tokens.
+    The policy covers opening the stream (timeouts, retries, fallback), not hedging: once tokens
+    have been shown, a failed stream can't be retried.
+    """
+    policy = policy or default_policy()
+    with span("prompt", trace):
+        messages = build_messages(question, context_chunks)
+    start = time.perf_counter()
+    stream = policy.call(
+        client.chat.completions.create,
+        model,
+        hedge=False,
+        messages=messages,
+        temperature=0.2,
+        stream=True,
+    )
+
+    first_token_at = None
+    for chunk in stream:
+        # Groq sends token counts with the last chunk, under x_groq.usage
+        x_groq = getattr(chunk, "x_groq", None)
+        if x_groq is not None:
+            record_usage(getattr(x_groq, "usage", None), trace)
+        if trace is not None and "llm_model" not in trace.attrs:
+            trace.set(llm_model=getattr(chunk, "model", model))
+        if not chunk.choices:
+            continue
+        token = chunk.choices[0].delta.content
+        if not token:
+            continue
+        if first_token_at is None:
+            first_token_at = time.perf_counter()
+            if timings is not None:
+                timings["first_token_s"] = first_token_at - start
+        yield token
+
+    end = time.perf_counter()
+    if trace is not None:
+        trace.add_span("llm_first_token", start, first_token_at or end)
+        trace.add_span("llm", start, end)
+    if timings is not None:
+        timings["total_s"] = end - start
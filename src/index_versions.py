@@ -0,0 +1,167 @@
+import os
+import json
+import shutil
+import hashlib
+from datetime import datetime, timedelta, timezone
+
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+ARTIFACTS_FILE = "artifacts.json" # size and SHA-256 of every file the apps load from a version
+ARTIFACTS_FORMAT = 1
+VERSION_FORMAT = "%Y%m%d-%H%M%S-%f" # UTC build time to the microsecond
+
+def current_version(vector_db_dir: str):
+    """
+    The name of the published index version (the content of vector_db_dir/CURRENT),
+    or None if there is none: nothing built yet, an index built before versioning, or unpublished.
+    """
+    try:
+        with open(os.path.join(vector_db_dir, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def version_dir(vector_db_dir: str, version) -> str:
+    """Folder of one version. Version None is the old flat layout, where the files sit in vector_db_dir itself."""
+    return vector_db_dir if version is None else os.path.join(vector_db_dir, VERSIONS_DIR, version)
+
+def is_versioned(vector_db_dir: str) -> bool:
+    """
+    True once a build has written CURRENT here (even an empty one: nothing published).
+    From then on, files left in the old flat layout are stale and never loaded.
+    """
+    return os.path.exists(os.path.join(vector_db_dir, CURRENT_FILE))
+
+def current_dir(vector_db_dir: str) -> tuple:
+    """(version, folder) of the published index, or (None, None) if the versions were all unpublished."""
+    version = current_version(vector_db_dir)
+    if version is None and is_versioned(vector_db_dir):
+        return None, None
+    return version, version_dir(vector_db_dir, version)
+
+def new_version(vector_db_dir: str) -> tuple:
+    """
+    Creates an empty folder for a new build and returns (version, folder).
+    Versions are named by UTC build time, and every name sorts after all the versions already there
+    (even for two builds in the same microsecond, or after the clock was set back), so sorting the
+    names gives the build order that prune_versions and unpublished_versions rely on.
+    """
+    while True:
+        built_at = datetime.now(timezone.utc)
+        last = max(list_versions(vector_db_dir) + [current_version(vector_db_dir) or ""])
+        if last >= built_at.strftime(VERSION_FORMAT):
+            try:
+                built_at = datetime.strptime(last, VERSION_FORMAT) + timedelta(microseconds=1)
+            except ValueError:
+                # Named by an older build (seconds plus a random suffix): take the next second
+                built_at = datetime.strptime(last[:15], "%Y%m%d-%H%M%S") + timedelta(seconds=1)
+        version = built_at.strftime(VERSION_FORMAT)
+        path = version_dir(vector_db_dir, version)
+        try:
+            os.makedirs(path)
+            return version, path
+        except FileExistsError:
+            continue # another build took the same name at the same moment
+
+def publish_version(vector_db_dir: str, version: str):
+    """
+    Makes version the current one. CURRENT is rewritten through a temp file and os.replace,
+    so a reader sees either the old name or the new one, never a mix; call this only once
+    every file of the version is written. Until then, readers keep loading the previous version.
+    """
+    _write_current(vector_db_dir, version + "\n")
+
+def _write_current(vector_db_dir: str, content: str):
+    tmp_path = os.path.join(vector_db_dir, CURRENT_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, os.path.join(vector_db_dir, CURRENT_FILE))
+
+def unpublish_version(vector_db_dir: str):
+    """
+    Empties CURRENT, so no version is published anymore (e.g. every document was deleted): running apps
+    switch to an empty index, and neither they nor new processes fall back to files of the old flat layout.
+    The version folders stay on disk for processes still using them. Returns the version that was current.
+    """
+    version = current_version(vector_db_dir)
+    _write_current(vector_db_dir, "")
+    return version
+
+def _sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def write_artifacts(build_dir: str, names: list):
+    """
+    Records the size and SHA-256 of the files in names (paths relative to build_dir, missing ones skipped)
+    in build_dir/artifacts.json. Call it once they are all written, before publishing the version.
+    """
+    files = {}
+    for name in names:
+        path = os.path.join(build_dir, name)
+        if os.path.isfile(path):
+            files[name.replace(os.sep, "/")] = {"bytes": os.path.getsize(path), "sha256": _sha256(path)}
+    with open(os.path.join(build_dir, ARTIFACTS_FILE), "w", encoding="utf-8") as f:
+        json.dump({"format": ARTIFACTS_FORMAT, "files": files}, f, indent=2)
+
+def verify_artifacts(build_dir: str, checksums: bool = False):
+    """
+    Checks the files of a version against its artifacts.json: sizes always (instant), SHA-256 too
+    if checksums is set (reads every file). Raises ValueError naming the files that don't match.
+    Versions built before artifacts.json existed are not checked.
+    """
+    path = os.path.join(build_dir, ARTIFACTS_FILE)
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        artifacts = json.load(f)
+    if artifacts.get("format") != ARTIFACTS_FORMAT:
+        raise ValueError(f"Unsupported {ARTIFACTS_FILE} format {artifacts.get('format')} in {build_dir}")
+    problems = []
+    for name, expected in artifacts["files"].items():
+        file_path = os.path.join(build_dir, *name.split("/"))
+        if not os.path.isfile(file_path):
+            problems.append(f"{name} is missing")
+        elif os.path.getsize(file_path) != expected["bytes"]:
+            problems.append(f"{name} has {os.path.getsize(file_path)} bytes, expected {expected['bytes']}")
+        elif checksums and _sha256(file_path) != expected["sha256"]:
+            problems.append(f"{name} has the wrong checksum")
+    if problems:
+        raise ValueError(f"Index in {build_dir} is damaged: " + "; ".join(problems))
+
+def list_versions(vector_db_dir: str) -> list:
+    """Every version folder on disk, oldest first."""
+    path = os.path.join(vector_db_dir, VERSIONS_DIR)
+    if not os.path.isdir(path):
+        return []
+    return sorted(name for name in os.listdir(path) if os.path.isdir(os.path.join(path, name)))
+
+def unpublished_versions(vector_db_dir: str) -> list:
+    """Version folders newer than the current one (builds in progress or interrupted), oldest first."""
+    current = current_version(vector_db_dir)
+    return [v for v in list_versions(vector_db_dir) if current is None or v > current]
+
+def prune_versions(vector_db_dir: str, keep: int = 2) -> list:
+    """
+    Deletes old versions, keeping the current one and the keep - 1 before it (for processes
+    that haven't switched yet). Folders newer than the current version (a build in progress) are left alone.
+
+    A process still using a deleted version keeps working on Linux and macOS, where open and
+    memory-mapped files stay readable. On Windows the files are in use, so the folder is skipped
+    and deleted by a later build. Returns the versions deleted.
+    """
+    current = current_version(vector_db_dir)
+    if current is None:
+        return []
+    older = [v for v in list_versions(vector_db_dir) if v < current]
+    removed = []
+    for version in older[:max(0, len(older) - (keep - 1))]:
+        try:
+            shutil.rmtree(version_dir(vector_db_dir, version))
+            removed.append(version)
+        except OSError as e:
+            print(f"Could not delete old index version {version} ({e}), will retry after the next build.")
+    return removed
@@ -1,52 +1,611 @@
-from .pdf_loader import load_all_pdfs_from_folder
-from .chunker import chunk_text
+import os
+import json
+import shutil
+import hashlib
+from bisect import bisect_right
+from fnmatch import fnmatch
+import numpy as np
+
+from .pdf_loader import load_pdf_pages
+from .html_loader import load_html_text
+from .chunker import chunk_spans
 from .embedder import get_embedder, embed_texts
-from .vector_store import build_faiss_index, save_vector_db
+from .embedding_cache import EmbeddingCache
+from .vector_store import build_faiss_index, build_bm25_index, save_vector_db, load_embeddings
+from .index_versions import (
+    current_dir, new_version, version_dir, unpublished_versions, publish_version, unpublish_version, prune_versions,
+    write_artifacts
+)
+from .chunk_store import open_chunks, STORE_FILES
+from .parallel import parallel_map
+from .dedup import block_hashes, find_boilerplate, strip_signature, strip_lines, find_near_duplicates
+from .config import (
+    FAISS_INDEX_FILE, CHUNK_STORE_DIR, CHUNKS_FILE, MANIFEST_FILE, DUPLICATES_FILE, LINES_FILE, CHECKPOINT_FILE
+)
+
+MANIFEST_VERSION = 3 # 2: chunks carry their character offsets (and PDF page), 3: chunk store instead of chunks.json
+READABLE_MANIFEST_VERSIONS = (2, 3) # builds whose chunks and embeddings the next build can reuse
+
+def file_sha256(path: str) -> str:
+    """Hashes a file's bytes, so we can tell if it changed since the last build."""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+def make_chunk_id(file_key: str, chunk_id: int, text: str) -> str:
+    """
+    Content-derived chunk id.
+    The same text at the same position of the same file always gets the same id,
+    so chunks (and their embeddings) can be reused across builds.
+    """
+    key = f"{file_key}\x00{chunk_id}\x00{text}".encode("utf-8")
+    return hashlib.sha1(key).hexdigest()
+
+def discover_files(data_dir: str, html_dir: str):
+    """
+    Returns a sorted dict of {relative_path: (kind, full_path)} for every
+    PDF in data_dir and every HTML file in html_dir.
+    """
+    files = {}
+    if os.path.isdir(data_dir):
+        for filename in os.listdir(data_dir):
+            if filename.lower().endswith(".pdf"):
+                full_path = os.path.join(data_dir, filename)
+                files[os.path.relpath(full_path, data_dir)] = ("pdf", full_path)
+    if os.path.isdir(html_dir):
+        for filename in os.listdir(html_dir):
+            if filename.lower().endswith((".html", ".htm")):
+                full_path = os.path.join(html_dir, filename)
+                files[os.path.relpath(full_path, data_dir)] = ("html", full_path)
+    return dict(sorted(files.items()))
+
+def load_document(kind: str, full_path: str):
+    """
+    Loads one file into the usual {"doc_name", "text", "source"} shape.
+    PDFs also get "pages": [[offset, page_number]], where each page starts in the text.
+    Returns None if the file has no text.
+    """
+    filename = os.path.basename(full_path)
+    if kind == "pdf":
+        pdf_pages = load_pdf_pages(full_path)
+        pages, offset = [], 0
+        for number, page_text in pdf_pages:
+            pages.append([offset, number])
+            offset += len(page_text) + 1 # pages are joined with "\n"
+        text = "\n".join(page_text for _, page_text in pdf_pages)
+        doc = {"doc_name": filename, "text": text, "source": filename, "pages": pages}
+    else:
+        doc = {"doc_name": filename, "text": load_html_text(full_path), "source": filename}
+    if not doc["text"].strip():
+        return None
+    return doc
+
+def chunk_document(doc: dict, file_key: str, chunk_size: int, chunk_overlap: int):
+    """
+    Splits one document into chunk dicts with stable ids.
+    Each chunk records where it is in the document text ("start", "end") and, for PDFs,
+    the page it starts on ("page").
+    """
+    doc_name = doc["doc_name"]
+    doc_source = doc.get("source", doc_name) # Fallback to doc_name if source missing
+    text = doc["text"]
+    page_offsets = [offset for offset, _ in doc.get("pages", [])]
+    chunks = []
+    for i, (start, end) in enumerate(chunk_spans(text, chunk_size, chunk_overlap)):
+        ch = text[start:end]
+        chunk = {
+            "id": make_chunk_id(file_key, i, ch),
+            "doc_name": doc_name,
+            "source": doc_source,
+            "chunk_id": i,
+            "text": ch,
+            "start": start,
+            "end": end,
+        }
+        if page_offsets:
+            chunk["page"] = doc["pages"][max(bisect_right(page_offsets, start) - 1, 0)][1]
+        chunks.append(chunk)
+    return chunks
+
+def load_and_chunk(kind: str, full_path: str, file_key: str, chunk_size: int, chunk_overlap: int):
+    """
+    Loads and chunks one file, so both run in the worker process.
+    Only the chunks are sent back, not the whole document text.
+    """
+    doc = load_document(kind, full_path)
+    return chunk_document(doc, file_key, chunk_size, chunk_overlap) if doc else []
+
+def load_line_hashes(kind: str, full_path: str, min_lines: int, min_chars: int) -> np.ndarray:
+    """
+    Loads one page in the worker process and returns only the hashes of its runs of lines and long lines
+    (see block_hashes and find_boilerplate).
+    """
+    doc = load_document(kind, full_path)
+    return block_hashes(doc["text"], min_lines, min_chars) if doc else np.zeros(0, dtype="uint64")
+
+def load_for_build(kind: str, full_path: str, file_key: str, chunk_size: int, chunk_overlap: int, strip=None,
+                   min_lines: int = 3, min_chars: int = 40):
+    """
+    Loads and chunks one file in the worker process, so only its chunks are sent back.
+    With strip (HTML pages whose boilerplate is removed), the blocks whose hash is in strip are removed first
+    (see strip_lines). Returns (chunks, raw_chunks): raw_chunks is how many chunks the page had before that
+    (None without strip).
+    """
+    doc = load_document(kind, full_path)
+    if not doc:
+        return [], None if strip is None else 0
+    raw_chunks = None
+    if strip is not None:
+        raw_chunks = len(chunk_spans(doc["text"], chunk_size, chunk_overlap))
+        doc["text"], _ = strip_lines(doc["text"], strip, min_lines, min_chars)
+    return (chunk_document(doc, file_key, chunk_size, chunk_overlap) if doc["text"] else []), raw_chunks
+
+def chunk_documents(docs: list, chunk_size: int, chunk_overlap: int, workers: int = 1):
+    """Chunks already loaded documents (keyed by doc_name), in parallel worker processes if workers > 1."""
+    results = parallel_map(chunk_document, [(doc, doc["doc_name"], chunk_size, chunk_overlap) for doc in docs], workers)
+    chunks = []
+    for doc, (doc_chunks, error) in zip(docs, results):
+        if error:
+            print(f"Error chunking {doc['doc_name']}: {error}")
+            continue
+        chunks.extend(doc_chunks)
+    return chunks
+
+def tags_for(rel_path: str, doc_tags: dict) -> list:
+    """The tags of a file: those of every DOC_TAGS pattern its path (under the data folder) matches."""
+    rel_path = rel_path.replace(os.sep, "/")
+    tags = []
+    for pattern, pattern_tags in (doc_tags or {}).items():
+        if fnmatch(rel_path, pattern):
+            tags.extend(tag for tag in pattern_tags if tag not in tags)
+    return tags
+
+def chunks_path(build_dir: str) -> str:
+    """Where a build's chunks are: its chunk store folder, or chunks.json for builds made before it."""
+    store_dir = os.path.join(build_dir, CHUNK_STORE_DIR)
+    return store_dir if os.path.isdir(store_dir) else os.path.join(build_dir, CHUNKS_FILE)
+
+def artifact_names() -> list:
+    """The files of a build that the apps load, recorded with their checksums in its artifacts.json."""
+    return [FAISS_INDEX_FILE, "index_meta.json", "bm25.npz", "embeddings.npy"] + [
+        os.path.join(CHUNK_STORE_DIR, name) for name in STORE_FILES
+    ]
+
+def load_manifest(manifest_path: str):
+    """Returns the manifest of the last build, or None if there isn't one."""
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_manifest(manifest: dict, manifest_path: str):
+    """
+    Writes the manifest through a temp file.
+    It is written last in its version folder, next to the files it describes.
+    """
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+def save_page_lines(page_lines: dict, path: str):
+    """Saves {page: line hashes} as one array of hashes plus the pages and their offsets in it."""
+    pages = sorted(page_lines)
+    offsets = np.cumsum([0] + [len(page_lines[p]) for p in pages])
+    hashes = np.concatenate([page_lines[p] for p in pages]) if pages else np.zeros(0, dtype="uint64")
+    np.savez(path, pages=np.array(pages, dtype=str), offsets=offsets, hashes=hashes)
+
+def load_page_lines(path: str) -> dict:
+    """Reads what save_page_lines wrote ({} if the file doesn't exist)."""
+    if not os.path.exists(path):
+        return {}
+    with np.load(path) as data:
+        pages, offsets, hashes = data["pages"].tolist(), data["offsets"], data["hashes"]
+    return {page: hashes[offsets[i]:offsets[i + 1]] for i, page in enumerate(pages)}
+
+def load_previous_build(manifest, settings: dict, build_dir: str):
+    """
+    Returns (chunks, embeddings, duplicates, page_lines) of the build in build_dir if they can be reused,
+    else (None, None, [], {}). duplicates are the chunks left out as near-duplicates (they have no
+    embeddings), page_lines the line hashes of its HTML pages.
+    A build can only be reused if it was made with the same model and chunking settings.
+    """
+    nothing = None, None, [], {}
+    if manifest is None or manifest.get("version") not in READABLE_MANIFEST_VERSIONS:
+        return nothing
+    path = chunks_path(build_dir)
+    if any(manifest.get(key) != value for key, value in settings.items()):
+        print("Build settings changed since the last build, rebuilding everything.")
+        return nothing
+    if not os.path.exists(path):
+        return nothing
+
+    embeddings = load_embeddings(build_dir, mmap=True) # rows are copied a segment at a time
+    chunks = list(open_chunks(path))
+    if embeddings is None or len(embeddings) != len(chunks):
+        print("Previous build has no reusable embeddings, rebuilding everything.")
+        return nothing
+    duplicates = []
+    duplicates_path = os.path.join(build_dir, DUPLICATES_FILE)
+    if os.path.exists(duplicates_path):
+        with open(duplicates_path, "r", encoding="utf-8") as f:
+            duplicates = json.load(f)
+    return chunks, embeddings, duplicates, load_page_lines(os.path.join(build_dir, LINES_FILE))
+
+def group_duplicates(chunks: list, min_jaccard: float) -> tuple:
+    """
+    Splits chunks into (representatives, duplicates) with find_near_duplicates: the first chunk of each group
+    of near-identical chunks is kept, and lists the others in "also_in" (doc_name, source, chunk_id, page);
+    the others get "duplicate_of" (the id of the kept chunk).
+    """
+    rep = find_near_duplicates([c["text"] for c in chunks], min_jaccard=min_jaccard)
+    for chunk in chunks:
+        chunk.pop("also_in", None)
+        chunk.pop("duplicate_of", None)
+    representatives, duplicates = [], []
+    for i, chunk in enumerate(chunks):
+        if rep[i] == i:
+            representatives.append(chunk)
+            continue
+        kept = chunks[rep[i]]
+        chunk["duplicate_of"] = kept["id"]
+        kept.setdefault("also_in", []).append(
+            {key: chunk[key] for key in ("doc_name", "source", "chunk_id", "page") if key in chunk}
+        )
+        duplicates.append(chunk)
+    return representatives, duplicates
+
+def embedding_plan(embed_model_name: str, chunks: list, to_embed: list) -> str:
+    """
+    Fingerprint of the embeddings a build writes: the model, every chunk id in order and which ones are embedded.
+    A checkpoint is only resumed by a build with the same plan (the files didn't change in between).
+    """
+    h = hashlib.sha1(embed_model_name.encode("utf-8"))
+    for chunk in chunks:
+        h.update(chunk["id"].encode("utf-8"))
+    h.update(np.asarray(to_embed, dtype="int64").tobytes())
+    return h.hexdigest()
+
+def load_checkpoint(build_dir: str):
+    """The checkpoint of an unfinished build ({"plan", "embedded", "total"}), or None if it has none."""
+    path = os.path.join(build_dir, CHECKPOINT_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def save_checkpoint(build_dir: str, checkpoint: dict):
+    """Writes the checkpoint through a temp file, so an interruption leaves the old one or the new one."""
+    path = os.path.join(build_dir, CHECKPOINT_FILE)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f)
+    os.replace(path + ".tmp", path)
+
+def resume_or_new_version(vector_db_dir: str, plan: str) -> tuple:
+    """
+    Returns (version, folder, chunks already embedded): the unpublished version of an interrupted build
+    with the same plan, or a new empty one (0 embedded). Interrupted builds with another plan are deleted.
+    """
+    resumed = None
+    for version in reversed(unpublished_versions(vector_db_dir)):
+        path = version_dir(vector_db_dir, version)
+        checkpoint = load_checkpoint(path)
+        if checkpoint is None:
+            continue # not a build that was interrupted while embedding
+        if resumed is None and checkpoint["plan"] == plan:
+            resumed = version, path, checkpoint["embedded"]
+        else:
+            shutil.rmtree(path, ignore_errors=True)
+            print(f"Deleted interrupted build {version} (the files changed since)")
+    return resumed or (*new_version(vector_db_dir), 0)
 
 def build_and_save_index_from_folder(
-    pdf_dir: str,
+    data_dir: str,
+    html_dir: str,
     chunk_size: int,
     chunk_overlap: int,
     embed_model_name: str,
     vector_db_dir: str,
-    faiss_index_path: str,
-    chunks_path: str
+    full_rebuild: bool = False,
+    workers: int = 1,
+    embed_batch_size: int = 32,
+    embed_cache_dir: str = None,
+    embed_cache_max_entries: int = 200_000,
+    faiss_index_type: str = "flat_ip",
+    faiss_params: dict = None,
+    doc_tags: dict = None,
+    keep_versions: int = 2,
+    file_filter=None,
+    boilerplate_min_pages: int = 0,
+    boilerplate_min_lines: int = 3,
+    boilerplate_min_chars: int = 40,
+    dedup_jaccard: float = None,
+    memory_budget_mb: int = 1024,
+    checkpoint_chunks: int = 2048
 ):
     """
-   Run this once to build your vector database.
-    
+    Builds (or updates) the vector database.
+
     Steps:
-    1. Load all PDFs from the folder
-    2. Split each document into overlapping chunks
-    3. Convert all chunks into embeddings
-    4. Build a FAISS index for fast similarity search
-    5. Save the index and chunk metadata to disk
-    
-    Returns: (total_chunks, total_docs)
+    1. Hash every PDF and HTML file and compare with the manifest of the last build
+    2. Load and chunk (in parallel worker processes) only the files that were added or changed.
+       With boilerplate_min_pages, runs of boilerplate_min_lines lines and lines of boilerplate_min_chars
+       characters found on that many HTML pages (menus, footers...) are first removed from all of them
+       but one (see src/dedup.py); unchanged pages are chunked again if that changes
+    3. With dedup_jaccard, group near-duplicate chunks (e.g. the same text in a PDF and on a web page):
+       only the first of each group is indexed, listing the others in its "also_in"
+    4. Drop chunks of changed and deleted files and tag every chunk with the doc_tags of its file
+    5. Embed only the new chunks, reusing the saved embeddings of unchanged files
+       (and the on-disk embedding cache, if embed_cache_dir is set). Vectors are written straight to
+       embeddings.npy in the new version folder, with a checkpoint every checkpoint_chunks chunks:
+       if the build is interrupted, running it again resumes after the last checkpoint
+    6. Rebuild FAISS (adding the vectors a segment of at most memory_budget_mb at a time) + BM25
+    7. Save the index, chunks (as a chunk store, see src/chunk_store.py), their checksums
+       (artifacts.json) and the manifest to the version folder, publish it
+       (running apps pick it up, see src/index_versions.py) and delete all but keep_versions versions
+
+    file_filter(rel_path) -> bool limits the build to some files (e.g. those of one collection, see src/shards.py).
+
+    Returns a dict with counts of what happened (and the published "version", if any).
     """
-    docs = load_all_pdfs_from_folder(pdf_dir)
+    settings = {
+        "embed_model": embed_model_name,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "boilerplate_min_pages": boilerplate_min_pages,
+        "boilerplate_min_lines": boilerplate_min_lines,
+        "boilerplate_min_chars": boilerplate_min_chars,
+    }
+    files = discover_files(data_dir, html_dir)
+    if file_filter is not None:
+        files = {rel_path: entry for rel_path, entry in files.items() if file_filter(rel_path)}
+    hashes = {rel_path: file_sha256(full_path) for rel_path, (_, full_path) in files.items()}
+
+    # The previous build is read from the published version (or the flat layout of older builds)
+    _, previous_dir = current_dir(vector_db_dir)
+    manifest = None if full_rebuild or previous_dir is None else load_manifest(os.path.join(previous_dir, MANIFEST_FILE))
+    old_chunks, old_embeddings, old_duplicates, old_lines = load_previous_build(manifest, settings, previous_dir)
+    old_files = manifest["files"] if old_chunks is not None else {}
+
+    unchanged = [p for p in files if p in old_files and old_files[p]["sha256"] == hashes[p]]
+    changed = [p for p in files if p in old_files and old_files[p]["sha256"] != hashes[p]]
+    added = [p for p in files if p not in old_files]
+    removed = [p for p in old_files if p not in files]
+
+    stats = {
+        "files": len(files),
+        "unchanged": len(unchanged),
+        "changed": len(changed),
+        "added": len(added),
+        "removed": len(removed),
+        "embedded": 0,
+        "chunks": len(old_chunks) if old_chunks is not None else 0,
+    }
+    print(f"Files: {len(files)} ({len(added)} added, {len(changed)} changed, "
+          f"{len(removed)} removed, {len(unchanged)} unchanged)")
+
+    # A different FAISS type (or duplicate grouping) only needs the index rebuilt from the saved embeddings
+    index_settings = {"faiss_index_type": faiss_index_type, "faiss_params": faiss_params or {},
+                      "doc_tags": doc_tags or {}, "dedup_jaccard": dedup_jaccard}
+    same_index = all(manifest.get(key) == value for key, value in index_settings.items()) if manifest else False
+    if old_chunks is not None and not (changed or added or removed) and same_index:
+        print("Index is up to date, nothing to do.")
+        return stats
+
+    # When boilerplate is removed, the line hashes of the HTML pages are read first (only the hashes come
+    # back from the workers, never whole pages), including unchanged pages the last build didn't save them for
+    def whole(rel_path):
+        return boilerplate_min_pages > 0 and files[rel_path][0] == "html"
+
+    to_load = sorted(changed + added + [p for p in unchanged if whole(p) and p not in old_lines])
+    page_lines, failed = {}, set()
+    to_hash = [p for p in to_load if whole(p)]
+    if to_hash:
+        print(f"Reading the lines of {len(to_hash)} HTML pages with {workers} worker(s)...")
+        for rel_path, (result, error) in zip(to_hash, parallel_map(
+                load_line_hashes, [(*files[p], boilerplate_min_lines, boilerplate_min_chars) for p in to_hash], workers)):
+            if error:
+                # Leave it out of the manifest, so the next build tries it again
+                print(f"Error reading {rel_path}: {error}")
+                failed.add(rel_path)
+            else:
+                page_lines[rel_path] = result
+
+    # Blocks on boilerplate_min_pages pages or more are kept only on the first of them
+    page_lines.update({p: old_lines[p] for p in unchanged if whole(p) and p in old_lines})
+    boilerplate, strip = find_boilerplate(page_lines, boilerplate_min_pages)
+    restrip = [p for p in unchanged if p in old_lines and whole(p)
+               and strip_signature(strip.get(p)) != old_files[p].get("boilerplate", "")]
+    if restrip:
+        print(f"Chunking {len(restrip)} unchanged pages again, their boilerplate lines changed...")
+
+    # Then every file that needs it is loaded and chunked (pages without their boilerplate lines)
+    no_lines = np.zeros(0, dtype="uint64")
+    to_chunk = sorted(p for p in to_load + restrip if p not in failed)
+    print(f"Loading and chunking {len(to_chunk)} files with {workers} worker(s)...")
+    results = parallel_map(
+        load_for_build,
+        [(*files[p], p, chunk_size, chunk_overlap, strip.get(p, no_lines) if whole(p) else None,
+          boilerplate_min_lines, boilerplate_min_chars) for p in to_chunk],
+        workers,
+    )
+    new_files = {}
+    new_chunks = []
+    for rel_path, (result, error) in zip(to_chunk, results):
+        if error:
+            print(f"Error reading {rel_path}: {error}")
+            page_lines.pop(rel_path, None)
+            continue
+        doc_chunks, raw_chunks = result
+        entry = {"sha256": hashes[rel_path]}
+        if whole(rel_path):
+            entry["boilerplate"] = strip_signature(strip.get(rel_path))
+            entry["raw_chunks"] = raw_chunks
+        new_chunks.extend(doc_chunks)
+        new_files[rel_path] = {**entry, "chunk_ids": [c["id"] for c in doc_chunks]}
+
+    # Keep chunks (and their embedding rows) that belong to unchanged files, indexed or left out as duplicates
+    kept_files = [p for p in unchanged if p not in to_load and p not in restrip]
+    keep_ids = set()
+    for rel_path in kept_files:
+        keep_ids.update(old_files[rel_path]["chunk_ids"])
+    kept_rows = []
+    kept_chunks = []
+    for row, chunk in enumerate(old_chunks or []):
+        if chunk["id"] in keep_ids:
+            kept_rows.append(row)
+            kept_chunks.append(chunk)
+    kept_duplicates = [chunk for chunk in old_duplicates if chunk["id"] in keep_ids]
+
+    candidates = kept_chunks + kept_duplicates + new_chunks
+    if not candidates:
+        print("No documents found! Check your data directory.")
+        if not files and old_files:
+            # Every file of the last build was deleted: stop serving its index, rather than answering from them
+            stats["unpublished"] = unpublish_version(vector_db_dir)
+            stats["chunks"] = 0
+            if stats["unpublished"]:
+                print(f"Unpublished index version {stats['unpublished']}, its documents were all deleted.")
+        return stats
+
+    manifest_files = {p: old_files[p] for p in kept_files}
+    manifest_files.update(new_files)
+    file_of_chunk = {chunk_id: p for p, entry in manifest_files.items() for chunk_id in entry["chunk_ids"]}
+    for chunk in candidates:
+        chunk.pop("tags", None)
+        tags = tags_for(file_of_chunk[chunk["id"]], doc_tags)
+        if tags:
+            chunk["tags"] = tags
+
+    # Index one chunk per group of near-duplicates (kept chunks come first, so they stay the indexed ones)
+    if dedup_jaccard:
+        print(f"Grouping near-duplicate chunks of {len(candidates)}...")
+        all_chunks, duplicates = group_duplicates(candidates, dedup_jaccard)
+        by_id = {chunk["id"]: chunk for chunk in all_chunks}
+        for chunk in duplicates:
+            # The indexed chunk also answers filters on the tags of its duplicates
+            kept = by_id[chunk["duplicate_of"]]
+            tags = kept.get("tags", []) + [t for t in chunk.get("tags", []) if t not in kept.get("tags", [])]
+            if tags:
+                kept["tags"] = tags
+    else:
+        for chunk in candidates:
+            chunk.pop("also_in", None)
+            chunk.pop("duplicate_of", None)
+        all_chunks, duplicates = candidates, []
+
+    # Everything is written into a folder no process reads yet (the one of an interrupted build with the
+    # same plan, if there is one), then CURRENT is switched to it
+    row_of = {chunk["id"]: row for chunk, row in zip(kept_chunks, kept_rows)}
+    to_embed = [i for i, chunk in enumerate(all_chunks) if chunk["id"] not in row_of]
+    plan = embedding_plan(embed_model_name, all_chunks, to_embed)
+    version, build_dir, done = resume_or_new_version(vector_db_dir, plan)
+    resumed_from = done
+    embeddings_path = os.path.join(build_dir, "embeddings.npy")
+    embeddings = None
+    if done:
+        try:
+            embeddings = np.load(embeddings_path, mmap_mode="r+")
+        except (OSError, ValueError):
+            pass
+        if embeddings is None or len(embeddings) != len(all_chunks):
+            print(f"Interrupted build {version} has no readable embeddings.npy, starting it over.")
+            embeddings, done, resumed_from = None, 0, 0
+        else:
+            print(f"Resuming interrupted build {version}: {done} of {len(to_embed)} new chunks already embedded")
+    if not done:
+        save_checkpoint(build_dir, {"plan": plan, "embedded": 0, "total": len(to_embed)})
+
+    # Embeddings go straight into embeddings.npy (memory-mapped), so only the rows being copied, embedded
+    # or added to FAISS are in memory: at most memory_budget_mb of them (a copy plus its normalized copy)
+    def rows_in_budget(dim: int) -> int:
+        return max(1, memory_budget_mb * 2**20 // (dim * 4 * 2))
+
+    def create_embeddings(dim: int):
+        return np.lib.format.open_memmap(embeddings_path, mode="w+", dtype="float32", shape=(len(all_chunks), dim))
 
-    all_chunks = []
-    for doc in docs:
-        doc_name = doc["doc_name"]
-        text = doc["text"]
+    kept_positions = [i for i, chunk in enumerate(all_chunks) if chunk["id"] in row_of]
+    if not done and kept_positions:
+        embeddings = create_embeddings(old_embeddings.shape[1])
+        step = rows_in_budget(old_embeddings.shape[1])
+        for start in range(0, len(kept_positions), step):
+            positions = kept_positions[start:start + step]
+            embeddings[positions] = old_embeddings[[row_of[all_chunks[i]["id"]] for i in positions]]
+        embeddings.flush()
+    del old_embeddings
 
-        chunks = chunk_text(text, chunk_size, chunk_overlap)
+    # Embed the chunks that have no embedding yet, saving a checkpoint after every checkpoint_chunks
+    if done < len(to_embed):
+        print(f"Creating embeddings for {len(to_embed) - done} new chunks (this may take a while)...")
+        embedder = get_embedder(embed_model_name)
+        cache = None
+        if embed_cache_dir:
+            cache = EmbeddingCache(embed_cache_dir, embed_model_name, embed_cache_max_entries)
+        for start in range(done, len(to_embed), max(1, checkpoint_chunks)):
+            positions = to_embed[start:start + max(1, checkpoint_chunks)]
+            vectors = embed_texts(embedder, [all_chunks[i]["text"] for i in positions], cache=cache,
+                                  batch_size=embed_batch_size, progress=False).astype("float32")
+            if embeddings is None:
+                embeddings = create_embeddings(vectors.shape[1])
+            embeddings[positions] = vectors
+            embeddings.flush()
+            done = start + len(positions)
+            save_checkpoint(build_dir, {"plan": plan, "embedded": done, "total": len(to_embed)})
+            print(f"  {done}/{len(to_embed)} chunks embedded")
 
-        for i, ch in enumerate(chunks):
-            all_chunks.append({
-                "doc_name": doc_name,
-                "chunk_id": i,
-                "text": ch
-            })
+    print(f"Building FAISS index ({faiss_index_type})...")
+    faiss_index = build_faiss_index(embeddings, faiss_index_type, faiss_params,
+                                    segment_rows=rows_in_budget(embeddings.shape[1]))
 
-    # Embed only the text field
-    embedder = get_embedder(embed_model_name)
-    chunk_texts = [c["text"] for c in all_chunks]
+    print("Building BM25 index...")
+    bm25_index = build_bm25_index(all_chunks)
 
-    embeddings = embed_texts(embedder, chunk_texts)
-    index = build_faiss_index(embeddings)
+    print(f"Saving combined index to {build_dir}...")
+    save_vector_db(faiss_index, bm25_index, all_chunks, build_dir, os.path.join(build_dir, FAISS_INDEX_FILE),
+                   os.path.join(build_dir, CHUNK_STORE_DIR))
+    del faiss_index, embeddings # a RerankIndex maps embeddings.npy
+    write_artifacts(build_dir, artifact_names())
+    index_bytes = sum(os.path.getsize(os.path.join(build_dir, name))
+                      for name in artifact_names() if os.path.exists(os.path.join(build_dir, name)))
+    with open(os.path.join(build_dir, DUPLICATES_FILE), "w", encoding="utf-8") as f:
+        json.dump(duplicates, f, ensure_ascii=False, indent=2)
+    if page_lines:
+        save_page_lines(page_lines, os.path.join(build_dir, LINES_FILE))
+    save_manifest({
+        "version": MANIFEST_VERSION,
+        **settings,
+        **index_settings,
+        "files": dict(sorted(manifest_files.items())),
+    }, os.path.join(build_dir, MANIFEST_FILE))
+    os.remove(os.path.join(build_dir, CHECKPOINT_FILE)) # complete: nothing left to resume
+    publish_version(vector_db_dir, version)
+    print(f"Published index version {version}")
+    for old in prune_versions(vector_db_dir, keep_versions):
+        print(f"Deleted old index version {old}")
 
-    save_vector_db(index, all_chunks, vector_db_dir, faiss_index_path, chunks_path)
+    # What de-duplication saved: chunks compared with chunking the pages as they were, size estimated per chunk
+    raw_chunks = sum(entry.get("raw_chunks", len(entry["chunk_ids"])) for entry in manifest_files.values())
+    saved_chunks = raw_chunks - len(all_chunks)
+    stats["dedup"] = {
+        "boilerplate_blocks": len(boilerplate),
+        "boilerplate_copies": sum(len(lines) for lines in strip.values()),
+        "near_duplicates": len(duplicates),
+        "raw_chunks": raw_chunks,
+        "saved_chunks": saved_chunks,
+        "saved_bytes": int(saved_chunks * index_bytes / len(all_chunks)),
+    }
+    if boilerplate_min_pages > 0 or dedup_jaccard:
+        d = stats["dedup"]
+        print(f"De-duplication: {d['boilerplate_blocks']} boilerplate blocks ({d['boilerplate_copies']} copies removed), "
+              f"{d['near_duplicates']} near-duplicate chunks left out of the index")
+        print(f"  {len(all_chunks)} chunks indexed instead of {raw_chunks} "
+              f"({saved_chunks} fewer, about {d['saved_bytes'] / 1024:,.0f} KB of index saved)")
 
-    return len(all_chunks), len(docs)
+    stats["embedded"] = len(to_embed) - resumed_from
+    stats["resumed"] = resumed_from
+    stats["chunks"] = len(all_chunks)
+    stats["version"] = version
+    stats["path"] = build_dir
+    return stats
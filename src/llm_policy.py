@@ -0,0 +1,185 @@
+import time
+import random
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from src.config import (
+    GROQ_FALLBACK_MODEL, GROQ_TIMEOUT_S, GROQ_DEADLINE_S, GROQ_MAX_RETRIES, GROQ_BACKOFF_BASE_S,
+    GROQ_BACKOFF_MAX_S, GROQ_HEDGE_AFTER_S
+)
+
+def classify_error(error: Exception) -> str:
+    """
+    Sorts an exception from the Groq client into "timeout", "rate_limit", "server", "connection" or "fatal".
+    Works on the groq SDK errors (and the fake client's) by their status code and class name,
+    so groq doesn't have to be imported here.
+    """
+    if isinstance(error, TimeoutError) or "Timeout" in type(error).__name__:
+        return "timeout"
+    status = getattr(error, "status_code", None)
+    if status == 429:
+        return "rate_limit"
+    if status is not None and status >= 500:
+        return "server"
+    if "Connection" in type(error).__name__:
+        return "connection"
+    return "fatal"
+
+def retry_after_s(error: Exception):
+    """The Retry-After header of a 429 / 503 response in seconds, or None."""
+    headers = getattr(getattr(error, "response", None), "headers", None) or {}
+    try:
+        return float(headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+class LLMStats:
+    """Thread-safe counters of what happened to LLM calls."""
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, n: int = 1):
+        with self._lock:
+            self._counts[name] = self._counts.get(name, 0) + n
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(sorted(self._counts.items()))
+
+class LLMPolicy:
+    """
+    Timeouts, retries, hedging and fallback around one chat completion call.
+
+    - Every attempt gets at most timeout_s, and the whole call (retries included) at most deadline_s.
+    - Timeouts, 429s, 5xx and connection errors are retried with jittered exponential backoff
+      (base * 2^attempt, capped at backoff_max_s), waiting at least the Retry-After the server asked for.
+    - With hedge_after_s set, a duplicate request is sent if the first hasn't answered by then;
+      whichever answers first is used.
+    - With a fallback_model, a 429 on the primary model sends calls to the fallback until the primary's
+      Retry-After has passed, and a timed out primary attempt is retried on the fallback. That switch is
+      an extra attempt, not one of the max_retries, so it also happens after the last retry.
+    Every outcome is counted in stats.
+    """
+
+    def __init__(self, fallback_model: str = None, timeout_s: float = 20.0, deadline_s: float = 45.0,
+                 max_retries: int = 3, backoff_base_s: float = 0.5, backoff_max_s: float = 8.0,
+                 hedge_after_s: float = None, stats: LLMStats = None):
+        self.fallback_model = fallback_model
+        self.timeout_s = timeout_s
+        self.deadline_s = deadline_s
+        self.max_retries = max_retries
+        self.backoff_base_s = backoff_base_s
+        self.backoff_max_s = backoff_max_s
+        self.hedge_after_s = hedge_after_s
+        self.stats = stats or LLMStats()
+        self._primary_saturated_until = 0.0
+        self._hedge_pool = None
+        self._lock = threading.Lock()
+
+    def call(self, create, model: str, hedge: bool = True, **kwargs):
+        """
+        Runs create(model=..., timeout=..., **kwargs) (e.g. client.chat.completions.create) under the policy.
+        Returns the response, or raises the last error once retries or the deadline run out.
+        hedge=False for streaming calls, where a duplicate stream can't be merged.
+        """
+        deadline = time.monotonic() + self.deadline_s
+        self.stats.inc("calls")
+        use_fallback = False
+        last_error = None
+        attempt, tries = 0, 0
+        while attempt <= self.max_retries:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            use_model = model
+            if self.fallback_model and (use_fallback or time.monotonic() < self._primary_saturated_until):
+                use_model = self.fallback_model
+                self.stats.inc("fallback_attempts")
+            if tries:
+                self.stats.inc("retries")
+            tries += 1
+            try:
+                response = self._attempt(create, use_model, min(self.timeout_s, remaining), hedge, kwargs)
+            except Exception as e:
+                kind = classify_error(e)
+                self.stats.inc({"timeout": "timeouts", "rate_limit": "rate_limited", "server": "server_errors",
+                                "connection": "connection_errors", "fatal": "fatal_errors"}[kind])
+                if kind == "fatal":
+                    self.stats.inc("failures")
+                    raise
+                last_error = e
+                retry_after = retry_after_s(e)
+                if self.fallback_model and use_model == model and kind in ("rate_limit", "timeout"):
+                    if kind == "rate_limit":
+                        # The primary is saturated: route calls to the fallback until it has room again
+                        with self._lock:
+                            self._primary_saturated_until = time.monotonic() + (retry_after or self.backoff_max_s)
+                    use_fallback = True
+                    continue # no need to wait (the fallback model has its own limits), nor to count a retry
+                delay = random.uniform(0, min(self.backoff_max_s, self.backoff_base_s * 2 ** attempt))
+                if retry_after is not None:
+                    delay = max(delay, retry_after)
+                if attempt == self.max_retries or time.monotonic() + delay >= deadline:
+                    break
+                time.sleep(delay)
+                attempt += 1
+                continue
+            self.stats.inc("successes")
+            if use_model != model:
+                self.stats.inc("fallback_successes")
+            return response
+
+        self.stats.inc("failures")
+        raise last_error or TimeoutError(f"LLM call ran out of its {self.deadline_s}s deadline")
+
+    def _attempt(self, create, model: str, timeout: float, hedge: bool, kwargs: dict):
+        """One attempt, with a hedged duplicate request if it's slow."""
+        if not hedge or not self.hedge_after_s or self.hedge_after_s >= timeout:
+            return create(model=model, timeout=timeout, **kwargs)
+
+        with self._lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = ThreadPoolExecutor(max_workers=16, thread_name_prefix="llm-hedge")
+        start = time.monotonic()
+        first = self._hedge_pool.submit(create, model=model, timeout=timeout, **kwargs)
+        done, _ = wait([first], timeout=self.hedge_after_s)
+        if done:
+            return first.result()
+
+        self.stats.inc("hedges")
+        second = self._hedge_pool.submit(create, model=model, timeout=timeout - self.hedge_after_s, **kwargs)
+        pending = [first, second]
+        error = None
+        while pending:
+            done, _ = wait(pending, timeout=max(0.0, start + timeout - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"No answer from {model} within {timeout:.1f}s (hedged)")
+            for future in done:
+                pending.remove(future)
+                if future.exception() is None:
+                    if future is second:
+                        self.stats.inc("hedge_wins")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+_default_policy = None
+_default_policy_lock = threading.Lock()
+
+def default_policy() -> LLMPolicy:
+    """The process-wide policy built from the GROQ_* settings in src/config.py."""
+    global _default_policy
+    with _default_policy_lock:
+        if _default_policy is None:
+            _default_policy = LLMPolicy(
+                fallback_model=GROQ_FALLBACK_MODEL,
+                timeout_s=GROQ_TIMEOUT_S,
+                deadline_s=GROQ_DEADLINE_S,
+                max_retries=GROQ_MAX_RETRIES,
+                backoff_base_s=GROQ_BACKOFF_BASE_S,
+                backoff_max_s=GROQ_BACKOFF_MAX_S,
+                hedge_after_s=GROQ_HEDGE_AFTER_S,
+            )
+        return _default_policy
@@ -0,0 +1,126 @@
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+
+FILTER_FIELDS = ("doc_name", "source", "doc_type", "tags")
+
+def doc_type(doc_name: str) -> str:
+    """"pdf" or "html" (from the file extension)."""
+    ext = os.path.splitext(doc_name)[1].lower().lstrip(".")
+    return "html" if ext == "htm" else ext
+
+def chunk_field_values(chunk: dict) -> dict:
+    """
+    The filterable values of one chunk, per field. A chunk that stands for near-duplicates in other
+    documents ("also_in", see src/dedup.py) matches their doc_name, source and doc_type too.
+    """
+    copies = [chunk] + chunk.get("also_in", [])
+    doc_names = list(dict.fromkeys(c["doc_name"] for c in copies))
+    return {
+        "doc_name": doc_names,
+        "source": list(dict.fromkeys(c.get("source", c["doc_name"]) for c in copies)),
+        "doc_type": list(dict.fromkeys(doc_type(name) for name in doc_names)),
+        "tags": chunk.get("tags", []),
+    }
+
+def check_filters(filters: dict):
+    """Raises ValueError if filters use a field that can't be filtered on (see FILTER_FIELDS)."""
+    for field in filters or {}:
+        if field not in FILTER_FIELDS:
+            raise ValueError(f"Unknown filter field: {field} (expected one of {FILTER_FIELDS})")
+
+class ChunkSubset:
+    """
+    The chunks that pass a filter: their sorted positions (ids), plus a boolean mask over all chunks
+    and a FAISS-style bitmap (bit i = chunk i, little-endian) built the first time they are needed.
+    """
+
+    def __init__(self, ids: np.ndarray, n_chunks: int):
+        self.ids = ids
+        self.n_chunks = n_chunks
+        self._mask = None
+        self._bitmap = None
+
+    def __len__(self):
+        return len(self.ids)
+
+    @property
+    def mask(self) -> np.ndarray:
+        if self._mask is None:
+            mask = np.zeros(self.n_chunks, dtype=bool)
+            mask[self.ids] = True
+            self._mask = mask
+        return self._mask
+
+    @property
+    def bitmap(self) -> np.ndarray:
+        if self._bitmap is None:
+            self._bitmap = np.packbits(self.mask, bitorder="little")
+        return self._bitmap
+
+class MetadataIndex:
+    """
+    Precomputed posting lists for filtering chunks by doc_name, source, doc_type ("pdf" / "html")
+    and the tags assigned at build time (DOC_TAGS in config).
+
+    select({"doc_type": "pdf", "tags": ["admissions", "fees"]}) returns the ChunkSubset of chunks
+    matching every field, and any of the values listed for a field. Recent subsets are cached,
+    since the same few filters (e.g. one per app page) come back again and again.
+    """
+
+    def __init__(self, chunks: list, cache_size: int = 128):
+        if hasattr(chunks, "postings"):
+            # A ChunkStore (src/chunk_store.py) builds them from its columns, without a dict per chunk
+            self.postings = chunks.postings()
+        else:
+            postings = {field: {} for field in FILTER_FIELDS}
+            for pos, chunk in enumerate(chunks):
+                for field, values in chunk_field_values(chunk).items():
+                    for value in values:
+                        postings[field].setdefault(value, []).append(pos)
+            self.postings = {
+                field: {value: np.array(positions, dtype="int64") for value, positions in values.items()}
+                for field, values in postings.items()
+            }
+        self.n_chunks = len(chunks)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+
+    def values(self, field: str) -> list:
+        """Every value of a field, e.g. values("doc_name") for a document picker."""
+        return sorted(self.postings[field])
+
+    def select(self, filters: dict):
+        """
+        The chunks matching filters ({field: value or list of values}), or None if filters is empty
+        (no filtering). Unknown fields raise ValueError; unknown values simply match nothing.
+        """
+        if not filters:
+            return None
+        check_filters(filters)
+        key = []
+        for field, wanted in filters.items():
+            wanted = [wanted] if isinstance(wanted, str) else wanted
+            key.append((field, tuple(sorted(set(wanted)))))
+        key = tuple(sorted(key))
+
+        with self._lock:
+            subset = self._cache.get(key)
+            if subset is not None:
+                self._cache.move_to_end(key)
+                return subset
+
+        ids = None
+        for field, wanted in key:
+            lists = [self.postings[field][value] for value in wanted if value in self.postings[field]]
+            field_ids = np.unique(np.concatenate(lists)) if lists else np.zeros(0, dtype="int64")
+            ids = field_ids if ids is None else np.intersect1d(ids, field_ids, assume_unique=True)
+        subset = ChunkSubset(ids, self.n_chunks)
+
+        with self._lock:
+            self._cache[key] = subset
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return subset
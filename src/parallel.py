@@ -0,0 +1,29 @@
+from concurrent.futures import ProcessPoolExecutor
+
+def _call_safely(func, args):
+    """
+    Runs func(*args) and returns (result, error_message).
+    Errors are caught inside the worker so one bad file doesn't stop the others.
+    """
+    try:
+        return func(*args), None
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+
+def parallel_map(func, args_list: list, workers: int = 1):
+    """
+    Calls func(*args) for every args tuple in args_list, using a pool of worker processes.
+    Results come back in the same order as args_list, as (result, error_message) pairs.
+
+    func must be a top-level function so it can be sent to the worker processes.
+    With workers <= 1 (or a single item) everything runs in this process.
+    """
+    args_list = list(args_list)
+    workers = min(workers or 1, len(args_list))
+    if workers <= 1:
+        return [_call_safely(func, args) for args in args_list]
+
+    # Hand out work in small batches so thousands of tiny files don't pay one round-trip each
+    chunksize = max(1, len(args_list) // (workers * 4))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_call_safely, [func] * len(args_list), args_list, chunksize=chunksize))
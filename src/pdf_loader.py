@@ -1,39 +1,52 @@
 import os
 from pypdf import PdfReader
+from src.parallel import parallel_map
 
-def load_pdf_text(pdf_path: str) -> str:
+def load_pdf_pages(pdf_path: str) -> list:
     """
-    Reads a single PDF file and extracts all text from it.
-    Returns the full text as one string.
+    Reads a single PDF file and returns [(page_number, text)] for every page with text
+    (page numbers start at 1).
     """
     reader = PdfReader(pdf_path)
 
     pages = []
-    for page in reader.pages:
+    for number, page in enumerate(reader.pages, start=1):
         text = page.extract_text() or "" # Get text from each page
         text = text.replace("\n", " ").strip() # Remove newlines and extra spaces
         if text:
-            pages.append(text)
+            pages.append((number, text))
+    return pages
 
-    return "\n".join(pages) # Join all pages into a single string
+def load_pdf_text(pdf_path: str) -> str:
+    """
+    Reads a single PDF file and extracts all text from it.
+    Returns the full text as one string.
+    """
+    return "\n".join(text for _, text in load_pdf_pages(pdf_path)) # Join all pages into a single string
 
-def load_all_pdfs_from_folder(folder_path: str):
+def load_all_pdfs_from_folder(folder_path: str, workers: int = 1):
     """
-    Returns list of dictionaries:
+    Returns list of dictionaries, sorted by file name:
     [
       {"doc_name": "paper1.pdf", "text": "..."},
       {"doc_name": "paper2.pdf", "text": "..."}
     ]
+    With workers > 1 the PDFs are parsed in parallel worker processes.
+    A PDF that fails to parse is reported and skipped.
     """
+    filenames = sorted(f for f in os.listdir(folder_path) if f.lower().endswith(".pdf"))
+    paths = [os.path.join(folder_path, filename) for filename in filenames]
+    results = parallel_map(load_pdf_text, [(path,) for path in paths], workers)
+
     pdfs = []
-    for filename in os.listdir(folder_path):
-        if filename.lower().endswith(".pdf"):
-            full_path = os.path.join(folder_path, filename)
-            text = load_pdf_text(full_path)
-            if text.strip():
-                pdfs.append({
-                    "doc_name": filename, 
-                    "text": text,
-                    "source": filename # Store source
-                })
+    for filename, (text, error) in zip(filenames, results):
+        if error:
+            print(f"Error reading {filename}: {error}")
+            continue
+        if text.strip():
+            pdfs.append({
+                "doc_name": filename, 
+                "text": text,
+                "source": filename # Store source
+            })
     return pdfs
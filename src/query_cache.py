@@ -0,0 +1,73 @@
+import re
+import threading
+from collections import OrderedDict
+
+_PUNCTUATION = re.compile(r"[^\w\s]")
+_WHITESPACE = re.compile(r"\s+")
+
+def normalize_query(query: str) -> str:
+    """
+    Folds case, punctuation and whitespace, so
+    "Fee structure?" and "  fee   STRUCTURE " share one cache entry.
+    """
+    query = _PUNCTUATION.sub(" ", query.lower())
+    return _WHITESPACE.sub(" ", query).strip()
+
+class QueryEmbeddingCache:
+    """
+    Bounded in-process LRU cache of query embeddings.
+    Thread-safe, so every Streamlit session (one thread each) can share one instance.
+    """
+
+    def __init__(self, max_entries: int = 2048):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, query: str):
+        """Returns the cached embedding for this query, or None."""
+        key = normalize_query(query)
+        with self._lock:
+            vector = self._entries.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, query: str, vector):
+        """Stores an embedding, evicting the least recently used entry when full."""
+        key = normalize_query(query)
+        with self._lock:
+            self._entries[key] = vector
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+            }
+
+_shared_cache = None
+_shared_lock = threading.Lock()
+
+def get_query_cache(max_entries: int = 2048) -> QueryEmbeddingCache:
+    """
+    Returns the process-wide query cache (created on first use).
+    A process only ever loads one embedding model, so one cache is enough.
+    """
+    global _shared_cache
+    with _shared_lock:
+        if _shared_cache is None:
+            _shared_cache = QueryEmbeddingCache(max_entries)
+        return _shared_cache
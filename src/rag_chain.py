@@ -1,26 +1,159 @@
+import time
+from src.config import CHUNK_OVERLAP, CONTEXT_TOKEN_BUDGET, CONTEXT_DEDUP_THRESHOLD
 from src.retriever import retrieve_top_k
-from src.groq_llm import groq_answer
+from src.embedder import embed_query
+from src.context_packer import pack_context
+from src.groq_llm import groq_answer, groq_answer_stream
+from src.tracing import span, start_trace, activate, finish_trace, current_trace
 
-def rag_query(question: str, embedder, index, chunks, top_k: int, groq_client, groq_model, bm25=None):
+NO_RESULTS_ANSWER = "I couldn't find any information about that in the university documents."
+
+def rag_retrieve(question: str, embedder, index, chunks, top_k: int, bm25=None, query_cache=None, answer_cache=None,
+                 q_emb=None, faiss_ids=None, filters=None, metadata=None, shards=None, collections=None):
+    """
+    The part of the RAG pipeline before the LLM call:
+    1. Embed the question (once, for both the answer cache and retrieval).
+    2. Reuse a cached answer if a similar question was answered before (optional).
+    3. Otherwise retrieve relevant chunks using Hybrid Search.
+
+    q_emb / faiss_ids can be passed in when the question was already embedded / searched
+    (see EmbeddingBatcher). filters / metadata limit the search to some documents, and shards / collections
+    search several collections (see retrieve_top_k); questions limited to some documents or collections
+    skip the answer cache, whose answers may come from other documents.
+
+    Returns: (query_embedding, cached_answer_and_sources or None, list_of_retrieved_chunks)
+    """
+    if q_emb is None:
+        with span("embed_query"):
+            q_emb = embed_query(embedder, question, cache=query_cache)
+
+    if answer_cache is not None and not (filters or collections):
+        with span("answer_cache_lookup"):
+            cached = answer_cache.lookup(q_emb)
+        if cached is not None:
+            return q_emb, cached, cached[1]
+
+    relevant_chunks = retrieve_top_k(question, embedder, index, chunks, top_k, bm25=bm25, q_emb=q_emb,
+                                     faiss_ids=faiss_ids, filters=filters, metadata=metadata, shards=shards,
+                                     collections=collections)
+    return q_emb, None, relevant_chunks
+
+def build_context(relevant_chunks: list) -> list[str]:
+    """
+    The context passages sent to Groq: neighbouring chunks merged without their overlap,
+    near-duplicates dropped, packed best first into CONTEXT_TOKEN_BUDGET (see src/context_packer.py).
+    """
+    with span("pack_context"):
+        passages = pack_context(relevant_chunks, CONTEXT_TOKEN_BUDGET, 2 * CHUNK_OVERLAP, CONTEXT_DEDUP_THRESHOLD)
+    trace = current_trace()
+    if trace is not None:
+        trace.set(context_passages=len(passages), context_tokens=sum(p["tokens"] for p in passages))
+    return [p["text"] for p in passages]
+
+def rag_query(question: str, embedder, index, chunks, top_k: int, groq_client, groq_model, bm25=None, query_cache=None,
+              answer_cache=None, filters=None, metadata=None, shards=None, collections=None):
     """
     End-to-end RAG pipeline:
-    1. Retrieve relevant chunks using Hybrid Search.
-    2. Generate answer using Groq.
+    1. Reuse a cached answer if a similar question was answered before (optional).
+    2. Retrieve relevant chunks using Hybrid Search (only from documents matching filters, if given;
+       across the shards named in collections, if shards are given).
+    3. Generate answer using Groq.
+
+    Each stage is timed into a trace (see src/tracing.py) when tracing is enabled.
     
     Returns: (answer_text, list_of_retrieved_chunks)
     """
-    
-    # Retrieve relevant chunks
-    relevant_chunks = retrieve_top_k(question, embedder, index, chunks, top_k, bm25=bm25)
+    trace = start_trace("rag_query", top_k=top_k, **_scope(filters, collections))
+    with activate(trace):
+        try:
+            return _rag_query(question, embedder, index, chunks, top_k, groq_client, groq_model, bm25, query_cache,
+                              answer_cache, trace, filters, metadata, shards, collections)
+        finally:
+            finish_trace(trace)
+
+def _scope(filters, collections) -> dict:
+    """Trace attributes for a question limited to some documents or collections."""
+    return {**({"filters": filters} if filters else {}), **({"collections": collections} if collections else {})}
+
+def _rag_query(question, embedder, index, chunks, top_k, groq_client, groq_model, bm25, query_cache, answer_cache,
+               trace, filters, metadata, shards, collections):
+    # Step 1 + 2: Check the answer cache, else retrieve relevant chunks
+    q_emb, cached, relevant_chunks = rag_retrieve(
+        question, embedder, index, chunks, top_k, bm25=bm25, query_cache=query_cache, answer_cache=answer_cache,
+        filters=filters, metadata=metadata, shards=shards, collections=collections
+    )
+    if trace is not None:
+        trace.set(cached=cached is not None, chunks=len(relevant_chunks))
+    if cached is not None:
+        return cached
     
     if not relevant_chunks:
-        return "I couldn't find any information about that in the university documents.", []
+        return NO_RESULTS_ANSWER, []
     
-    # Step 2: Extract text from chunk objects for the LLM
-    context_texts = [chunk["text"] for chunk in relevant_chunks]
+    # Pack the chunk texts into the LLM context
+    context_texts = build_context(relevant_chunks)
     
     # Step 3: Send to LLM with context
     answer = groq_answer(groq_client, groq_model, question, context_texts)
+
+    if answer_cache is not None and not (filters or collections):
+        with span("answer_cache_store"):
+            answer_cache.store(question, q_emb, answer, relevant_chunks)
     
-    # Step 4: Return answer and context
+    # Return answer and context
     return answer, relevant_chunks
+
+def rag_query_stream(question: str, embedder, index, chunks, top_k: int, groq_client, groq_model, bm25=None,
+                     query_cache=None, answer_cache=None, filters=None, metadata=None, shards=None, collections=None):
+    """
+    Streaming version of rag_query.
+    Retrieval happens right away, so the sources are known before the answer starts.
+
+    Returns: (token_iterator, list_of_retrieved_chunks, timings)
+    timings is filled in while the tokens are consumed: "retrieval_s", "first_token_s" and "total_s"
+    (seconds since the call started). A cached answer comes back as a single piece.
+    When tracing is enabled, timings["trace"] is the request's Trace (complete once the tokens are consumed).
+    """
+    start = time.perf_counter()
+    trace = start_trace("rag_query_stream", top_k=top_k, **_scope(filters, collections))
+    timings = {"trace": trace} if trace is not None else {}
+    with activate(trace):
+        q_emb, cached, relevant_chunks = rag_retrieve(
+            question, embedder, index, chunks, top_k, bm25=bm25, query_cache=query_cache, answer_cache=answer_cache,
+            filters=filters, metadata=metadata, shards=shards, collections=collections
+        )
+        context_texts = build_context(relevant_chunks) if cached is None and relevant_chunks else []
+    timings["retrieval_s"] = time.perf_counter() - start
+    if trace is not None:
+        trace.set(cached=cached is not None, chunks=len(relevant_chunks))
+
+    if cached is not None or not relevant_chunks:
+        answer = cached[0] if cached is not None else NO_RESULTS_ANSWER
+        timings["first_token_s"] = timings["total_s"] = timings["retrieval_s"]
+        finish_trace(trace)
+        return iter([answer]), relevant_chunks, timings
+
+    def tokens():
+        pieces = []
+        outcome = "cancelled" # until the stream is read to the end (the consumer may stop early)
+        try:
+            for token in groq_answer_stream(groq_client, groq_model, question, context_texts, trace=trace):
+                if not pieces:
+                    timings["first_token_s"] = time.perf_counter() - start
+                pieces.append(token)
+                yield token
+            outcome = None
+            timings["total_s"] = time.perf_counter() - start
+            if answer_cache is not None and not (filters or collections):
+                with span("answer_cache_store", trace):
+                    answer_cache.store(question, q_emb, "".join(pieces), relevant_chunks)
+        except Exception as e:
+            outcome = f"error: {type(e).__name__}"
+            raise
+        finally:
+            # Every question ends up in the trace log and the percentiles, including failed and abandoned ones
+            if trace is not None and outcome:
+                trace.set(outcome=outcome)
+            finish_trace(trace)
+
+    return tokens(), relevant_chunks, timings
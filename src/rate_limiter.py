@@ -0,0 +1,59 @@
+import time
+import threading
+
+class RateLimiter:
+    """
+    Keeps Groq calls under a requests-per-minute and a tokens-per-minute limit (token buckets).
+
+    acquire(tokens) blocks until one more request with about `tokens` tokens fits in both limits.
+    Token counts are estimated before the call; adjust() corrects the bucket with the real
+    usage afterwards, so underestimates slow the next calls down instead of hitting a 429.
+    A limit of 0 or None means unlimited.
+    """
+
+    def __init__(self, requests_per_minute: float = None, tokens_per_minute: float = None):
+        self.rpm = requests_per_minute or 0
+        self.tpm = tokens_per_minute or 0
+        self._requests = float(self.rpm)
+        self._tokens = float(self.tpm)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.waited_s = 0.0
+
+    def _refill(self):
+        now = time.monotonic()
+        elapsed = now - self._updated
+        self._updated = now
+        if self.rpm:
+            self._requests = min(self.rpm, self._requests + elapsed * self.rpm / 60)
+        if self.tpm:
+            self._tokens = min(self.tpm, self._tokens + elapsed * self.tpm / 60)
+
+    def acquire(self, tokens: int = 0):
+        """Waits until the request fits, then takes it out of the buckets."""
+        if self.tpm:
+            tokens = min(tokens, self.tpm) # a request larger than the whole budget would wait forever
+        while True:
+            with self._lock:
+                self._refill()
+                wait = 0.0
+                if self.rpm and self._requests < 1:
+                    wait = max(wait, (1 - self._requests) * 60 / self.rpm)
+                if self.tpm and self._tokens < tokens:
+                    wait = max(wait, (tokens - self._tokens) * 60 / self.tpm)
+                if wait == 0.0:
+                    if self.rpm:
+                        self._requests -= 1
+                    if self.tpm:
+                        self._tokens -= tokens
+                    return
+                self.waited_s += wait
+            time.sleep(wait)
+
+    def adjust(self, delta_tokens: int):
+        """Adds (actual - estimated) tokens of a finished request to the tokens-per-minute bucket."""
+        if not self.tpm or not delta_tokens:
+            return
+        with self._lock:
+            self._refill()
+            self._tokens -= delta_tokens
@@ -1,58 +1,213 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
+from src.config import FAISS_FETCH_MULTIPLIER, BM25_FETCH_MULTIPLIER, RRF_K, SHARD_SEARCH_WORKERS
+from src.embedder import embed_query
+from src.bm25 import tokenize
+from src.vector_store import prepare_query, search_subset, similarity_scores
+from src.metadata_filter import MetadataIndex
+from src.shards import select_shards
+from src.tracing import span, current_trace
 
-def retrieve_top_k(query: str, embedder, index, chunks, top_k: int, bm25=None):
+def faiss_search(index, q_emb: np.ndarray, k: int, n_chunks: int, faiss_ids: np.ndarray = None, subset=None):
+    """
+    Semantic search. Returns (positions, ranks) of the best chunks, best first.
+    Ranks count every FAISS result, including empty (-1) slots that are dropped.
+    faiss_ids: ids already found by a batched search (e.g. EmbeddingBatcher), skips index.search.
+    subset: a ChunkSubset (see src/metadata_filter.py) to search only those chunks.
+    """
+    if faiss_ids is None:
+        if subset is not None:
+            _, faiss_indices = search_subset(index, q_emb, k, subset)
+        else:
+            _, faiss_indices = index.search(q_emb, k)
+        faiss_ids = faiss_indices[0]
+    positions = faiss_ids[:k]
+    valid = (positions != -1) & (positions < n_chunks)
+    return positions[valid].astype("int64"), np.flatnonzero(valid)
+
+def bm25_search(bm25, query: str, k: int, subset=None) -> np.ndarray:
+    """Keyword search. Returns the positions of the best chunks, best first (only chunks of subset, if given)."""
+    return bm25_search_scored(bm25, query, k, subset)[0]
+
+def bm25_search_scored(bm25, query: str, k: int, subset=None):
+    """Like bm25_search, but returns (positions, scores)."""
+    tokenized_query = tokenize(query)
+    mask = subset.mask if subset is not None else None
+    if hasattr(bm25, "top_n"):
+        return bm25.top_n(tokenized_query, k, mask=mask)
+    # Old pickled rank_bm25 index
+    scores = bm25.get_scores(tokenized_query)
+    if mask is not None:
+        scores = np.where(mask, scores, -np.inf)
+        k = min(k, len(subset))
+    positions = np.argsort(scores)[::-1][:k].astype("int64")
+    return positions, scores[positions]
+
+def rrf_fuse(ranked_lists: list, top_k: int, rrf_k: int = 60) -> np.ndarray:
+    """
+    Reciprocal Rank Fusion over lists of (positions, ranks).
+    Score = sum of 1 / (rrf_k + rank) over the lists a chunk appears in.
+    Ties keep the order in which chunks were first seen (FAISS results first).
+    Works only on the few fetched candidates, so the cost doesn't grow with the corpus.
+    """
+    positions = np.concatenate([p for p, _ in ranked_lists])
+    if len(positions) == 0:
+        return positions
+    ranks = np.concatenate([r for _, r in ranked_lists])
+    unique_positions, first_seen, inverse = np.unique(positions, return_index=True, return_inverse=True)
+    scores = np.zeros(len(unique_positions), dtype="float64")
+    np.add.at(scores, inverse, 1.0 / (rrf_k + ranks))
+    order = np.lexsort((first_seen, -scores))[:top_k]
+    return unique_positions[order]
+
+_EMPTY = (np.zeros(0, dtype="int64"), np.zeros(0, dtype="float64"))
+
+def shard_candidates(shard: dict, query: str, q_emb: np.ndarray, faiss_fetch: int, bm25_fetch: int,
+                     filters: dict = None):
+    """
+    One shard's part of a fan-out search: its best FAISS and BM25 candidates, each as (positions, scores)
+    with higher scores better. shard is a dict with "index", "chunks" and optionally "bm25" / "metadata".
+    """
+    index, chunks, bm25 = shard["index"], shard["chunks"], shard.get("bm25")
+    subset = None
+    if filters:
+        subset = (shard.get("metadata") or MetadataIndex(chunks)).select(filters)
+        if len(subset) == 0:
+            return _EMPTY, _EMPTY
+
+    q = prepare_query(index, q_emb)
+    if subset is not None:
+        distances, ids = search_subset(index, q, faiss_fetch, subset)
+    else:
+        distances, ids = index.search(q, faiss_fetch)
+    valid = (ids[0] != -1) & (ids[0] < len(chunks))
+    faiss_results = ids[0][valid].astype("int64"), similarity_scores(index, distances[0][valid]).astype("float64")
+
+    bm25_results = bm25_search_scored(bm25, query, bm25_fetch, subset) if bm25 else _EMPTY
+    return faiss_results, bm25_results
+
+def _merge_ranked(parts: list, offsets: list, fetch: int):
+    """
+    The best `fetch` of several shards' (positions, scores) lists by score, as (positions, ranks),
+    with positions shifted by each shard's offset so they are unique across shards.
+    Ties keep shard order, then each shard's own order.
+    """
+    positions = np.concatenate([p + offset for (p, _), offset in zip(parts, offsets)])
+    scores = np.concatenate([s for _, s in parts])
+    order = np.argsort(-scores, kind="stable")[:fetch]
+    return positions[order], np.arange(len(order))
+
+_shard_pool = None
+_shard_pool_lock = threading.Lock()
+
+def _get_shard_pool() -> ThreadPoolExecutor:
+    global _shard_pool
+    with _shard_pool_lock:
+        if _shard_pool is None:
+            _shard_pool = ThreadPoolExecutor(max_workers=SHARD_SEARCH_WORKERS, thread_name_prefix="shard-search")
+        return _shard_pool
+
+def search_shards(query: str, q_emb: np.ndarray, shards: dict, top_k: int, faiss_fetch: int, bm25_fetch: int,
+                  rrf_k: int = RRF_K, filters: dict = None) -> list:
+    """
+    Searches every shard in parallel (FAISS and BM25 on each) and merges the results:
+    the FAISS candidates of all shards are ranked together by similarity (comparable, since every shard
+    uses the same embedding model), the BM25 candidates by score (approximately comparable: each shard
+    has its own IDF), and the two global lists are fused with RRF, exactly as for a single index.
+    Each shard's time is recorded as a "shard:<name>" span of the current trace.
+    """
+    trace = current_trace()
+
+    def search_one(name, shard):
+        with span(f"shard:{name}", trace):
+            return shard_candidates(shard, query, q_emb, faiss_fetch, bm25_fetch, filters)
+
+    pool = _get_shard_pool()
+    futures = [pool.submit(search_one, name, shard) for name, shard in shards.items()]
+    results = [future.result() for future in futures]
+
+    shard_chunks = [shard["chunks"] for shard in shards.values()]
+    offsets = np.cumsum([0] + [len(chunks) for chunks in shard_chunks[:-1]]).tolist()
+    with span("fusion"):
+        faiss_results = _merge_ranked([faiss for faiss, _ in results], offsets, faiss_fetch)
+        if any(shard.get("bm25") for shard in shards.values()):
+            bm25_results = _merge_ranked([bm25 for _, bm25 in results], offsets, bm25_fetch)
+            fused = rrf_fuse([faiss_results, bm25_results], top_k, rrf_k)
+        else:
+            fused = faiss_results[0][:top_k]
+
+    # Map global positions back to (shard, position)
+    which = np.searchsorted(offsets, fused, side="right") - 1
+    return [shard_chunks[s][pos - offsets[s]] for s, pos in zip(which.tolist(), fused.tolist())]
+
+def retrieve_top_k(query: str, embedder, index, chunks, top_k: int, bm25=None, query_cache=None,
+                   faiss_fetch: int = None, bm25_fetch: int = None, rrf_k: int = RRF_K, q_emb=None, faiss_ids=None,
+                   filters: dict = None, metadata: MetadataIndex = None, shards: dict = None,
+                   collections: list = None):
     """
     Finds the most similar chunks using Hybrid Search (FAISS + BM25).
     Combines scores using Reciprocal Rank Fusion (RRF).
+    Pass a QueryEmbeddingCache to reuse embeddings of repeated questions,
+    or q_emb if the query was already embedded (and faiss_ids if it was already searched).
+
+    filters restricts the search to matching chunks, e.g. {"doc_type": "pdf"} or
+    {"doc_name": ["Admissions Policy.pdf"], "tags": "fees"} (see src/metadata_filter.py).
+    Both searches only score the matching chunks, so top_k results come back whenever that many match.
+    Pass the MetadataIndex built at startup as metadata; without it, one is built for this call.
+
+    shards ({collection name: {"index", "bm25", "chunks", "metadata"}}, see src/shards.py) searches several
+    collections instead of index / chunks: those named in collections (all by default), in parallel,
+    with their candidates merged into one global top_k (see search_shards).
+
+    faiss_fetch / bm25_fetch: candidates taken from each search
+    (default FAISS_FETCH_MULTIPLIER / BM25_FETCH_MULTIPLIER times top_k).
+    Everything works on integer chunk positions (FAISS row = BM25 document = index in chunks).
     """
+    faiss_fetch = faiss_fetch or top_k * FAISS_FETCH_MULTIPLIER
+    bm25_fetch = bm25_fetch or top_k * BM25_FETCH_MULTIPLIER
+
+    if shards is not None:
+        selected = select_shards(shards, collections)
+        if not selected:
+            return [] # no index published (see _index_view in src/startup.py)
+        if len(selected) > 1:
+            if q_emb is None:
+                with span("embed_query"):
+                    q_emb = embed_query(embedder, query, cache=query_cache)
+            return search_shards(query, q_emb, selected, top_k, faiss_fetch, bm25_fetch, rrf_k, filters)
+        # A single shard is searched directly, like a lone index
+        shard = next(iter(selected.values()))
+        if shard["index"] is not index:
+            faiss_ids = None # a batched search went to another index
+        index, chunks, bm25, metadata = shard["index"], shard["chunks"], shard.get("bm25"), shard.get("metadata")
+
+    subset = None
+    if filters:
+        with span("filter"):
+            subset = (metadata or MetadataIndex(chunks)).select(filters)
+        if len(subset) == 0:
+            return []
+        faiss_ids = None # a batched search wasn't filtered
+
     # 1. FAISS Search (Semantic)
-    q_emb = embedder.encode([query], convert_to_numpy=True).astype("float32")
-    _, faiss_indices = index.search(q_emb, top_k * 2) # Fetch more for fusion
-    
-    faiss_results = []
-    for rank, idx in enumerate(faiss_indices[0]):
-        if idx != -1 and idx < len(chunks):
-            faiss_results.append((chunks[idx], rank))
+    if q_emb is None:
+        with span("embed_query"):
+            q_emb = embed_query(embedder, query, cache=query_cache)
+    with span("faiss_search"):
+        q_emb = prepare_query(index, q_emb)
+        faiss_results = faiss_search(index, q_emb, faiss_fetch, len(chunks), faiss_ids=faiss_ids, subset=subset)
 
     if not bm25:
         # Fallback to just FAISS if BM25 isn't available
-        return [res[0] for res in faiss_results[:top_k]]
+        return [chunks[i] for i in faiss_results[0][:top_k]]
 
     # 2. BM25 Search (Keyword)
-    tokenized_query = query.lower().split()
-    bm25_results = bm25.get_top_n(tokenized_query, chunks, n=top_k * 2)
-    
-    # Map chunks to their BM25 rank
-    # Note: BM25 returns chunk objects directly. We need to find their index in the 'chunks' list or just use object identity.
-    # Since 'chunks' is a list of dicts, let's create a map for quick lookup.
-    chunk_id_to_rank = {chunk["id"]: i for i, chunk in enumerate(bm25_results)}
+    with span("bm25_search"):
+        bm25_positions = bm25_search(bm25, query, bm25_fetch, subset)
+    bm25_results = (bm25_positions, np.arange(len(bm25_positions)))
 
     # 3. Reciprocal Rank Fusion
-    # Score = 1 / (k + rank)
-    k = 60
-    scores = {}
-
-    # Score FAISS results
-    for chunk, rank in faiss_results:
-        chunk_id = chunk["id"]
-        if chunk_id not in scores: scores[chunk_id] = 0
-        scores[chunk_id] += 1 / (k + rank)
-
-    # Score BM25 results
-    for rank, chunk in enumerate(bm25_results):
-        chunk_id = chunk["id"]
-        if chunk_id not in scores: scores[chunk_id] = 0
-        scores[chunk_id] += 1 / (k + rank)
-
-    # Sort by combined score
-    sorted_chunk_ids = sorted(scores.keys(), key=lambda x: scores[x], reverse=True)
-    
-    # Retrieve final top_k chunks
-    # Create a lookup for all chunks by ID to fetching
-    all_chunks_map = {c["id"]: c for c in chunks}
-    
-    final_results = []
-    for cid in sorted_chunk_ids[:top_k]:
-        final_results.append(all_chunks_map[cid])
-        
-    return final_results
\ No newline at end of file
+    with span("fusion"):
+        fused = rrf_fuse([faiss_results, bm25_results], top_k, rrf_k)
+    return [chunks[i] for i in fused]
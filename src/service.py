@@ -0,0 +1,310 @@
+import json
+import time
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from src.config import FAISS_FETCH_MULTIPLIER
+from src.rag_chain import rag_retrieve, build_context, NO_RESULTS_ANSWER
+from src.groq_llm import groq_answer
+from src.tracing import span, start_trace, activate, finish_trace, stage_percentiles
+from src.llm_policy import default_policy
+from src.metadata_filter import check_filters
+from src.shards import select_shards
+
+MAX_BODY_BYTES = 64 * 1024
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed",
+               413: "Payload Too Large", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+class HTTPError(Exception):
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+class RagService:
+    """
+    Serves rag_query over HTTP with asyncio.
+
+    - One loaded index, embedder and Groq client (which pools its HTTP connections) shared by all requests.
+    - Retrieval (embedding, FAISS, BM25) runs in a bounded thread pool, so it never blocks the event loop.
+    - At most max_inflight_llm Groq calls run at once; further requests wait for a free slot.
+
+    load_components is a function returning a dict with "index", "bm25", "chunks", "embedder",
+    "groq_client" and optionally "metadata" / "shards" / "query_cache" / "answer_cache" / "batcher".
+    It runs in the background, and /readyz reports when it is done. With an EmbeddingBatcher, concurrent questions are
+    embedded and searched in FAISS together, and waiting for it doesn't hold a pool thread.
+
+    With reload_components (e.g. src.startup.reload_index), a newly published index version is loaded
+    every reload_interval_s in the background and swapped in by replacing self.components. Each request
+    takes the components once when it starts, so requests in flight finish on the version they began with.
+
+    Every request is traced (see src/tracing.py); /stats reports p50/p95/p99 per stage.
+    """
+
+    def __init__(self, load_components, top_k: int, groq_model: str,
+                 retrieval_workers: int = 4, max_inflight_llm: int = 8,
+                 reload_components=None, reload_interval_s: float = 0):
+        self.load_components = load_components
+        self.reload_components = reload_components
+        self.reload_interval_s = reload_interval_s
+        self.reloads = 0
+        self.top_k = top_k
+        self.groq_model = groq_model
+        self.max_inflight_llm = max_inflight_llm
+        self.components = None
+        self.load_error = None
+        self.started_at = time.time()
+        self.loaded_after_s = None
+        self.inflight_llm = 0
+        self.retrieval_pool = ThreadPoolExecutor(max_workers=retrieval_workers, thread_name_prefix="retrieval")
+        self.llm_pool = ThreadPoolExecutor(max_workers=max_inflight_llm, thread_name_prefix="llm")
+        self.llm_slots = None # asyncio.Semaphore, created inside the event loop
+
+    async def load(self):
+        """
+        Loads the index and models in a worker thread, leaving the server responsive meanwhile,
+        then keeps watching for new index versions (if reloading is on).
+        """
+        loop = asyncio.get_running_loop()
+        try:
+            self.components = await loop.run_in_executor(self.retrieval_pool, self.load_components)
+            self.loaded_after_s = time.time() - self.started_at
+            print(f"Index loaded after {self.loaded_after_s:.1f}s, ready to serve.")
+        except Exception as e:
+            self.load_error = f"{type(e).__name__}: {e}"
+            print(f"Failed to load the index: {self.load_error}")
+            return
+        if self.reload_components is not None and self.reload_interval_s:
+            await self.watch_index()
+
+    async def watch_index(self):
+        """Loads newly published index versions (on a thread outside the retrieval pool) and swaps them in."""
+        loop = asyncio.get_running_loop()
+        last_error = None
+        while True:
+            await asyncio.sleep(self.reload_interval_s)
+            try:
+                components = await loop.run_in_executor(None, self.reload_components, self.components)
+            except Exception as e:
+                error = f"{type(e).__name__}: {e}"
+                if error != last_error:
+                    print(f"Could not load the new index version, still serving the old one. {error}")
+                last_error = error
+                continue
+            last_error = None
+            if components is not None:
+                self.components = components
+                self.reloads += 1
+                print(f"Now serving index version {components.get('index_version')}.")
+
+    async def answer(self, question: str, top_k: int = None, filters: dict = None, collections: list = None) -> dict:
+        """
+        Runs the RAG pipeline for one question (only on the chunks matching filters
+        and in the named collections, if given).
+        """
+        if self.components is None:
+            raise HTTPError(503, "Index is still loading" if self.load_error is None else self.load_error)
+        c = self.components
+        try:
+            # Client mistakes are told apart here; any other error in the pipeline is a 500
+            check_filters(filters)
+            if c.get("shards") is not None:
+                select_shards(c["shards"], collections)
+        except ValueError as e:
+            raise HTTPError(400, str(e))
+        loop = asyncio.get_running_loop()
+        start = time.perf_counter()
+        top_k = top_k or self.top_k
+        trace = start_trace("service_query", top_k=top_k, **({"filters": filters} if filters else {}),
+                            **({"collections": collections} if collections else {}))
+        try:
+            return await self._answer(c, loop, start, question, top_k, filters, collections, trace)
+        finally:
+            finish_trace(trace)
+
+    def _traced(self, trace, func, *args):
+        """Runs func with trace as the current trace (executor threads don't inherit it)."""
+        with activate(trace):
+            return func(*args)
+
+    async def _answer(self, c, loop, start, question, top_k, filters, collections, trace):
+        q_emb = faiss_ids = None
+        if c.get("batcher") is not None:
+            # A filtered or multi-collection question only gets its embedding from the batch, and searches on its own
+            search_alone = filters or len(c.get("shards") or ()) > 1
+            with span("batch_embed_search", trace):
+                q_emb, faiss_ids = await asyncio.wrap_future(
+                    c["batcher"].submit(question, search_k=0 if search_alone else top_k * FAISS_FETCH_MULTIPLIER,
+                                        index=c["index"])
+                )
+
+        q_emb, cached, relevant_chunks = await loop.run_in_executor(
+            self.retrieval_pool,
+            lambda: self._traced(trace, rag_retrieve, question, c["embedder"], c["index"], c["chunks"], top_k,
+                                 c["bm25"], c.get("query_cache"), c.get("answer_cache"), q_emb, faiss_ids,
+                                 filters, c.get("metadata"), c.get("shards"), collections),
+        )
+        retrieval_s = time.perf_counter() - start
+        if trace is not None:
+            trace.set(cached=cached is not None, chunks=len(relevant_chunks))
+
+        if cached is not None:
+            answer = cached[0]
+        elif not relevant_chunks:
+            answer = NO_RESULTS_ANSWER
+        else:
+            context_texts = self._traced(trace, build_context, relevant_chunks)
+            with span("llm_queue", trace):
+                await self.llm_slots.acquire()
+            self.inflight_llm += 1
+            try:
+                answer = await loop.run_in_executor(
+                    self.llm_pool,
+                    lambda: self._traced(trace, groq_answer, c["groq_client"], self.groq_model, question,
+                                         context_texts),
+                )
+            finally:
+                self.inflight_llm -= 1
+                self.llm_slots.release()
+            if c.get("answer_cache") is not None and not (filters or collections):
+                # Storing may write the cache file, so keep it off the event loop too
+                with span("answer_cache_store", trace):
+                    await loop.run_in_executor(
+                        self.retrieval_pool, c["answer_cache"].store, question, q_emb, answer, relevant_chunks
+                    )
+
+        return {
+            "answer": answer,
+            "sources": [
+                {"doc_name": ch["doc_name"], "source": ch.get("source", ch["doc_name"]),
+                 "chunk_id": ch["chunk_id"], "text": ch["text"],
+                 **{key: ch[key] for key in ("page", "start", "end", "also_in") if key in ch}}
+                for ch in relevant_chunks
+            ],
+            "cached": cached is not None,
+            "timings": {"retrieval_s": retrieval_s, "total_s": time.perf_counter() - start},
+            "trace_id": trace.trace_id if trace is not None else None,
+        }
+
+    async def route(self, method: str, path: str, body: bytes):
+        """Returns (status, json_payload) for one request."""
+        path = path.split("?", 1)[0]
+        if path == "/healthz":
+            # Liveness: the process is up and the event loop is responsive
+            return 200, {"status": "ok"}
+        if path == "/readyz":
+            ready = self.components is not None
+            payload = {
+                "ready": ready,
+                "loaded_after_s": self.loaded_after_s,
+                "chunks": len(self.components["chunks"]) if ready else None,
+                "index_version": self.components.get("index_version") if ready else None,
+                "index_reloads": self.reloads,
+                "inflight_llm": self.inflight_llm,
+                "max_inflight_llm": self.max_inflight_llm,
+            }
+            if ready and self.components.get("shards"):
+                shards = self.components["shards"]
+                payload["chunks"] = sum(len(s["chunks"]) for s in shards.values())
+                payload["collections"] = {
+                    name: {"chunks": len(s["chunks"]), "index_version": s["index_version"]} for name, s in shards.items()
+                }
+            if self.load_error:
+                payload["error"] = self.load_error
+            return (200 if ready else 503), payload
+        if path == "/stats":
+            if self.components is None:
+                raise HTTPError(503, "Index is still loading")
+            payload = {"inflight_llm": self.inflight_llm, "stages": stage_percentiles(),
+                       "llm_calls": default_policy().stats.snapshot()}
+            for name in ("batcher", "query_cache", "answer_cache"):
+                if self.components.get(name) is not None:
+                    payload[name] = self.components[name].stats()
+            return 200, payload
+        if path == "/query":
+            if method != "POST":
+                raise HTTPError(405, "Use POST")
+            try:
+                request = json.loads(body or b"{}")
+            except json.JSONDecodeError:
+                raise HTTPError(400, "Body must be JSON")
+            question = request.get("question") if isinstance(request, dict) else None
+            if not isinstance(question, str) or not question.strip():
+                raise HTTPError(400, 'Body must look like {"question": "..."}')
+            top_k = request.get("top_k")
+            if top_k is not None and (not isinstance(top_k, int) or not 1 <= top_k <= 50):
+                raise HTTPError(400, "top_k must be an integer between 1 and 50")
+            filters = request.get("filters")
+            if filters is not None and not (
+                isinstance(filters, dict) and all(
+                    isinstance(v, str) or (isinstance(v, list) and all(isinstance(x, str) for x in v))
+                    for v in filters.values()
+                )
+            ):
+                raise HTTPError(400, 'filters must look like {"doc_type": "pdf", "tags": ["fees", ...]}')
+            collections = request.get("collections")
+            if collections is not None and not (
+                isinstance(collections, list) and all(isinstance(name, str) for name in collections)
+            ):
+                raise HTTPError(400, 'collections must look like ["admissions", "library"]')
+            return 200, await self.answer(question, top_k, filters, collections)
+        raise HTTPError(404, f"No route for {path}")
+
+    async def read_request(self, reader: asyncio.StreamReader) -> tuple:
+        """Reads one request and returns (method, path, body). A malformed request raises HTTPError(400)."""
+        try:
+            head = await reader.readuntil(b"\r\n\r\n")
+            lines = head.decode("latin-1").split("\r\n")
+            method, path, _ = lines[0].split(" ", 2)
+            headers = {}
+            for line in lines[1:]:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            length = int(headers.get("content-length", "0"))
+            if length < 0:
+                raise ValueError("negative Content-Length")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ValueError):
+            raise HTTPError(400, "Malformed HTTP request")
+        if length > MAX_BODY_BYTES:
+            raise HTTPError(413, "Request body too large")
+        try:
+            body = await reader.readexactly(length) if length else b""
+        except asyncio.IncompleteReadError:
+            raise HTTPError(400, "Malformed HTTP request")
+        return method.upper(), path, body
+
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Minimal HTTP/1.1: one request per connection, JSON in and out."""
+        try:
+            try:
+                method, path, body = await self.read_request(reader)
+                status, payload = await self.route(method, path, body)
+            except HTTPError as e:
+                status, payload = e.status, {"error": e.message}
+            except Exception as e:
+                print(f"Error handling request: {type(e).__name__}: {e}")
+                status, payload = 500, {"error": "Internal error"}
+
+            data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            writer.write(
+                f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}\r\n"
+                f"Content-Type: application/json; charset=utf-8\r\n"
+                f"Content-Length: {len(data)}\r\n"
+                f"Connection: close\r\n\r\n".encode("latin-1") + data
+            )
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    async def serve(self, host: str, port: int):
+        """Starts listening right away and loads the index in the background."""
+        self.llm_slots = asyncio.Semaphore(self.max_inflight_llm)
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving on http://{host}:{port} (POST /query, GET /healthz, GET /readyz)")
+        loading = asyncio.create_task(self.load())
+        async with server:
+            await server.serve_forever()
+        await loading
@@ -0,0 +1,56 @@
+import os
+from fnmatch import fnmatch
+
+from src.config import FAISS_INDEX_FILE
+from src.index_versions import current_version, is_versioned
+
+COLLECTIONS_DIR = "collections"
+
+def collection_names(collections: dict, default: str) -> list:
+    """Every collection: the default one first, then those configured in COLLECTIONS."""
+    return [default] + [name for name in collections if name != default]
+
+def collection_of(rel_path: str, collections: dict, default: str) -> str:
+    """The collection a file belongs to: the first whose patterns match its path under the data folder."""
+    rel_path = rel_path.replace(os.sep, "/")
+    for name, patterns in collections.items():
+        if any(fnmatch(rel_path, pattern) for pattern in patterns):
+            return name
+    return default
+
+def collection_dir(vector_db_dir: str, name: str, default: str) -> str:
+    """
+    Where a collection is stored, with its own versions/ and CURRENT (see src/index_versions.py).
+    The default collection lives in vector_db_dir itself, so indexes built before collections still load.
+    """
+    return vector_db_dir if name == default else os.path.join(vector_db_dir, COLLECTIONS_DIR, name)
+
+def built_collections(vector_db_dir: str, collections: dict, default: str) -> list:
+    """
+    The collections that have an index on disk: a published version, or the flat layout of older builds
+    (only while no versioned build has been made there).
+    """
+    built = []
+    for name in collection_names(collections, default):
+        path = collection_dir(vector_db_dir, name, default)
+        if current_version(path) is not None or (
+                not is_versioned(path) and os.path.exists(os.path.join(path, FAISS_INDEX_FILE))):
+            built.append(name)
+    return built
+
+def unpublished_collections(vector_db_dir: str, collections: dict, default: str) -> list:
+    """The collections whose versions were all unpublished (their last build found no documents)."""
+    return [
+        name for name in collection_names(collections, default)
+        if current_version(collection_dir(vector_db_dir, name, default)) is None
+        and is_versioned(collection_dir(vector_db_dir, name, default))
+    ]
+
+def select_shards(shards: dict, names: list = None) -> dict:
+    """The shards to search: those named (all of them if names is empty). Unknown names raise ValueError."""
+    if not names:
+        return shards
+    unknown = [name for name in names if name not in shards]
+    if unknown:
+        raise ValueError(f"Unknown collection: {', '.join(unknown)} (available: {', '.join(shards)})")
+    return {name: shards[name] for name in shards if name in names}
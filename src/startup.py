@@ -0,0 +1,273 @@
+import os
+import time
+import weakref
+import importlib
+import threading
+from itertools import chain
+
+from src.config import (
+    VECTOR_DB_DIR, FAISS_INDEX_FILE, CHUNK_STORE_DIR, CHUNKS_FILE, FAISS_MMAP, EMBED_MODEL_NAME, QUERY_CACHE_SIZE,
+    ANSWER_CACHE_ENABLED, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_PATH,
+    ANSWER_CACHE_SAVE_INTERVAL_S,
+    INDEX_RELOAD_INTERVAL_S, INDEX_VERIFY_CHECKSUMS, COLLECTIONS, DEFAULT_COLLECTION
+)
+from src.index_versions import current_version, current_dir, verify_artifacts
+from src.shards import collection_dir, built_collections, unpublished_collections
+
+PROCESS_START = time.perf_counter() # close enough: this module is imported first by the entry points
+
+def _timed(timings: dict, name: str, func):
+    start = time.perf_counter()
+    value = func()
+    timings[name] = time.perf_counter() - start
+    return value
+
+class Components(dict):
+    """
+    What load_components returns: a plain dict of the loaded pieces. Being a class of its own lets
+    reload_index attach a finalizer that reports when an old index version has been released.
+    """
+
+def _shard_dir(name: str) -> str:
+    return collection_dir(VECTOR_DB_DIR, name, DEFAULT_COLLECTION)
+
+def load_shard(name: str, timings: dict = None) -> dict:
+    """
+    Loads the published version (see src/index_versions.py) of one collection:
+    FAISS, BM25, chunks and metadata filters. Its files are first checked against its artifacts.json
+    (sizes, and checksums with INDEX_VERIFY_CHECKSUMS); a damaged version raises ValueError.
+    """
+    timings = {} if timings is None else timings
+    version, build_dir = current_dir(_shard_dir(name))
+    _timed(timings, "verify", lambda: verify_artifacts(build_dir, INDEX_VERIFY_CHECKSUMS))
+
+    from src.vector_store import load_vector_db
+    chunks_path = os.path.join(build_dir, CHUNK_STORE_DIR)
+    if not os.path.isdir(chunks_path):
+        chunks_path = os.path.join(build_dir, CHUNKS_FILE) # built before the chunk store
+    index, bm25, chunks = load_vector_db(os.path.join(build_dir, FAISS_INDEX_FILE), chunks_path,
+                                         mmap=FAISS_MMAP, timings=timings)
+    from src.metadata_filter import MetadataIndex
+    metadata = _timed(timings, "metadata index", lambda: MetadataIndex(chunks))
+    return {"index_version": version, "index": index, "bm25": bm25, "chunks": chunks, "metadata": metadata}
+
+NOTHING_PUBLISHED = "(none published)"
+
+def _index_view(shards: dict) -> dict:
+    """
+    The index part of the components: every collection under "shards", plus the index, bm25, chunks and
+    metadata of the default collection (or the first one) at the top, for code that searches a single index.
+    Without any shard (every version unpublished), an empty index: every question finds nothing.
+    """
+    if not shards:
+        from src.metadata_filter import MetadataIndex
+        return {"index_version": NOTHING_PUBLISHED, "index": None, "bm25": None, "chunks": [],
+                "metadata": MetadataIndex([]), "shards": {}}
+    primary = shards.get(DEFAULT_COLLECTION) or next(iter(shards.values()))
+    if len(shards) == 1:
+        version = primary["index_version"]
+    else:
+        version = ", ".join(f"{name}@{shard['index_version'] or 'unversioned'}" for name, shard in shards.items())
+    return {**primary, "index_version": version, "shards": shards}
+
+def load_index(timings: dict = None) -> dict:
+    """
+    Loads every collection that has been built (see src/shards.py), each as a shard of its own.
+    With several collections, timings get one entry per collection and step.
+    """
+    timings = {} if timings is None else timings
+    names = built_collections(VECTOR_DB_DIR, COLLECTIONS, DEFAULT_COLLECTION)
+    if not names and unpublished_collections(VECTOR_DB_DIR, COLLECTIONS, DEFAULT_COLLECTION):
+        return _index_view({}) # built before, but its documents were all deleted
+    # Without any built collection, loading the default one reports where the index was expected
+    names = names or [DEFAULT_COLLECTION]
+    shards = {}
+    for name in names:
+        if not COLLECTIONS:
+            shards[name] = load_shard(name, timings)
+            continue
+        shard_timings = {}
+        shards[name] = load_shard(name, shard_timings)
+        timings.update({f"{name}: {step}": seconds for step, seconds in shard_timings.items()})
+    return _index_view(shards)
+
+def _chunks_version(shards: dict) -> str:
+    from src.answer_cache import index_version
+    from src.chunk_store import chunk_ids
+    return index_version(chain.from_iterable(chunk_ids(shard["chunks"]) for shard in shards.values()))
+
+def _chunk_resolver(shards: dict):
+    """
+    resolve(ids) -> the chunk dicts with those ids, from any shard. The answer cache saves only the ids
+    of an answer's sources; the id -> position map is built the first time a saved answer is used.
+    """
+    from src.chunk_store import chunk_ids
+    positions = {}
+
+    def resolve(ids: list) -> list:
+        if not positions:
+            for shard in shards.values():
+                positions.update((chunk_id, (shard["chunks"], pos)) for pos, chunk_id in enumerate(chunk_ids(shard["chunks"])))
+        return [chunks[pos] for chunks, pos in (positions[i] for i in ids if i in positions)]
+
+    return resolve
+
+def _answer_cache(shards: dict, timings: dict):
+    from src.answer_cache import AnswerCache
+    if not ANSWER_CACHE_ENABLED:
+        return None
+    version = _chunks_version(shards)
+    return _timed(timings, "answer cache", lambda: AnswerCache(
+        version, ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_SIZE, ANSWER_CACHE_TTL, ANSWER_CACHE_PATH,
+        resolve=_chunk_resolver(shards), save_interval_s=ANSWER_CACHE_SAVE_INTERVAL_S
+    ))
+
+def load_components(timings: dict = None) -> dict:
+    """
+    Loads everything needed to answer questions: index, BM25, chunks, metadata filters, embedder,
+    Groq client and caches.
+    The heavy libraries (sentence-transformers/torch, groq) are only imported here.
+    If a timings dict is given, it gets the seconds spent on each step.
+    """
+    timings = {} if timings is None else timings
+    loaded_index = load_index(timings)
+
+    _timed(timings, "import sentence_transformers", lambda: importlib.import_module("sentence_transformers"))
+    from src.embedder import get_embedder
+    embedder = _timed(timings, "load embedder", lambda: get_embedder(EMBED_MODEL_NAME))
+    # The first encode() call initializes the model lazily, so pay for it now instead of on the first question
+    _timed(timings, "warm up embedder", lambda: embedder.encode(["warm up"], convert_to_numpy=True))
+
+    from src.groq_llm import get_groq_client
+    groq_client = _timed(timings, "groq client", get_groq_client)
+
+    from src.query_cache import get_query_cache
+    return Components(
+        **loaded_index,
+        embedder=embedder,
+        groq_client=groq_client,
+        query_cache=get_query_cache(QUERY_CACHE_SIZE),
+        answer_cache=_answer_cache(loaded_index["shards"], timings),
+    )
+
+def reload_index(components: dict, timings: dict = None):
+    """
+    If a collection has published a newer index version than the one in components (or a new collection
+    has been built, or one unpublished), loads just that collection and returns new components sharing everything else
+    (other collections, embedder, Groq client, query cache, batcher...) with the old ones.
+    The answer cache is kept if the chunks are the same, else it starts over for the new documents.
+    Returns None if there is nothing new.
+
+    The old components are left untouched, so queries still running on them finish normally;
+    they are freed (and their memory-mapped files closed) once the last of those queries lets go of them.
+    """
+    old_version = components.get("index_version")
+    built = built_collections(VECTOR_DB_DIR, COLLECTIONS, DEFAULT_COLLECTION)
+    # A collection whose documents were all deleted is unpublished by the build: stop searching it
+    # (with none left, the components get an empty index, see _index_view)
+    shards = {name: shard for name, shard in components["shards"].items() if name in built}
+    changed = [
+        name for name in built
+        if name not in shards or current_version(_shard_dir(name)) != shards[name]["index_version"]
+    ]
+    timings = {} if timings is None else timings
+    for name in changed:
+        shard = load_shard(name, timings)
+        if name not in shards or shard["index_version"] != shards[name]["index_version"]:
+            shards[name] = shard
+    if len(shards) == len(components["shards"]) and all(
+            shard is components["shards"].get(name) for name, shard in shards.items()):
+        return None
+
+    reloaded = Components(components, **_index_view(shards))
+    answer_cache = components.get("answer_cache")
+    if answer_cache is not None:
+        if answer_cache.index_version != _chunks_version(shards):
+            reloaded["answer_cache"] = _answer_cache(shards, timings)
+        else:
+            answer_cache.resolve = _chunk_resolver(shards) # same chunks, but let the old version's files go
+    if isinstance(components, Components):
+        weakref.finalize(components, print, f"Index version {old_version} released (its last queries are done).")
+    return reloaded
+
+class BackgroundLoader:
+    """
+    Runs load(timings) on a background thread, so the UI or prompt can be shown right away.
+
+    Questions that arrive before loading is done call wait(), which blocks until the components
+    are ready (and re-raises the loading error, if any) instead of failing.
+
+    Afterwards the same thread calls reload(components) every reload_interval_s seconds: when a build
+    publishes a new index version, it is loaded there, off the request path, and swapped in by replacing
+    self.components. Each question takes the components once (wait()) and keeps them until it's done,
+    so questions in flight finish on the old version while new ones use the new one.
+    """
+
+    def __init__(self, load=load_components, reload=reload_index, reload_interval_s: float = INDEX_RELOAD_INTERVAL_S):
+        self.timings = {}
+        self.components = None
+        self.error = None
+        self.reloads = 0
+        self.reload_error = None
+        self.started_after_s = time.perf_counter() - PROCESS_START
+        self.ready_after_s = None
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, args=(load, reload, reload_interval_s),
+                                        name="warm-up", daemon=True)
+        self._thread.start()
+
+    def _run(self, load, reload, reload_interval_s):
+        try:
+            self.components = load(self.timings)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.ready_after_s = time.perf_counter() - PROCESS_START
+            self._done.set()
+        if self.error is None and reload is not None and reload_interval_s:
+            self._watch(reload, reload_interval_s)
+
+    def _watch(self, reload, interval_s: float):
+        while True:
+            time.sleep(interval_s)
+            timings = {}
+            try:
+                components = reload(self.components, timings)
+            except Exception as e:
+                # Keep serving the version already loaded; report each new problem once
+                error = f"{type(e).__name__}: {e}"
+                if error != self.reload_error:
+                    print(f"Could not load the new index version, still using the old one. {error}")
+                self.reload_error = error
+                continue
+            self.reload_error = None
+            if components is not None:
+                self.components = components # the swap: one reference, picked up by the next wait()
+                self.reloads += 1
+                print(f"Switched to index version {components['index_version']} "
+                      f"(loaded in {sum(timings.values()):.1f}s).")
+
+    @property
+    def ready(self) -> bool:
+        return self._done.is_set()
+
+    def wait(self, timeout: float = None) -> dict:
+        """Returns the loaded components, waiting for them if needed."""
+        if not self._done.wait(timeout):
+            raise TimeoutError("Still loading the index and models")
+        if self.error is not None:
+            raise self.error
+        return self.components
+
+    def report(self) -> str:
+        """Where the cold-start time went, one line per step."""
+        lines = [f"  {'imports before warm-up':<30} {self.started_after_s:6.2f}s"]
+        lines += [f"  {name:<30} {seconds:6.2f}s" for name, seconds in self.timings.items()]
+        if self.ready_after_s is not None:
+            lines.append(f"  {'ready after':<30} {self.ready_after_s:6.2f}s (since process start)")
+            if self.components is not None:
+                lines.append(f"  index version {self.components['index_version'] or '(unversioned)'}, "
+                             f"reloaded {self.reloads} time(s)")
+        else:
+            lines.append("  still loading...")
+        return "Startup timings:\n" + "\n".join(lines)
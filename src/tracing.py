@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import uuid
+import queue
+import atexit
+import threading
+import contextvars
+from collections import deque
+import numpy as np
+
+from src.config import TRACING_ENABLED, TRACE_LOG_PATH, TRACE_WINDOW, TRACE_QUEUE_SIZE
+
+# The trace of the request being handled in this thread / task (None = not tracing)
+_current = contextvars.ContextVar("rag_trace", default=None)
+
+_enabled = TRACING_ENABLED
+_log_path = TRACE_LOG_PATH
+_window = TRACE_WINDOW
+_log_queue = queue.Queue(maxsize=TRACE_QUEUE_SIZE) # (log path or None, JSON line) waiting to be written
+_writer = None
+_writer_lock = threading.Lock()
+_dropped = 0
+_durations = {} # stage name -> deque of the last _window durations (ms)
+_durations_lock = threading.Lock()
+
+_UNSET = object()
+
+def configure(enabled: bool = None, log_path=_UNSET, window: int = None):
+    """Changes tracing settings at runtime (log_path=None prints the JSON lines instead of writing a file)."""
+    global _enabled, _log_path, _window
+    if enabled is not None:
+        _enabled = enabled
+    if log_path is not _UNSET:
+        _log_path = log_path
+    if window is not None:
+        _window = window
+        with _durations_lock:
+            _durations.clear()
+
+class Trace:
+    """
+    Timing spans and token counts of one request.
+    spans is a list of {"name", "start_ms", "duration_ms"} (start relative to the request start).
+    """
+
+    def __init__(self, name: str, **attrs):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = attrs
+        self.spans = []
+        self.tokens = {}
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.total_ms = None
+
+    def add_span(self, name: str, start: float, end: float):
+        """Records a span from two time.perf_counter() values."""
+        self.spans.append({
+            "name": name,
+            "start_ms": round((start - self._start) * 1000, 3),
+            "duration_ms": round((end - start) * 1000, 3),
+        })
+
+    def span(self, name: str):
+        return _Span(self, name)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def to_dict(self) -> dict:
+        return {
+            "event": "rag_trace",
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "ts": round(self.started_at, 3),
+            "total_ms": self.total_ms,
+            "spans": self.spans,
+            "tokens": self.tokens,
+            **self.attrs,
+        }
+
+class _Span:
+    __slots__ = ("trace", "name", "start")
+
+    def __init__(self, trace: Trace, name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.add_span(self.name, self.start, time.perf_counter())
+        return False
+
+class _NoSpan:
+    """Returned when nothing is traced, so `with span(...)` costs a function call and nothing more."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NO_SPAN = _NoSpan()
+
+def span(name: str, trace: Trace = None):
+    """
+    Times a block as a stage of the current trace:
+
+        with span("faiss_search"):
+            index.search(...)
+
+    Pass trace explicitly where the current one isn't visible (e.g. inside a generator).
+    """
+    trace = trace or _current.get()
+    if trace is None:
+        return _NO_SPAN
+    return _Span(trace, name)
+
+def usage_counts(usage) -> dict:
+    """The prompt / completion / total token counts of a Groq response's usage object (or dict)."""
+    counts = {}
+    for field in ("prompt_tokens", "completion_tokens", "total_tokens"):
+        value = getattr(usage, field, None)
+        if value is None and isinstance(usage, dict):
+            value = usage.get(field)
+        if value is not None:
+            counts[field] = value
+    return counts
+
+def record_usage(usage, trace: Trace = None):
+    """Stores prompt / completion token counts from a Groq response's usage object."""
+    trace = trace or _current.get()
+    if trace is None or usage is None:
+        return
+    trace.tokens.update(usage_counts(usage))
+
+def current_trace():
+    return _current.get()
+
+def start_trace(name: str, **attrs):
+    """Starts tracing a request. Returns the Trace, or None when tracing is disabled."""
+    if not _enabled:
+        return None
+    return Trace(name, **attrs)
+
+class activate:
+    """Makes trace the current one inside a `with` block (does nothing for None)."""
+
+    def __init__(self, trace: Trace):
+        self.trace = trace
+        self.token = None
+
+    def __enter__(self):
+        if self.trace is not None:
+            self.token = _current.set(self.trace)
+        return self.trace
+
+    def __exit__(self, *exc):
+        if self.token is not None:
+            _current.reset(self.token)
+        return False
+
+def finish_trace(trace: Trace):
+    """Ends a trace: adds its spans to the rolling percentiles and emits it as one JSON log line."""
+    if trace is None or trace.total_ms is not None:
+        return
+    trace.total_ms = round((time.perf_counter() - trace._start) * 1000, 3)
+    with _durations_lock:
+        for name, ms in [("total", trace.total_ms)] + [(s["name"], s["duration_ms"]) for s in trace.spans]:
+            if name not in _durations:
+                _durations[name] = deque(maxlen=_window)
+            _durations[name].append(ms)
+
+    _emit(json.dumps(trace.to_dict(), ensure_ascii=False, default=str))
+
+def _emit(line: str):
+    """
+    Hands a log line to the writer thread, so the request never waits for the disk.
+    If the writer falls TRACE_QUEUE_SIZE lines behind, new lines are dropped (and counted) instead.
+    """
+    global _writer, _dropped
+    with _writer_lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_lines, name="trace-writer", daemon=True)
+            _writer.start()
+    try:
+        _log_queue.put_nowait((_log_path, line))
+    except queue.Full:
+        with _writer_lock:
+            _dropped += 1
+            first_drop = _dropped == 1
+        if first_drop:
+            print("Trace log is falling behind, dropping trace lines.")
+
+def _write_lines():
+    """Writer thread: appends queued lines to their log file, everything waiting at once in one open()."""
+    while True:
+        batch = [_log_queue.get()]
+        while True:
+            try:
+                batch.append(_log_queue.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            by_path = {}
+            for path, line in batch:
+                by_path.setdefault(path, []).append(line)
+            for path, lines in by_path.items():
+                if not path:
+                    print("\n".join(lines))
+                    continue
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write("".join(line + "\n" for line in lines))
+        except Exception as e:
+            print(f"Could not write {len(batch)} trace line(s): {e}")
+        finally:
+            for _ in batch:
+                _log_queue.task_done()
+
+def flush_traces():
+    """Waits until every finished trace has been written (called at exit, so none are lost)."""
+    if _writer is not None:
+        _log_queue.join()
+
+atexit.register(flush_traces)
+
+def stage_percentiles() -> dict:
+    """p50 / p95 / p99 (ms) of every stage over the last TRACE_WINDOW requests."""
+    with _durations_lock:
+        snapshot = {name: np.array(values) for name, values in _durations.items()}
+    return {
+        name: {
+            "count": len(values),
+            "p50_ms": float(np.percentile(values, 50)),
+            "p95_ms": float(np.percentile(values, 95)),
+            "p99_ms": float(np.percentile(values, 99)),
+        }
+        for name, values in snapshot.items()
+    }
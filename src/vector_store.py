@@ -1,73 +1,385 @@
 import os
 import json
+import time
 import pickle
 import numpy as np
 import faiss
-from rank_bm25 import BM25Okapi
+from src.bm25 import SparseBM25, tokenize
+from src.chunk_store import write_chunk_store, open_chunks
+from src.config import FILTER_EXACT_MAX
 
 def ensure_dir(path: str):
     """Creates a directory if it doesn't exist."""
     os.makedirs(path, exist_ok=True)
 
-def build_faiss_index(embeddings: np.ndarray):
+FAISS_INDEX_TYPES = ("flat_ip", "flat_l2", "hnsw", "ivf_flat", "flat_f16", "sq8", "pq")
+
+class RerankIndex:
+    """
+    A compressed FAISS index whose shortlist is re-ranked with the exact float32 vectors.
+
+    search(q, k) takes the best k * rerank_factor candidates from the compressed index, then
+    scores them by exact cosine similarity against `embeddings` (row i = chunk i) and keeps the best k.
+    `embeddings` can be a memory-mapped embeddings.npy: only the shortlisted rows are read,
+    and the OS page cache shares them between all processes on the machine.
+    """
+
+    def __init__(self, index, embeddings: np.ndarray, rerank_factor: int = 4):
+        self.index = index
+        self.embeddings = embeddings
+        self.rerank_factor = rerank_factor
+        self.metric_type = index.metric_type
+        self.ntotal = index.ntotal
+        self.d = index.d
+
+    def search(self, queries: np.ndarray, k: int, subset=None, exact_max: int = FILTER_EXACT_MAX):
+        """
+        Like index.search. With a subset (see src/metadata_filter.py), only its chunks are considered:
+        small subsets are all scored exactly, larger ones are shortlisted by a filtered search.
+        """
+        shortlist = k * max(1, self.rerank_factor)
+        if subset is None:
+            _, candidates = self.index.search(queries, shortlist)
+        elif len(subset) <= max(exact_max, shortlist):
+            candidates = np.broadcast_to(subset.ids, (len(queries), len(subset)))
+        else:
+            _, candidates = search_subset(self.index, queries, shortlist, subset, exact_max)
+
+        distances = np.full((len(queries), k), -np.inf, dtype="float32")
+        labels = np.full((len(queries), k), -1, dtype="int64")
+        for row, (query, ids) in enumerate(zip(queries, candidates)):
+            ids = np.sort(ids[ids >= 0]) # Sorted, so a memory-mapped file is read front to back
+            if len(ids) == 0:
+                continue
+            vectors = np.asarray(self.embeddings[ids], dtype="float32")
+            norms = np.linalg.norm(vectors, axis=1)
+            scores = vectors @ query / np.where(norms > 0, norms, 1)
+            best = np.argsort(-scores, kind="stable")[:k]
+            distances[row, :len(best)] = scores[best]
+            labels[row, :len(best)] = ids[best]
+        return distances, labels
+
+def _search_rows(index, queries: np.ndarray, k: int, ids: np.ndarray, block: int = 65536):
+    """
+    Scores only the given rows of an index, with vectors decoded from the index itself.
+    Returns (distances, labels) like index.search.
+    IVF indexes need their direct map (see add_direct_map), which is built when they are built or loaded:
+    building it here would change an index other threads are searching.
+    """
+    l2 = index.metric_type == faiss.METRIC_L2
+    score_parts = [np.zeros((len(queries), 0), dtype="float32")]
+    label_parts = [np.zeros((len(queries), 0), dtype="int64")]
+    for start in range(0, len(ids), block):
+        rows = ids[start:start + block]
+        vectors = index.reconstruct_batch(rows)
+        scores = queries @ vectors.T
+        if l2:
+            # Negative squared distance, so higher is better for both metrics
+            scores = 2 * scores - (vectors ** 2).sum(axis=1) - (queries ** 2).sum(axis=1, keepdims=True)
+        best = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+        score_parts.append(np.take_along_axis(scores, best, axis=1))
+        label_parts.append(rows[best])
+    scores, labels = np.hstack(score_parts), np.hstack(label_parts)
+    best = np.argsort(-scores, axis=1, kind="stable")[:, :k]
+    scores, labels = np.take_along_axis(scores, best, axis=1), np.take_along_axis(labels, best, axis=1)
+
+    distances = np.full((len(queries), k), np.inf if l2 else -np.inf, dtype="float32")
+    padded = np.full((len(queries), k), -1, dtype="int64")
+    distances[:, :scores.shape[1]] = -scores if l2 else scores
+    padded[:, :labels.shape[1]] = labels
+    return distances, padded
+
+def search_subset(index, queries: np.ndarray, k: int, subset, exact_max: int = FILTER_EXACT_MAX):
+    """
+    index.search limited to the chunks of a ChunkSubset (see src/metadata_filter.py), so the other
+    chunks are never scored:
+    - subsets of at most exact_max chunks, and PQ indexes (which FAISS can't restrict), score
+      just the subset's vectors;
+    - otherwise FAISS skips the other chunks itself through an IDSelectorBitmap. HNSW and IVF then
+      visit more of the index (efSearch / nprobe divided by the fraction of chunks allowed, within limits),
+      since most of what they visit is skipped.
+    """
+    if isinstance(index, RerankIndex):
+        return index.search(queries, k, subset=subset, exact_max=exact_max)
+    if len(subset) <= exact_max or isinstance(index, faiss.IndexPQ):
+        return _search_rows(index, queries, k, subset.ids)
+
+    bitmap = subset.bitmap # FAISS only keeps a pointer, so hold on to the array during the search
+    selector = faiss.IDSelectorBitmap(len(subset.mask), faiss.swig_ptr(bitmap))
+    widen = index.ntotal / len(subset)
+    if isinstance(index, faiss.IndexHNSW):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=int(min(index.hnsw.efSearch * widen, 4096)))
+    elif isinstance(index, faiss.IndexIVF):
+        params = faiss.SearchParametersIVF(sel=selector, nprobe=int(min(index.nprobe * widen, index.nlist)))
+    else:
+        params = faiss.SearchParameters(sel=selector)
+    return index.search(queries, k, params=params)
+
+def _pq_layout(n: int, dim: int, params: dict):
+    """Sub-quantizers (must divide dim) and bits per code, reduced for small corpora so training works."""
+    m = min(params.get("M", 48), dim)
+    while dim % m:
+        m -= 1
+    # Like IVF: ~39 training points per centroid, 2 ** nbits centroids per sub-quantizer
+    nbits = params.get("nbits", 8)
+    while nbits > 1 and 2 ** nbits * 39 > n:
+        nbits -= 1
+    return m, nbits
+
+def build_faiss_index(embeddings: np.ndarray, index_type: str = "flat_l2", params: dict = None,
+                      segment_rows: int = None):
     """
     Creates a FAISS index from embeddings.
+
+    index_type:
+    - "flat_l2":  exact search, L2 distance on raw vectors (the original index)
+    - "flat_ip":  exact search, cosine similarity (inner product on normalized vectors)
+    - "hnsw":     approximate graph search (cosine), params: M, efConstruction, efSearch
+    - "ivf_flat": approximate clustered search (cosine), params: nlist, nprobe
+    - "flat_f16": exhaustive cosine search on float16 vectors (half the memory)
+    - "sq8":      exhaustive cosine search on 8-bit scalar quantized vectors (a quarter of the memory)
+    - "pq":       exhaustive cosine search on product quantized codes, params: M (bytes per vector), nbits
+
+    With params {"rerank": True, "rerank_factor": f} the compressed index is wrapped in a
+    RerankIndex, which re-scores f times more candidates with the exact float32 vectors.
+
+    segment_rows adds the vectors that many at a time (after training on an evenly spaced sample
+    of at most that many), so embeddings can be a memory-mapped embeddings.npy: only one segment
+    is copied into memory at once, next to the index itself.
     """
-    embeddings = embeddings.astype("float32")
-    dim = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dim)
-    index.add(embeddings)
+    params = params or {}
+    n, dim = embeddings.shape
+    segment_rows = max(1, segment_rows or n)
+    cosine = index_type != "flat_l2" # every other type ranks by cosine similarity
+
+    def segment(rows) -> np.ndarray:
+        vectors = np.array(embeddings[rows], dtype="float32") # Copy, normalize_L2 works in place
+        if cosine:
+            faiss.normalize_L2(vectors)
+        return vectors
+
+    sample = segment(np.linspace(0, n - 1, segment_rows).astype("int64") if n > segment_rows else slice(None))
+
+    if index_type == "flat_l2":
+        index = faiss.IndexFlatL2(dim)
+    elif index_type == "flat_ip":
+        index = faiss.IndexFlatIP(dim)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, params.get("M", 32), faiss.METRIC_INNER_PRODUCT)
+        index.hnsw.efConstruction = params.get("efConstruction", 200)
+    elif index_type == "flat_f16":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_fp16, faiss.METRIC_INNER_PRODUCT)
+    elif index_type == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        index.train(sample)
+    elif index_type == "pq":
+        m, nbits = _pq_layout(len(sample), dim, params)
+        index = faiss.IndexPQ(dim, m, nbits, faiss.METRIC_INNER_PRODUCT)
+        index.train(sample)
+    elif index_type == "ivf_flat":
+        # FAISS wants ~39 training points per cluster, so small corpora get fewer clusters
+        nlist = max(1, min(params.get("nlist", 256), len(sample) // 39))
+        quantizer = faiss.IndexFlatIP(dim)
+        index = faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_INNER_PRODUCT)
+        index.train(sample)
+        index.make_direct_map() # kept up to date by add() and saved with the index (see add_direct_map)
+    else:
+        raise ValueError(f"Unknown FAISS index type: {index_type} (expected one of {FAISS_INDEX_TYPES})")
+
+    if n <= segment_rows:
+        index.add(sample)
+    else:
+        del sample
+        for start in range(0, n, segment_rows):
+            index.add(segment(slice(start, start + segment_rows)))
+    if index_type == "flat_l2":
+        return index
+    set_search_params(index, params)
+    if params.get("rerank"):
+        return RerankIndex(index, embeddings, params.get("rerank_factor", 4))
     return index
 
+def set_search_params(index, params: dict):
+    """Applies query-time parameters (efSearch for HNSW, nprobe for IVF, rerank_factor) to an index."""
+    if isinstance(index, RerankIndex):
+        if "rerank_factor" in params:
+            index.rerank_factor = params["rerank_factor"]
+        index = index.index
+    if isinstance(index, faiss.IndexHNSW) and "efSearch" in params:
+        index.hnsw.efSearch = params["efSearch"]
+    if isinstance(index, faiss.IndexIVF) and "nprobe" in params:
+        index.nprobe = min(params["nprobe"], index.nlist)
+
+def describe_faiss_index(index) -> dict:
+    """Returns the type and parameters of a FAISS index, as saved in index_meta.json."""
+    if isinstance(index, RerankIndex):
+        description = describe_faiss_index(index.index)
+        description["params"].update({"rerank": True, "rerank_factor": index.rerank_factor})
+        return description
+    if isinstance(index, faiss.IndexHNSW):
+        return {"type": "hnsw", "params": {
+            "M": index.hnsw.nb_neighbors(1),
+            "efConstruction": index.hnsw.efConstruction,
+            "efSearch": index.hnsw.efSearch,
+        }}
+    if isinstance(index, faiss.IndexIVF):
+        return {"type": "ivf_flat", "params": {"nlist": index.nlist, "nprobe": index.nprobe}}
+    if isinstance(index, faiss.IndexScalarQuantizer):
+        qtype = "flat_f16" if index.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+        return {"type": qtype, "params": {}}
+    if isinstance(index, faiss.IndexPQ):
+        return {"type": "pq", "params": {"M": index.pq.M, "nbits": index.pq.nbits}}
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return {"type": "flat_ip", "params": {}}
+    return {"type": "flat_l2", "params": {}}
+
+def prepare_query(index, q_emb: np.ndarray) -> np.ndarray:
+    """
+    Gets query vectors ready for index.search.
+    Cosine indexes store normalized vectors, so the query is normalized too (on a copy).
+    """
+    q_emb = np.array(q_emb, dtype="float32")
+    if index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        faiss.normalize_L2(q_emb)
+    return q_emb
+
+def similarity_scores(index, distances: np.ndarray) -> np.ndarray:
+    """
+    Turns what index.search returned into similarities (higher = better), so results of several
+    indexes built with the same model can be ranked together: L2 distances are negated.
+    """
+    if isinstance(index, RerankIndex) or index.metric_type == faiss.METRIC_INNER_PRODUCT:
+        return distances # cosine similarities (RerankIndex always scores by cosine)
+    return -distances
+
 def build_bm25_index(chunks: list):
     """
     Creates a BM25 index from text chunks.
     """
-    tokenized_corpus = [chunk["text"].lower().split() for chunk in chunks]
-    bm25 = BM25Okapi(tokenized_corpus)
+    # A generator, so only one chunk's tokens exist at a time (chunks can be a ChunkStore)
+    bm25 = SparseBM25.from_corpus(tokenize(chunk["text"]) for chunk in chunks)
     return bm25
 
-def save_vector_db(index, bm25, chunks, vector_db_dir: str, faiss_path: str, chunks_path: str):
+def save_vector_db(index, bm25, chunks, vector_db_dir: str, faiss_path: str, chunks_path: str, embeddings=None):
     """
     Saves FAISS index, BM25 index, and chunks to disk.
+    chunks_path is a chunk store folder (see src/chunk_store.py), or a .json file for the old format.
+    If embeddings are given they are saved too, so the next build can reuse them.
     """
     ensure_dir(vector_db_dir)
     
-    # Save FAISS
-    faiss.write_index(index, faiss_path)
+    # Save FAISS, plus a small sidecar recording its type and search parameters.
+    # Written to a temp file and renamed, so apps that memory-mapped the old file keep a valid mapping.
+    faiss.write_index(index.index if isinstance(index, RerankIndex) else index, faiss_path + ".tmp")
+    os.replace(faiss_path + ".tmp", faiss_path)
+    with open(os.path.join(vector_db_dir, "index_meta.json"), "w", encoding="utf-8") as f:
+        json.dump(describe_faiss_index(index), f, indent=2)
     
-    # Save BM25
-    bm25_path = os.path.join(vector_db_dir, "bm25.pkl")
-    with open(bm25_path, "wb") as f:
-        pickle.dump(bm25, f)
+    # Save BM25 as plain arrays, and remove the old pickled format so it can't go stale
+    bm25.save(os.path.join(vector_db_dir, "bm25.npz"))
+    legacy_bm25_path = os.path.join(vector_db_dir, "bm25.pkl")
+    if os.path.exists(legacy_bm25_path):
+        os.remove(legacy_bm25_path)
 
     # Save Chunks
-    with open(chunks_path, "w", encoding="utf-8") as f:
-        json.dump(chunks, f, ensure_ascii=False, indent=2)
+    if chunks_path.endswith(".json"):
+        with open(chunks_path, "w", encoding="utf-8") as f:
+            json.dump(chunks, f, ensure_ascii=False, indent=2)
+    else:
+        write_chunk_store(chunks, chunks_path)
+
+    # Save raw embeddings (row i belongs to chunks[i])
+    if embeddings is not None:
+        tmp_path = os.path.join(vector_db_dir, "embeddings.tmp.npy")
+        np.save(tmp_path, embeddings.astype("float32"))
+        os.replace(tmp_path, os.path.join(vector_db_dir, "embeddings.npy"))
+
+def load_embeddings(vector_db_dir: str, mmap: bool = False):
+    """
+    Loads the raw chunk embeddings saved by the last build.
+    Returns None if the index was built before embeddings were stored.
+    mmap=True maps the file instead of reading it, so rows are only loaded when used.
+    """
+    path = os.path.join(vector_db_dir, "embeddings.npy")
+    if not os.path.exists(path):
+        return None
+    return np.load(path, mmap_mode="r" if mmap else None)
+
+def add_direct_map(index):
+    """
+    Gives an IVF index its id -> vector map, so filtered searches can look up the vectors of given rows
+    (see _search_rows). Other index types can do that already. Call it before the index is shared between threads.
+    """
+    if isinstance(index, faiss.IndexIVF) and index.direct_map.type == faiss.DirectMap.NoMap:
+        index.make_direct_map()
+    return index
+
+def read_faiss_index(faiss_path: str, mmap: bool = False):
+    """
+    Reads a FAISS index. mmap=True maps the vectors from the file instead of copying them into memory,
+    so opening is instant and processes on the same machine share the pages.
+    Falls back to a normal read if this FAISS build or index type can't be memory-mapped.
+    IVF indexes saved without their direct map get it now (see add_direct_map).
+    """
+    if mmap:
+        flags = faiss.IO_FLAG_MMAP | getattr(faiss, "IO_FLAG_MMAP_IFC", 0) # IFC = flat vector storage
+        try:
+            return add_direct_map(faiss.read_index(faiss_path, flags))
+        except RuntimeError as e:
+            print(f"Could not memory-map {faiss_path} ({e}), reading it instead.")
+    return add_direct_map(faiss.read_index(faiss_path))
 
-def load_vector_db(faiss_path: str, chunks_path: str):
+def load_vector_db(faiss_path: str, chunks_path: str, mmap: bool = False, timings: dict = None):
     """
     Loads FAISS index, BM25 index, and chunks from disk.
+    mmap=True memory-maps the FAISS index (see read_faiss_index).
+    Chunks come from a chunk store folder (a memory-mapped ChunkStore, see src/chunk_store.py) or a chunks.json file.
+    If a timings dict is given, it gets the seconds spent loading "faiss", "bm25" and "chunks".
     """
+    timings = {} if timings is None else timings
     vector_db_dir = os.path.dirname(faiss_path)
-    bm25_path = os.path.join(vector_db_dir, "bm25.pkl")
+    bm25_path = os.path.join(vector_db_dir, "bm25.npz")
+    legacy_bm25_path = os.path.join(vector_db_dir, "bm25.pkl")
 
     if not os.path.exists(faiss_path):
         raise FileNotFoundError(f"FAISS index not found at: {faiss_path}")
     if not os.path.exists(chunks_path):
-        raise FileNotFoundError(f"Chunks file not found at: {chunks_path}")
+        raise FileNotFoundError(f"Chunks not found at: {chunks_path}")
     
-    # Load FAISS
-    index = faiss.read_index(faiss_path)
+    # Load FAISS (the file itself knows its type; index_meta.json restores the search parameters)
+    start = time.perf_counter()
+    index = read_faiss_index(faiss_path, mmap)
+    meta_path = os.path.join(vector_db_dir, "index_meta.json")
+    if os.path.exists(meta_path):
+        with open(meta_path, "r", encoding="utf-8") as f:
+            params = json.load(f).get("params", {})
+        set_search_params(index, params)
+        if params.get("rerank"):
+            # Exact re-ranking reads the float32 vectors from the memory-mapped embeddings.npy
+            embeddings = load_embeddings(vector_db_dir, mmap=True)
+            if embeddings is not None and len(embeddings) == index.ntotal:
+                index = RerankIndex(index, embeddings, params.get("rerank_factor", 4))
+            else:
+                print("embeddings.npy is missing or out of date, searching without re-ranking.")
+    timings["faiss"] = time.perf_counter() - start
     
     # Load BM25 (optional, for backward compatibility)
+    start = time.perf_counter()
     bm25 = None
     if os.path.exists(bm25_path):
-        with open(bm25_path, "rb") as f:
-            bm25 = pickle.load(f)
+        bm25 = SparseBM25.load(bm25_path)
+    elif os.path.exists(legacy_bm25_path):
+        # Indexes built before bm25.npz pickled a rank_bm25 object
+        try:
+            with open(legacy_bm25_path, "rb") as f:
+                bm25 = pickle.load(f)
+        except ModuleNotFoundError:
+            print("Old bm25.pkl needs rank_bm25, using FAISS only. Run build_index.py --full to upgrade.")
+    timings["bm25"] = time.perf_counter() - start
     
     # Load Chunks
-    with open(chunks_path, "r", encoding="utf-8") as f:
-        chunks = json.load(f)
+    start = time.perf_counter()
+    chunks = open_chunks(chunks_path)
+    timings["chunks"] = time.perf_counter() - start
 
     return index, bm25, chunks